@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+
+import aiohttp
+
+__author__ = "Ivan de Paz Centeno"
+
+
+DEFAULT_MAX_IN_FLIGHT = 64
+
+
+class AsyncBackendClient(object):
+    """
+    Asynchronous HTTP client for the CVMLModulerized backends.
+    It limits the number of requests in flight for each service URL, so a single process can keep lots of requests
+    open without flooding any of the services.
+    """
+
+    def __init__(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT, max_in_flight_by_url=None):
+        """
+        Initializes the client.
+        :param max_in_flight: default maximum number of concurrent requests for each service URL.
+        :param max_in_flight_by_url: dictionary with {api_url: max_in_flight} format to override the default limit for
+            specific service URLs.
+        """
+        if max_in_flight_by_url is None:
+            max_in_flight_by_url = {}
+
+        self.max_in_flight = max_in_flight
+        self.max_in_flight_by_url = dict(max_in_flight_by_url)
+        self.semaphores = {}
+        self.session = None
+        self.session_loop = None
+
+    def set_max_in_flight(self, api_url, max_in_flight):
+        """
+        Sets the maximum number of concurrent requests for the specified service URL.
+        :param api_url: service URL, as built by build_api_url().
+        :param max_in_flight: maximum number of concurrent requests.
+        """
+        self.max_in_flight_by_url[api_url] = max_in_flight
+        self.semaphores.pop(api_url, None)
+
+    def get_max_in_flight(self, api_url):
+        """
+        Getter for the maximum number of concurrent requests for the specified service URL.
+        :param api_url: service URL.
+        :return:
+        """
+        return self.max_in_flight_by_url.get(api_url, self.max_in_flight)
+
+    def _get_semaphore(self, api_url):
+        """
+        Retrieves the semaphore that limits the requests in flight for the specified service URL.
+        :param api_url: service URL.
+        :return: semaphore for the URL.
+        """
+        if api_url not in self.semaphores:
+            self.semaphores[api_url] = asyncio.Semaphore(self.get_max_in_flight(api_url))
+
+        return self.semaphores[api_url]
+
+    def _get_session(self):
+        """
+        Retrieves the HTTP session for the running event loop. A session can't be shared between loops, so a new one
+        is created when the loop changes.
+        :return: aiohttp session.
+        """
+        loop = asyncio.get_running_loop()
+
+        if self.session is None or self.session.closed or self.session_loop is not loop:
+            # Concurrency is limited by the semaphores of each URL, not by the connector.
+            self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+            self.session_loop = loop
+            self.semaphores = {}
+
+        return self.session
+
+    async def put(self, api_url, data):
+        """
+        Sends the data to the specified service URL with a PUT request.
+        :param api_url: service URL.
+        :param data: binary content of the request.
+        :return: tuple (status_code, text) of the response.
+        """
+        session = self._get_session()
+
+        async with self._get_semaphore(api_url):
+            async with session.put(api_url, data=data) as response:
+                text = await response.text()
+                return response.status, text
+
+    async def close(self):
+        """
+        Closes the HTTP session of the client.
+        """
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+        self.session = None
+        self.session_loop = None
+
+
+_default_client = AsyncBackendClient()
+
+
+def get_default_client():
+    """
+    Retrieves the client used by the filters when no client is specified.
+    :return:
+    """
+    return _default_client
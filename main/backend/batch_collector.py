@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class _Batch(object):
+    """
+    Set of items collected to be processed together.
+    """
+
+    def __init__(self):
+        self.items = []
+        self.results = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatchCollector(object):
+    """
+    Groups the items submitted concurrently by several threads into batches, and processes each batch with a single
+    call. A batch is processed when it reaches the maximum size or when its first item has waited the maximum time.
+    """
+
+    def __init__(self, function, max_batch_size, max_wait):
+        """
+        Initializes the collector.
+        :param function: function that receives a list of items and returns the list of their results, in order.
+        :param max_batch_size: maximum number of items of a batch.
+        :param max_wait: maximum seconds the first item of a batch waits for more items to come.
+        """
+        self.function = function
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.condition = threading.Condition()
+        self.pending_batch = None
+
+    def submit(self, item):
+        """
+        Adds the item to the current batch and waits until the batch is processed.
+        The thread that opens a batch is the one that processes it.
+        :param item: item to process.
+        :return: the result for the item.
+        """
+        with self.condition:
+            batch = self.pending_batch
+            is_leader = batch is None
+
+            if is_leader:
+                batch = _Batch()
+                self.pending_batch = batch
+
+            index = len(batch.items)
+            batch.items.append(item)
+
+            if len(batch.items) >= self.max_batch_size:
+                self.pending_batch = None
+                self.condition.notify_all()
+
+        if is_leader:
+            self._wait_and_process(batch)
+
+        else:
+            batch.done.wait()
+
+        if batch.error is not None:
+            raise batch.error
+
+        return batch.results[index]
+
+    def _wait_and_process(self, batch):
+        """
+        Waits until the batch is full or the maximum wait time is over, and then processes it.
+        :param batch: batch to process.
+        """
+        deadline = time.monotonic() + self.max_wait
+
+        with self.condition:
+            remaining_time = deadline - time.monotonic()
+
+            while self.pending_batch is batch and remaining_time > 0:
+                self.condition.wait(remaining_time)
+                remaining_time = deadline - time.monotonic()
+
+            if self.pending_batch is batch:
+                self.pending_batch = None
+
+        try:
+            batch.results = self.function(batch.items)
+
+            if len(batch.results) != len(batch.items):
+                raise Exception("Batch function returned {} results for {} items.".format(len(batch.results),
+                                                                                          len(batch.items)))
+        except Exception as ex:
+            batch.error = ex
+
+        batch.done.set()
+
+
+_collectors = {}
+_collectors_lock = threading.Lock()
+
+
+def get_batch_collector(key, function, max_batch_size, max_wait):
+    """
+    Retrieves the process-local collector for the specified key, creating it if needed.
+    :param key: key that identifies the collector, for example the batch URL of a service.
+    :param function: function to process the batches with, used when the collector is created.
+    :param max_batch_size: maximum number of items of a batch.
+    :param max_wait: maximum seconds the first item of a batch waits for more items to come.
+    :return: the batch collector.
+    """
+    global _collectors_lock
+
+    key = (key, max_batch_size, max_wait)
+
+    with _collectors_lock:
+        if key not in _collectors:
+            _collectors[key] = BatchCollector(function, max_batch_size, max_wait)
+
+        return _collectors[key]
+
+
+def _reset_after_fork():
+    """
+    Forgets the collectors inherited from the parent process.
+    """
+    global _collectors_lock
+
+    _collectors.clear()
+    _collectors_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+
+__author__ = "Ivan de Paz Centeno"
+
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half-open"
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of sending a request to a service whose circuit is open.
+    """
+    pass
+
+
+class CircuitBreaker(object):
+    """
+    Stops sending requests to a service that keeps failing, so they fail fast instead of waiting for a backend that is
+    down. After a number of consecutive failures the circuit opens and every request is rejected. Once the reset
+    timeout is over, a single probe request is let through (half-open): if it succeeds the circuit closes again,
+    otherwise it stays open for another reset timeout.
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        """
+        Initializes the circuit breaker, closed.
+        :param failure_threshold: consecutive failures that open the circuit.
+        :param reset_timeout: seconds the circuit stays open before letting a probe request through.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CIRCUIT_CLOSED
+        self.failures_count = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        """
+        Checks if a request can be sent to the service. When the reset timeout of an open circuit is over, the caller
+        becomes the probe of the half-open circuit.
+        :return: True if the request can be sent, False if it must be rejected.
+        """
+        with self.lock:
+            if self.state == CIRCUIT_CLOSED:
+                return True
+
+            if self.state == CIRCUIT_OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = CIRCUIT_HALF_OPEN
+                return True
+
+            return False
+
+    def record_success(self):
+        """
+        Records a request answered by the service. Closes the circuit.
+        """
+        with self.lock:
+            self.state = CIRCUIT_CLOSED
+            self.failures_count = 0
+
+    def record_failure(self):
+        """
+        Records a request that failed because of the service. Opens the circuit if the probe failed or there are too
+        many consecutive failures.
+        """
+        with self.lock:
+            self.failures_count += 1
+
+            if self.state == CIRCUIT_HALF_OPEN or self.failures_count >= self.failure_threshold:
+                self.state = CIRCUIT_OPEN
+                self.opened_at = time.monotonic()
+
+    def cancel_probe(self):
+        """
+        Records that the probe of the half-open circuit was never sent to the service, for example because it could not
+        get a concurrency slot or it was cancelled. The circuit opens again with its reset timeout already over, so the
+        next request becomes the probe.
+        """
+        with self.lock:
+            if self.state == CIRCUIT_HALF_OPEN:
+                self.state = CIRCUIT_OPEN
+
+    def get_state(self):
+        """
+        :return: CIRCUIT_CLOSED, CIRCUIT_OPEN or CIRCUIT_HALF_OPEN.
+        """
+        return self.state
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(key, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+    """
+    Retrieves the process-local circuit breaker for the specified key, creating it if needed.
+    :param key: key that identifies the breaker, for example the URL of a service.
+    :param failure_threshold: consecutive failures that open the circuit, if the breaker is created.
+    :param reset_timeout: seconds the circuit stays open, if the breaker is created.
+    :return: the circuit breaker.
+    """
+    with _circuit_breakers_lock:
+        if key not in _circuit_breakers:
+            _circuit_breakers[key] = CircuitBreaker(failure_threshold, reset_timeout)
+
+        return _circuit_breakers[key]
+
+
+def _reset_after_fork():
+    """
+    Forgets the breakers inherited from the parent process.
+    """
+    global _circuit_breakers_lock
+
+    _circuit_breakers.clear()
+    _circuit_breakers_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
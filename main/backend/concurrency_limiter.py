@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import contextlib
+import os
+import threading
+import time
+
+from main.metrics.metrics_registry import get_metrics_registry
+
+__author__ = "Ivan de Paz Centeno"
+
+
+DEFAULT_INITIAL_LIMIT = 4
+DEFAULT_MIN_LIMIT = 1
+DEFAULT_MAX_LIMIT = 64
+
+# The limit is cut by this factor when the service shows overload.
+DECREASE_FACTOR = 0.7
+
+# A recent latency this many times the baseline latency of the service is a sign of queueing.
+LATENCY_TOLERANCE = 2.0
+
+# Number of latest latencies the baseline (their median) is computed from.
+BASELINE_WINDOW_SIZE = 200
+
+# Weight of the latest latency in the moving average of the recent latency.
+RECENT_LATENCY_SMOOTHING = 0.2
+
+GAUGE_PREFIX = "concurrency_limit"
+
+
+class ConcurrencyLimitTimeout(TimeoutError):
+    """
+    Raised when a request waits too long for room under the limit. The request was never sent, so it says nothing about
+    the state of the service.
+    """
+    pass
+
+
+class ConcurrencyLimiter(object):
+    """
+    Limits the requests in flight to a service, adapting the limit to what the service can take (AIMD).
+
+    While the recent latency (a moving average) stays close to the baseline (the median latency of the latest requests)
+    and the limit is being used, the limit grows by one each time a whole limit of requests succeed. When a request
+    fails or the recent latency is much higher than the baseline, the service is queueing the requests: the limit is
+    cut by DECREASE_FACTOR. It is cut at most once per round of requests, since the ones sent before the cut were sent
+    under the old limit.
+
+    The current limit is published as a gauge in the metrics registry.
+    """
+
+    def __init__(self, name, initial_limit=DEFAULT_INITIAL_LIMIT, min_limit=DEFAULT_MIN_LIMIT,
+                 max_limit=DEFAULT_MAX_LIMIT, is_failure=None):
+        """
+        Initializes the limiter.
+        :param name: name of the limiter, for the gauge of its limit.
+        :param initial_limit: requests in flight allowed at the beginning.
+        :param min_limit: minimum limit.
+        :param max_limit: maximum limit.
+        :param is_failure: function that receives the exception raised by a request and returns True if it is a sign
+            of overload. By default, every exception is.
+        """
+        self.name = name
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.is_failure = is_failure
+        self.in_flight = 0
+        self.latencies = collections.deque(maxlen=BASELINE_WINDOW_SIZE)
+        self.recent_latency = None
+        self.last_decrease_time = 0
+        self.condition = threading.Condition()
+
+        self._publish_limit()
+
+    def acquire(self, timeout=None):
+        """
+        Waits until there is room for a request under the current limit. Must be paired with a release() call when the
+        request is done.
+        :param timeout: maximum seconds to wait. If not specified, waits indefinitely. When it is exceeded,
+            ConcurrencyLimitTimeout is raised.
+        :return: start time of the request, to be given to release().
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                raise ConcurrencyLimitTimeout("No room for a request to {} within {} seconds.".format(self.name, timeout))
+
+            self.in_flight += 1
+
+        return time.monotonic()
+
+    def release(self, start_time, failed=False):
+        """
+        Records the outcome of a request and adapts the limit.
+        :param start_time: value returned by acquire().
+        :param failed: True if the request failed because of the service.
+        """
+        now = time.monotonic()
+        latency = now - start_time
+
+        with self.condition:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+
+            if not failed:
+                self.latencies.append(latency)
+                self.recent_latency = latency if self.recent_latency is None else \
+                    RECENT_LATENCY_SMOOTHING * latency + (1 - RECENT_LATENCY_SMOOTHING) * self.recent_latency
+
+            overloaded = failed or self.recent_latency > LATENCY_TOLERANCE * self._get_baseline_latency()
+
+            if overloaded and start_time >= self.last_decrease_time:
+                self.limit = max(self.min_limit, self.limit * DECREASE_FACTOR)
+                self.last_decrease_time = now
+
+            elif not overloaded and saturated:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            self.condition.notify_all()
+
+        self._publish_limit()
+
+    @contextlib.contextmanager
+    def limit_request(self, timeout=None):
+        """
+        Context manager that holds a request slot for the duration of the block, and records the outcome of the
+        request when the block ends.
+        :param timeout: maximum seconds to wait for a slot.
+        """
+        start_time = self.acquire(timeout)
+
+        try:
+            yield
+
+        except Exception as ex:
+            self.release(start_time, failed=self.is_failure is None or self.is_failure(ex))
+            raise
+
+        self.release(start_time)
+
+    def _get_baseline_latency(self):
+        """
+        :return: median of the latest latencies.
+        """
+        latencies = sorted(self.latencies)
+
+        return latencies[len(latencies) // 2]
+
+    def get_limit(self):
+        """
+        :return: current maximum number of requests in flight.
+        """
+        return int(self.limit)
+
+    def _publish_limit(self):
+        get_metrics_registry().set_gauge("{}[{}]".format(GAUGE_PREFIX, self.name), self.get_limit())
+
+
+_concurrency_limiters = {}
+_concurrency_limiters_lock = threading.Lock()
+
+
+def get_concurrency_limiter(key, **kwargs):
+    """
+    Retrieves the process-local concurrency limiter for the specified key, creating it if needed.
+    :param key: key that identifies the limiter, for example the URL of a service. It names its gauge.
+    :param kwargs: rest of the arguments of ConcurrencyLimiter, if the limiter is created.
+    :return: the concurrency limiter.
+    """
+    with _concurrency_limiters_lock:
+        if key not in _concurrency_limiters:
+            _concurrency_limiters[key] = ConcurrencyLimiter(key, **kwargs)
+
+        return _concurrency_limiters[key]
+
+
+def _reset_after_fork():
+    """
+    Forgets the limiters inherited from the parent process.
+    """
+    global _concurrency_limiters_lock
+
+    _concurrency_limiters.clear()
+    _concurrency_limiters_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
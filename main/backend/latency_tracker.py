@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import collections
+import os
+import threading
+
+__author__ = "Ivan de Paz Centeno"
+
+
+DEFAULT_WINDOW_SIZE = 1000
+
+
+class LatencyTracker(object):
+    """
+    Keeps the latencies of the latest requests to a service, to estimate its percentiles.
+    """
+
+    def __init__(self, window_size=DEFAULT_WINDOW_SIZE):
+        """
+        Initializes the tracker.
+        :param window_size: number of latest latencies kept.
+        """
+        self.latencies = collections.deque(maxlen=window_size)
+        self.lock = threading.Lock()
+
+    def observe(self, latency):
+        """
+        Adds the latency of a request.
+        :param latency: seconds the request took.
+        """
+        with self.lock:
+            self.latencies.append(latency)
+
+    def get_percentile(self, percentile):
+        """
+        Computes a percentile of the latencies kept.
+        :param percentile: percentile to compute, between 0 and 100.
+        :return: latency in seconds, None if no latency was observed yet.
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+
+        if not latencies:
+            return None
+
+        index = min(int(len(latencies) * percentile / 100), len(latencies) - 1)
+
+        return latencies[index]
+
+    def __len__(self):
+        return len(self.latencies)
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def get_latency_tracker(key):
+    """
+    Retrieves the process-local latency tracker for the specified key, creating it if needed.
+    :param key: key that identifies the tracker, for example the URL of a service.
+    :return: the latency tracker.
+    """
+    with _trackers_lock:
+        if key not in _trackers:
+            _trackers[key] = LatencyTracker()
+
+        return _trackers[key]
+
+
+def _reset_after_fork():
+    """
+    Forgets the trackers inherited from the parent process.
+    """
+    global _trackers_lock
+
+    _trackers.clear()
+    _trackers_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
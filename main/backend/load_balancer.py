@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+
+__author__ = "Ivan de Paz Centeno"
+
+
+POLICY_LEAST_OUTSTANDING = "least-outstanding"
+POLICY_LATENCY_WEIGHTED = "latency-weighted"
+
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_EJECTION_TIME = 30
+HEALTH_CHECK_TIMEOUT = 2
+
+# Weight of the latest latency in the moving average of each replica.
+LATENCY_SMOOTHING = 0.3
+
+
+def replace_host(url, host):
+    """
+    Points a URL to another host, keeping its path and query.
+    :param url: URL to rewrite.
+    :param host: host in "scheme://hostname:port" format.
+    :return: rewritten URL.
+    """
+    split_host = urlsplit(host)
+
+    return urlunsplit(urlsplit(url)._replace(scheme=split_host.scheme, netloc=split_host.netloc))
+
+
+def check_replica_health(host):
+    """
+    Default health check of a replica: the host is alive if it answers HTTP requests and is not reporting itself as
+    unavailable.
+    :param host: host in "scheme://hostname:port" format.
+    :return: True if the replica can take requests.
+    """
+    try:
+        response = requests.get(host, timeout=HEALTH_CHECK_TIMEOUT)
+
+    except requests.exceptions.RequestException:
+        return False
+
+    return response.status_code not in (502, 503, 504)
+
+
+class Replica(object):
+    """
+    State of a replica of a service, as seen by the load balancer.
+    """
+
+    def __init__(self, host):
+        self.host = host
+        self.outstanding = 0
+        self.mean_latency = None
+        self.failures_count = 0
+        self.ejected_until = None
+
+    def is_ejected(self, now):
+        """
+        :param now: current monotonic time.
+        :return: True if the replica must not receive requests.
+        """
+        return self.ejected_until is not None and now < self.ejected_until
+
+
+class LoadBalancer(object):
+    """
+    Spreads the requests of a service across its replicas, from the client side.
+
+    With the least-outstanding policy, each request goes to the replica with less requests in flight. With the
+    latency-weighted one, it goes to the replica with the lowest expected wait: its moving average latency times its
+    requests in flight plus one. Replicas not measured yet are tried first.
+
+    A replica that fails several requests in a row is ejected for a while. Once the ejection time is over it receives
+    requests again, and a single failure ejects it anew until a request succeeds. If health checks are enabled, a
+    background thread re-admits ejected replicas as soon as they pass the check.
+    """
+
+    def __init__(self, hosts, policy=POLICY_LEAST_OUTSTANDING, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 ejection_time=DEFAULT_EJECTION_TIME, is_failure=None, health_check_interval=None,
+                 health_check=check_replica_health):
+        """
+        Initializes the load balancer.
+        :param hosts: list of hosts of the replicas, in "scheme://hostname:port" format.
+        :param policy: POLICY_LEAST_OUTSTANDING or POLICY_LATENCY_WEIGHTED.
+        :param failure_threshold: consecutive failures that eject a replica.
+        :param ejection_time: seconds an ejected replica does not receive requests.
+        :param is_failure: function that receives the exception raised by a request and returns True if it counts as a
+            failure of the replica. By default, every exception does.
+        :param health_check_interval: if specified, seconds between health checks of the ejected replicas.
+        :param health_check: function that receives a host and returns True if the replica is healthy.
+        """
+        if not hosts:
+            raise Exception("A load balancer requires at least one replica.")
+
+        if policy not in [POLICY_LEAST_OUTSTANDING, POLICY_LATENCY_WEIGHTED]:
+            raise Exception("Unknown load balancing policy {}.".format(policy))
+
+        self.replicas = {host: Replica(host) for host in hosts}
+        self.policy = policy
+        self.failure_threshold = failure_threshold
+        self.ejection_time = ejection_time
+        self.is_failure = is_failure
+        self.health_check = health_check
+        self.lock = threading.Lock()
+        self.random_generator = random.Random()
+        self.stop_event = threading.Event()
+        self.health_check_thread = None
+
+        if health_check_interval is not None:
+            self.health_check_thread = threading.Thread(target=self._check_health_forever,
+                                                        args=(health_check_interval,),
+                                                        name="load-balancer-health-check", daemon=True)
+            self.health_check_thread.start()
+
+    def acquire(self):
+        """
+        Picks the replica for a request. Must be paired with a release() call when the request is done.
+        If every replica is ejected, the one whose ejection ends first is picked.
+        :return: host of the replica.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            replicas = [replica for replica in self.replicas.values() if not replica.is_ejected(now)]
+
+            if not replicas:
+                replicas = [min(self.replicas.values(), key=lambda replica: replica.ejected_until)]
+
+            # Shuffled, so ties are broken at random.
+            self.random_generator.shuffle(replicas)
+            replica = min(replicas, key=self._get_cost)
+            replica.outstanding += 1
+
+            return replica.host
+
+    def release(self, host, latency=None, failed=False):
+        """
+        Records the outcome of a request sent to a replica.
+        :param host: host returned by acquire().
+        :param latency: seconds the request took, if it succeeded.
+        :param failed: True if the request failed because of the replica.
+        """
+        with self.lock:
+            replica = self.replicas[host]
+            replica.outstanding -= 1
+
+            if failed:
+                replica.failures_count += 1
+
+                if replica.failures_count >= self.failure_threshold:
+                    replica.ejected_until = time.monotonic() + self.ejection_time
+
+                return
+
+            replica.failures_count = 0
+            replica.ejected_until = None
+
+            if latency is not None:
+                replica.mean_latency = latency if replica.mean_latency is None else \
+                    LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * replica.mean_latency
+
+    def cancel(self, host):
+        """
+        Releases a replica picked for a request that was never sent to it. Nothing is recorded about the replica.
+        :param host: host returned by acquire().
+        """
+        with self.lock:
+            self.replicas[host].outstanding -= 1
+
+    @contextlib.contextmanager
+    def route(self, url):
+        """
+        Context manager that points the URL to the replica picked for the request, and releases the replica when the
+        block ends, recording its latency or its failure.
+        :param url: URL of the service in any of its replicas.
+        :return: URL of the service in the picked replica.
+        """
+        host = self.acquire()
+        start_time = time.perf_counter()
+
+        try:
+            yield replace_host(url, host)
+
+        except Exception as ex:
+            self.release(host, failed=self.is_failure is None or self.is_failure(ex))
+            raise
+
+        self.release(host, time.perf_counter() - start_time)
+
+    def get_ejected_hosts(self):
+        """
+        :return: list of hosts of the replicas currently ejected.
+        """
+        now = time.monotonic()
+
+        with self.lock:
+            return [replica.host for replica in self.replicas.values() if replica.is_ejected(now)]
+
+    def check_health(self):
+        """
+        Checks the ejected replicas, and re-admits the healthy ones.
+        """
+        for host in self.get_ejected_hosts():
+            if not self.health_check(host):
+                continue
+
+            with self.lock:
+                self.replicas[host].ejected_until = None
+
+    def _check_health_forever(self, interval):
+        """
+        Loop of the health check thread, until the balancer is closed.
+        :param interval: seconds between checks.
+        """
+        while not self.stop_event.wait(interval):
+            self.check_health()
+
+    def close(self):
+        """
+        Stops the health check thread, if any, and waits for it. The balancer keeps routing requests.
+        """
+        self.stop_event.set()
+
+        if self.health_check_thread is not None and self.health_check_thread is not threading.current_thread():
+            self.health_check_thread.join()
+
+    def _get_cost(self, replica):
+        """
+        :return: cost of sending a request to the replica, by the policy of the balancer.
+        """
+        if self.policy == POLICY_LEAST_OUTSTANDING:
+            return replica.outstanding
+
+        if replica.mean_latency is None:
+            return -1
+
+        return replica.mean_latency * (replica.outstanding + 1)
+
+
+_load_balancers = {}
+_load_balancers_lock = threading.Lock()
+
+
+def get_load_balancer(key, hosts, **kwargs):
+    """
+    Retrieves the process-local load balancer for the specified key, creating it if needed.
+    :param key: key that identifies the balancer, for example the URL of a service.
+    :param hosts: list of hosts of the replicas, if the balancer is created.
+    :param kwargs: rest of the arguments of LoadBalancer, if the balancer is created.
+    :return: the load balancer.
+    """
+    with _load_balancers_lock:
+        if key not in _load_balancers:
+            _load_balancers[key] = LoadBalancer(hosts, **kwargs)
+
+        return _load_balancers[key]
+
+
+def close_load_balancers():
+    """
+    Closes the load balancers of this process. They are created again if a filter needs them later.
+    """
+    with _load_balancers_lock:
+        load_balancers = list(_load_balancers.values())
+        _load_balancers.clear()
+
+    for load_balancer in load_balancers:
+        load_balancer.close()
+
+
+def _reset_after_fork():
+    """
+    Forgets the balancers inherited from the parent process; their health check threads do not exist in the child.
+    """
+    global _load_balancers_lock
+
+    _load_balancers.clear()
+    _load_balancers_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
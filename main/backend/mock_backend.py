@@ -0,0 +1,368 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import email
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse
+
+import cv2
+import numpy
+
+__author__ = "Ivan de Paz Centeno"
+
+
+FACE_DETECTION_PATH = "/detection-requests/faces"
+AGE_ESTIMATION_PATH = "/estimation-requests/age/face"
+
+DEFAULT_MAX_FACES = 3
+
+
+class LatencyDistribution(object):
+    """
+    Distribution of the time a mock service takes to answer a request.
+    Supported kinds are "constant", "uniform" (mean +/- deviation), "normal" and "lognormal" (with the specified mean
+    and deviation of the resulting times). Negative samples are clipped to 0.
+    """
+
+    KINDS = ["constant", "uniform", "normal", "lognormal"]
+
+    def __init__(self, kind="constant", mean=0.0, deviation=0.0):
+        """
+        Initializes the distribution.
+        :param kind: kind of the distribution.
+        :param mean: mean time in seconds.
+        :param deviation: deviation of the time in seconds.
+        """
+        if kind not in self.KINDS:
+            raise Exception("Latency distribution \"{}\" not supported. Use one of {}.".format(kind, self.KINDS))
+
+        self.kind = kind
+        self.mean = mean
+        self.deviation = deviation
+
+    @classmethod
+    def from_string(cls, text):
+        """
+        Creates a distribution from a string.
+        :param text: string of the format "kind:mean[:deviation]", for example "lognormal:0.05:0.02".
+        :return: instance of the distribution.
+        """
+        elements = text.split(":")
+
+        if len(elements) not in [2, 3]:
+            raise Exception("Latency distribution string \"{}\" does not match \"kind:mean[:deviation]\".".format(
+                text))
+
+        return cls(elements[0], *[float(element) for element in elements[1:]])
+
+    def sample(self, random_generator):
+        """
+        Draws a latency from the distribution.
+        :param random_generator: random.Random instance to draw it with.
+        :return: latency in seconds.
+        """
+        if self.kind == "constant" or self.deviation == 0:
+            latency = self.mean
+
+        elif self.kind == "uniform":
+            latency = random_generator.uniform(self.mean - self.deviation, self.mean + self.deviation)
+
+        elif self.kind == "normal":
+            latency = random_generator.gauss(self.mean, self.deviation)
+
+        else:
+            sigma = math.sqrt(math.log(1 + (self.deviation / self.mean) ** 2))
+            latency = random_generator.lognormvariate(math.log(self.mean) - sigma ** 2 / 2, sigma)
+
+        return max(latency, 0.0)
+
+    def __str__(self):
+        return "{}:{}:{}".format(self.kind, self.mean, self.deviation)
+
+
+class MockService(object):
+    """
+    Behaviour of a service of the mock backend: how long it takes to answer and how often it fails.
+    """
+
+    def __init__(self, latency=None, error_rate=0.0, outage=None, capacity=None):
+        """
+        Initializes the service.
+        :param latency: LatencyDistribution of each request. Answers immediately if not specified.
+        :param error_rate: probability, between 0 and 1, of a request being answered with a 500 error.
+        :param outage: optional tuple (start, duration), in seconds since the backend started. During the outage the
+            service answers every request with a 503 error right away, like a backend that is restarting.
+        :param capacity: maximum number of requests processed at the same time, like the batch slots of a GPU. The
+            rest wait in a queue, so their latency grows with the concurrency. Unlimited if not specified.
+        """
+        if latency is None:
+            latency = LatencyDistribution()
+
+        self.latency = latency
+        self.error_rate = error_rate
+        self.outage = outage
+        self.capacity = capacity
+        self.slots = None if capacity is None else threading.Semaphore(capacity)
+
+    def is_down(self, elapsed_time):
+        """
+        :param elapsed_time: seconds since the backend started.
+        :return: True if the service is in its outage.
+        """
+        if self.outage is None:
+            return False
+
+        start, duration = self.outage
+
+        return start <= elapsed_time < start + duration
+
+    def process(self, latency):
+        """
+        Takes the time to process a request, waiting for a free slot first if the capacity of the service is limited.
+        :param latency: seconds the processing takes.
+        """
+        if self.slots is None:
+            time.sleep(latency)
+            return
+
+        with self.slots:
+            time.sleep(latency)
+
+
+class _MockBackendHandler(BaseHTTPRequestHandler):
+    """
+    Handles the requests of the mock backend. The server holds the MockBackend as its "backend" attribute.
+    """
+
+    def do_PUT(self):
+        backend = self.server.backend
+        path = urlparse(self.path).path
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if path.startswith(FACE_DETECTION_PATH + "/"):
+            service = backend.detection_service
+            build_response = backend.build_detection_response
+
+        elif path.startswith(AGE_ESTIMATION_PATH + "/"):
+            service = backend.age_estimation_service
+            build_response = backend.build_age_estimation_response
+
+        else:
+            self._answer(404, {"message": "Unknown endpoint {}".format(path)})
+            return
+
+        if service.is_down(time.monotonic() - backend.start_time):
+            self._answer(503, {"message": "Mock backend is down."})
+            return
+
+        method = path.rsplit("/", 1)[1]
+        failed, latency = backend.draw_behaviour(service)
+
+        service.process(latency)
+
+        if failed:
+            self._answer(500, {"message": "Mock backend error injected."})
+
+        elif method == "stream":
+            # Counted before answering, so the client never sees an answer that is not counted yet.
+            backend.count_request(path)
+            self._answer(200, build_response(body))
+
+        elif method == "batch":
+            message = email.message_from_bytes("Content-Type: {}\r\n\r\n".format(
+                self.headers['Content-Type']).encode() + body)
+            backend.count_request(path)
+            self._answer(200, {"results": [build_response(part.get_payload(decode=True))
+                                           for part in message.get_payload()]})
+
+        else:
+            self._answer(404, {"message": "Unknown method {}".format(method)})
+
+    def _answer(self, status_code, response_json):
+        content = json.dumps(response_json).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockBackend(object):
+    """
+    Local stand-in for the CVMLModulerized backend, to benchmark and load-test the pipeline without the real services.
+    It implements the stream and batch methods of the face detection and the age estimation endpoints.
+
+    Outputs are deterministic: they are derived from the content of each image, so the same image always gets the
+    same faces and ages. Latencies and injected errors are drawn from a random generator with a fixed seed.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, detection_service=None, age_estimation_service=None,
+                 max_faces=DEFAULT_MAX_FACES, seed=0):
+        """
+        Initializes the mock backend. It does not listen until start() is called.
+        :param host: host to listen on.
+        :param port: port to listen on. If 0, a free port is picked.
+        :param detection_service: MockService for the face detection endpoint.
+        :param age_estimation_service: MockService for the age estimation endpoint.
+        :param max_faces: maximum number of faces detected in an image.
+        :param seed: seed for the latencies and the injected errors.
+        """
+        if detection_service is None:
+            detection_service = MockService()
+
+        if age_estimation_service is None:
+            age_estimation_service = MockService()
+
+        self.host = host
+        self.port = port
+        self.detection_service = detection_service
+        self.age_estimation_service = age_estimation_service
+        self.max_faces = max_faces
+        self.random_generator = random.Random(seed)
+        self.requests_count = {}
+        self.lock = threading.Lock()
+        self.server = None
+        self.start_time = 0
+
+    def start(self):
+        """
+        Starts listening in a background thread.
+        """
+        self._create_server()
+
+        threading.Thread(target=self.server.serve_forever, name="mock-backend", daemon=True).start()
+
+    def stop(self):
+        """
+        Stops listening.
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def serve_forever(self):
+        """
+        Listens in the current thread until interrupted.
+        """
+        self._create_server()
+
+        try:
+            self.server.serve_forever()
+
+        finally:
+            self.server.server_close()
+            self.server = None
+
+    def _create_server(self):
+        """
+        Creates the HTTP server and binds it, picking the port if it was not specified.
+        """
+        self.server = ThreadingHTTPServer((self.host, self.port), _MockBackendHandler)
+        self.server.daemon_threads = True
+        self.server.backend = self
+        self.port = self.server.server_address[1]
+        self.start_time = time.monotonic()
+
+    def get_url(self):
+        """
+        :return: base URL of the backend, to build the URL of the services from.
+        """
+        return "http://{}:{}".format(self.host, self.port)
+
+    def get_requests_count(self):
+        """
+        Getter for the number of requests answered successfully by each endpoint.
+        :return: dictionary with {path: count} format.
+        """
+        with self.lock:
+            return dict(self.requests_count)
+
+    def count_request(self, path):
+        with self.lock:
+            self.requests_count[path] = self.requests_count.get(path, 0) + 1
+
+    def draw_behaviour(self, service):
+        """
+        Draws the behaviour of the service for a request.
+        :param service: MockService requested.
+        :return: tuple (failed, latency).
+        """
+        with self.lock:
+            failed = self.random_generator.random() < service.error_rate
+            latency = service.latency.sample(self.random_generator)
+
+        return failed, latency
+
+    def build_detection_response(self, jpeg):
+        """
+        Builds a fake face detection response for the image.
+        :param jpeg: JPEG content of the image.
+        :return: JSON response, with the bounding boxes inside the image.
+        """
+        digest = hashlib.md5(jpeg).digest()
+
+        # A reduced decoding is enough to know the size of the image.
+        blob = cv2.imdecode(numpy.frombuffer(jpeg, dtype=numpy.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+
+        if blob is None:
+            return {"bounding_boxes": []}
+
+        height, width = blob.shape[0] * 8, blob.shape[1] * 8
+        faces_count = digest[0] % (self.max_faces + 1)
+        bounding_boxes = []
+
+        for index in range(faces_count):
+            size = max(int(min(width, height) * (0.1 + digest[index * 3 + 1] / 255 * 0.3)), 1)
+            x = int((width - size) * digest[index * 3 + 2] / 255)
+            y = int((height - size) * digest[index * 3 + 3] / 255)
+            bounding_boxes.append("[{}, {}, {}, {}]".format(x, y, size, size))
+
+        return {"bounding_boxes": bounding_boxes}
+
+    def build_age_estimation_response(self, jpeg):
+        """
+        Builds a fake age estimation response for the face.
+        :param jpeg: JPEG content of the face.
+        :return: JSON response, with an age range.
+        """
+        digest = hashlib.md5(jpeg).digest()
+        min_age = digest[0] % 60
+
+        return {"Age_range": "({}, {})".format(min_age, min_age + 1 + digest[1] % 6)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock of the CVMLModulerized face detection and age estimation "
+                                                 "backend.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9095)
+    parser.add_argument("--detection-latency", default="constant:0", metavar="KIND:MEAN[:DEVIATION]",
+                        help="latency distribution of the face detection service, in seconds.")
+    parser.add_argument("--age-latency", default="constant:0", metavar="KIND:MEAN[:DEVIATION]",
+                        help="latency distribution of the age estimation service, in seconds.")
+    parser.add_argument("--detection-error-rate", type=float, default=0.0)
+    parser.add_argument("--age-error-rate", type=float, default=0.0)
+    parser.add_argument("--max-faces", type=int, default=DEFAULT_MAX_FACES)
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    mock_backend = MockBackend(arguments.host, arguments.port,
+                               MockService(LatencyDistribution.from_string(arguments.detection_latency),
+                                           arguments.detection_error_rate),
+                               MockService(LatencyDistribution.from_string(arguments.age_latency),
+                                           arguments.age_error_rate),
+                               max_faces=arguments.max_faces, seed=arguments.seed)
+
+    print("Mock backend listening on {}".format(mock_backend.get_url()))
+    mock_backend.serve_forever()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from main.dataset.dataset import mkdir_p
+
+__author__ = "Ivan de Paz Centeno"
+
+
+DEFAULT_MAX_CACHE_SIZE = 1024 * 1024 * 1024
+EVICTION_CHECK_INTERVAL = 100
+
+
+class ResponseCache(object):
+    """
+    Persistent cache of the raw responses of the backends, addressed by the content of the image and the service URL.
+    Re-running a dataset against the same services does not need to reach them again.
+
+    Responses are stored in a SQLite database inside the cache folder, so several processes (like the workers of a
+    Multifilter) can share it. When the size of the stored responses exceeds the maximum, the least recently used
+    ones are evicted. Hit and miss counters are local to each process.
+    """
+
+    def __init__(self, cache_folder, max_size=DEFAULT_MAX_CACHE_SIZE, fast_image_hash=False):
+        """
+        Initializes the cache.
+        :param cache_folder: folder to store the cache into. It is created if it does not exist.
+        :param max_size: maximum size in bytes of the responses stored.
+        :param fast_image_hash: if True, images are addressed by Image.fast_hash() instead of their md5 hash. The
+            responses stored with one kind of hash are not found with the other.
+        """
+        mkdir_p(cache_folder)
+
+        self.cache_file = os.path.join(cache_folder, "responses.sqlite")
+        self.max_size = max_size
+        self.fast_image_hash = fast_image_hash
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.counters_lock = threading.Lock()
+        self.local = threading.local()
+
+        self._get_connection().execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, "
+                                       "size INTEGER, last_access REAL)")
+
+    def __getstate__(self):
+        """
+        Connections and locks can't be pickled. Each process opens its own ones.
+        """
+        state = dict(self.__dict__)
+        del state['local']
+        del state['counters_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.counters_lock = threading.Lock()
+        self.local = threading.local()
+
+    def _get_connection(self):
+        """
+        Retrieves the database connection of the current thread.
+        :return: SQLite connection.
+        """
+        connection = getattr(self.local, 'connection', None)
+
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.cache_file, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+
+        return connection
+
+    def get_image_hash(self, image):
+        """
+        Computes the hash an image is addressed by in this cache. Images whose pixels are the ones of their source file
+        are addressed by the hash of the file, so the ones loaded lazily are not decoded for it.
+        :param image: image to compute the hash of.
+        :return: hash of the image content.
+        """
+        source_hash = image.source_hash()
+
+        if source_hash is not None:
+            return source_hash
+
+        if self.fast_image_hash:
+            return image.fast_hash()
+
+        return image.md5hash()
+
+    @staticmethod
+    def build_key(image_hash, api_url):
+        """
+        Builds the key of a response.
+        :param image_hash: hash of the image content.
+        :param api_url: URL of the service, including its parameters.
+        :return: key for the response.
+        """
+        return hashlib.sha1("{}|{}".format(image_hash, api_url).encode("UTF-8")).hexdigest()
+
+    def get(self, image_hash, api_url):
+        """
+        Retrieves the response of the service for the specified image.
+        :param image_hash: hash of the image content, from get_image_hash().
+        :param api_url: URL of the service.
+        :return: the JSON response stored, None if it is not cached.
+        """
+        key = self.build_key(image_hash, api_url)
+        connection = self._get_connection()
+
+        row = connection.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+
+        if row is None:
+            with self.counters_lock:
+                self.misses += 1
+
+            return None
+
+        connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+
+        with self.counters_lock:
+            self.hits += 1
+
+        return json.loads(row[0])
+
+    def put(self, image_hash, api_url, response_json):
+        """
+        Stores the response of the service for the specified image.
+        :param image_hash: hash of the image content, from get_image_hash().
+        :param api_url: URL of the service.
+        :param response_json: JSON response of the service.
+        """
+        key = self.build_key(image_hash, api_url)
+        response = json.dumps(response_json)
+
+        self._get_connection().execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                       (key, response, len(response), time.time()))
+
+        with self.counters_lock:
+            self.puts += 1
+            check_eviction = self.puts % EVICTION_CHECK_INTERVAL == 0
+
+        if check_eviction:
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used responses until the cache size fits the maximum size.
+        """
+        connection = self._get_connection()
+        exceeding_size = self.get_size() - self.max_size
+
+        if exceeding_size <= 0:
+            return
+
+        evicted_keys = []
+
+        for key, size in connection.execute("SELECT key, size FROM responses ORDER BY last_access, rowid"):
+            evicted_keys.append((key,))
+            exceeding_size -= size
+
+            if exceeding_size <= 0:
+                break
+
+        connection.executemany("DELETE FROM responses WHERE key = ?", evicted_keys)
+
+    def get_size(self):
+        """
+        :return: size in bytes of the responses stored.
+        """
+        return self._get_connection().execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get_hits(self):
+        """
+        :return: number of responses found in the cache by this process.
+        """
+        return self.hits
+
+    def get_misses(self):
+        """
+        :return: number of responses not found in the cache by this process.
+        """
+        return self.misses
+
+    def __len__(self):
+        return self._get_connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
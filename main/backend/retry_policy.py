@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import random
+import time
+
+__author__ = "Ivan de Paz Centeno"
+
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 10
+
+
+class RetryPolicy(object):
+    """
+    Retries a failed call a bounded number of times. The wait before each retry grows exponentially and is randomized
+    (full jitter), so the callers that failed together do not retry together against a recovering backend.
+    """
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        """
+        Initializes the policy.
+        :param max_attempts: maximum number of calls, including the first one.
+        :param base_delay: upper bound in seconds of the wait before the first retry. It doubles for each retry.
+        :param max_delay: maximum upper bound in seconds of the wait before a retry.
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, retry_index):
+        """
+        Computes the wait before a retry.
+        :param retry_index: index of the retry, starting at 0.
+        :return: seconds to wait.
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry_index))
+
+    def call(self, function, is_retryable=None, on_retry=None, deadline=None):
+        """
+        Calls the function, retrying it while it fails with retryable errors.
+        :param function: function without arguments to call.
+        :param is_retryable: function that receives an exception and returns True if the call can be retried. By
+            default, every exception is.
+        :param on_retry: optional function called with the exception before each retry.
+        :param deadline: optional monotonic time the retries must start before. A call that fails when the wait
+            before its retry would reach it is not retried.
+        :return: result of the function.
+        """
+        for retry_index in range(self.max_attempts):
+            delay = self.get_delay(retry_index)
+
+            try:
+                return function()
+
+            except Exception as ex:
+                if not self._should_retry(ex, retry_index, is_retryable, delay, deadline):
+                    raise
+
+                if on_retry is not None:
+                    on_retry(ex)
+
+            time.sleep(delay)
+
+    async def call_async(self, coroutine_function, is_retryable=None, on_retry=None, deadline=None):
+        """
+        Awaits the coroutine function, retrying it while it fails with retryable errors. Same as call(), without
+        blocking the event loop while waiting.
+        :param coroutine_function: coroutine function without arguments to await.
+        :param is_retryable: function that receives an exception and returns True if the call can be retried.
+        :param on_retry: optional function called with the exception before each retry.
+        :param deadline: optional monotonic time the retries must start before.
+        :return: result of the coroutine.
+        """
+        for retry_index in range(self.max_attempts):
+            delay = self.get_delay(retry_index)
+
+            try:
+                return await coroutine_function()
+
+            except Exception as ex:
+                if not self._should_retry(ex, retry_index, is_retryable, delay, deadline):
+                    raise
+
+                if on_retry is not None:
+                    on_retry(ex)
+
+            await asyncio.sleep(delay)
+
+    def _should_retry(self, error, retry_index, is_retryable, delay=0, deadline=None):
+        """
+        :return: True if a call that failed with the error can be retried after waiting the delay.
+        """
+        if retry_index == self.max_attempts - 1:
+            return False
+
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return False
+
+        return is_retryable is None or is_retryable(error)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+__author__ = "Ivan de Paz Centeno"
+
+
+DEFAULT_POOL_SIZE = 16
+DEFAULT_IDLE_TIMEOUT = 60
+
+
+class SessionPool(object):
+    """
+    Process-local pool of keep-alive HTTP sessions, one per backend host.
+    Reusing the connections avoids a TCP handshake per request. After a fork, the child process starts with an empty
+    pool, so sockets are never shared between processes.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, pool_size_by_host=None, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+        """
+        Initializes the pool.
+        :param pool_size: default maximum number of connections kept alive for each host.
+        :param pool_size_by_host: dictionary with {host: pool_size} format to override the default size for specific
+            hosts. Host format is "scheme://hostname:port".
+        :param idle_timeout: seconds a session can be unused before its connections are closed.
+        """
+        if pool_size_by_host is None:
+            pool_size_by_host = {}
+
+        self.pool_size = pool_size
+        self.pool_size_by_host = dict(pool_size_by_host)
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.last_used = {}
+        self.in_use = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_host(url):
+        """
+        Extracts the host of the specified URL.
+        :param url: URL to extract the host from.
+        :return: host in "scheme://hostname:port" format.
+        """
+        split_url = urlsplit(url)
+        return "{}://{}".format(split_url.scheme, split_url.netloc)
+
+    def set_pool_size(self, host, pool_size):
+        """
+        Sets the maximum number of connections kept alive for the specified host. Affects new sessions only.
+        :param host: host in "scheme://hostname:port" format.
+        :param pool_size: maximum number of connections.
+        """
+        self.pool_size_by_host[host] = pool_size
+
+    def ensure_pool_size(self, host, pool_size):
+        """
+        Grows the maximum number of connections kept alive for the specified host to at least the given size. Unlike
+        set_pool_size(), the session already created for the host is resized too.
+        :param host: host in "scheme://hostname:port" format.
+        :param pool_size: minimum number of connections.
+        """
+        with self.lock:
+            if self.pool_size_by_host.get(host, self.pool_size) >= pool_size:
+                return
+
+            self.pool_size_by_host[host] = pool_size
+
+            if host in self.sessions:
+                # Requests in flight keep the connection pool of the replaced adapter until they finish.
+                self.sessions[host].mount(host, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+    def get_session(self, url):
+        """
+        Retrieves the session for the host of the specified URL, creating it if needed. The session is not held: once
+        idle, it may be closed by another thread. Use hold_session() to send requests through it.
+        :param url: URL to retrieve the session for.
+        :return: requests session.
+        """
+        host = self.get_host(url)
+
+        with self.lock:
+            return self._get_session(host)
+
+    @contextlib.contextmanager
+    def hold_session(self, url):
+        """
+        Retrieves the session for the host of the specified URL, like get_session(), and keeps it from being evicted
+        until the context is exited.
+        :param url: URL to retrieve the session for.
+        :return: context manager that gives the requests session.
+        """
+        host = self.get_host(url)
+
+        with self.lock:
+            session = self._get_session(host)
+            self.in_use[host] = self.in_use.get(host, 0) + 1
+
+        try:
+            yield session
+
+        finally:
+            with self.lock:
+                self.in_use[host] -= 1
+
+                if self.in_use[host] == 0:
+                    del self.in_use[host]
+
+                if host in self.last_used:
+                    self.last_used[host] = time.monotonic()
+
+    def put(self, url, data, **kwargs):
+        """
+        Sends a PUT request through the pooled session of the URL's host.
+        :param url: URL to send the request to.
+        :param data: binary content of the request.
+        :return: requests response.
+        """
+        with self.hold_session(url) as session:
+            return session.put(url, data=data, **kwargs)
+
+    def _get_session(self, host):
+        """
+        Retrieves the session for the specified host, creating it if needed. The lock must be held.
+        :param host: host in "scheme://hostname:port" format.
+        :return: requests session.
+        """
+        now = time.monotonic()
+        self._evict_idle_sessions(now, keep_host=host)
+
+        if host not in self.sessions:
+            self.sessions[host] = self._create_session(host)
+
+        self.last_used[host] = now
+
+        return self.sessions[host]
+
+    def _create_session(self, host):
+        """
+        Creates a new keep-alive session for the specified host.
+        :param host: host to create the session for.
+        :return: requests session.
+        """
+        pool_size = self.pool_size_by_host.get(host, self.pool_size)
+
+        session = requests.Session()
+        session.mount(host, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+
+        return session
+
+    def _evict_idle_sessions(self, now, keep_host=None):
+        """
+        Closes the sessions that have not been used for longer than the idle timeout. Sessions held by hold_session()
+        are never evicted.
+        :param now: current monotonic time.
+        :param keep_host: host whose session is about to be used and must not be evicted.
+        """
+        idle_hosts = [host for host, last_used in self.last_used.items()
+                      if host != keep_host and host not in self.in_use and now - last_used > self.idle_timeout]
+
+        for host in idle_hosts:
+            self.sessions.pop(host).close()
+            del self.last_used[host]
+
+    def close(self):
+        """
+        Closes all the sessions of the pool.
+        """
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+
+            self.sessions = {}
+            self.last_used = {}
+
+    def _reset_after_fork(self):
+        """
+        Forgets the sessions inherited from the parent process. They are not closed, since their sockets still belong
+        to the parent.
+        """
+        self.sessions = {}
+        self.last_used = {}
+        self.in_use = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.sessions)
+
+
+_session_pool = SessionPool()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_session_pool._reset_after_fork)
+
+
+def get_session_pool():
+    """
+    Retrieves the session pool of the current process.
+    :return:
+    """
+    return _session_pool
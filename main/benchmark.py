@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy
+
+from main.backend.concurrency_limiter import GAUGE_PREFIX
+from main.backend.load_balancer import POLICY_LEAST_OUTSTANDING, POLICY_LATENCY_WEIGHTED, close_load_balancers
+from main.backend.mock_backend import MockBackend, MockService, LatencyDistribution, FACE_DETECTION_PATH, \
+    AGE_ESTIMATION_PATH
+from main.backend.response_cache import ResponseCache
+from main.backend.retry_policy import RetryPolicy
+from main.dataset.generic_image_age_dataset import GenericImageAgeDataset
+from main.dataset.raw_crawled_dataset import RawCrawledDataset
+from main.filter.advanced.age_estimation_filter import AgeEstimationFilter
+from main.filter.advanced.age_estimation_text_inference_filter import AgeEstimationTextInferenceFilter
+from main.filter.advanced.face_detection_filter import FaceDetectionFilter
+from main.filter.executor import create_executor, close_default_executors, ProcessExecutor
+from main.filter.filter import FILTER_KIND_CPU_BOUND, FILTER_KIND_IO_BOUND, FILTER_KIND_LIGHTWEIGHT
+from main.filter.multifilter import Multifilter
+from main.metrics.metrics_registry import get_metrics_registry, METRICS_FILTER
+from main.pipeline.age_inference_pipeline import AgeInferencePipeline, DEFAULT_WORKERS, DEFAULT_SOURCE_FACE_SIZE
+from main.resource.image import EncodingPolicy
+from main.tools.age_range import AgeRange
+
+__author__ = "Ivan de Paz Centeno"
+
+# Runs the full age inference pipeline on a synthetic crawled dataset against a local mock backend, and reports its
+# throughput, the latency of each stage and the peak memory. Nothing is requested to the network.
+
+AGE_PATTERN = "([0-9][0-9]?).?(?:[ ]|[-])(?:(?:year[']?s?)(?:[ ]|[-])(?:old)|(?:yo))"
+EXECUTOR_KINDS = [FILTER_KIND_CPU_BOUND, FILTER_KIND_IO_BOUND, FILTER_KIND_LIGHTWEIGHT]
+
+
+def generate_synthetic_dataset(folder, images_count, image_size, seed=0):
+    """
+    Generates a raw crawled dataset of random images, with descriptions and search keywords that sometimes mention
+    an age.
+    :param folder: folder to generate the dataset into.
+    :param images_count: number of images of the dataset.
+    :param image_size: size of the images, in (width, height) format.
+    :param seed: seed for the content of the dataset.
+    """
+    random_generator = random.Random(seed)
+    numpy_generator = numpy.random.RandomState(seed)
+    metadata = {}
+
+    os.makedirs(os.path.join(folder, "images"), exist_ok=True)
+
+    for index in range(images_count):
+        uri = os.path.join("images", "{}.jpg".format(index))
+
+        # Smooth noise compresses like a photo, unlike pure noise.
+        blob = numpy_generator.randint(0, 256, (image_size[1] // 8, image_size[0] // 8, 3)).astype(numpy.uint8)
+        cv2.imwrite(os.path.join(folder, uri), cv2.resize(blob, tuple(image_size), interpolation=cv2.INTER_LINEAR))
+
+        age = random_generator.randint(0, 20)
+        description = random_generator.choice(["My son, {} years old, at the beach".format(age),
+                                               "Birthday party", "Happy {} yo!".format(age), "Family picture"])
+        search_words = random_generator.sample(["baby", "toddler", "kid", "{} years old".format(age), "family"], 2)
+
+        metadata["{:032x}".format(index)] = {"metadata": {"uri": [uri], "desc": description,
+                                                          "searchwords": search_words}}
+
+    with open(os.path.join(folder, "metadata.json"), "w") as file:
+        json.dump({"data": metadata}, file)
+
+
+def parse_encoding_policy(description):
+    """
+    :param description: encoding in FORMAT:QUALITY[:MAX_SIZE][:gray] format, for example jpg:85:256.
+    :return: the EncodingPolicy.
+    """
+    values = description.split(":")
+    as_gray = values[-1] == "gray"
+
+    if as_gray:
+        values = values[:-1]
+
+    return EncodingPolicy("." + values[0], *[int(value) for value in values[1:]], as_gray=as_gray)
+
+
+def get_peak_memory():
+    """
+    :return: peak resident memory, in megabytes, of this process and of its children (the pool workers).
+    """
+    # ru_maxrss is expressed in kilobytes on Linux.
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024)
+
+
+parser = argparse.ArgumentParser(description="Benchmarks the age inference pipeline against a local mock backend.")
+parser.add_argument("--images", type=int, default=200, help="number of images of the synthetic dataset.")
+parser.add_argument("--image-size", default="800x600", metavar="WIDTHxHEIGHT")
+parser.add_argument("--max-faces", type=int, default=3, help="maximum faces the mock backend detects per image.")
+parser.add_argument("--detection-latency", default="lognormal:0.05:0.02", metavar="KIND:MEAN[:DEVIATION]",
+                    help="latency distribution of the face detection service, in seconds.")
+parser.add_argument("--detection-encoding", default="jpg:90", metavar="FORMAT:QUALITY[:MAX_SIZE][:gray]",
+                    help="encoding of the images sent to the face detection service, for example jpg:90:640:gray to "
+                         "send downscaled gray proxies.")
+parser.add_argument("--crop-from-source", action="store_true",
+                    help="crop the faces of the resized images that are too small from their source file.")
+parser.add_argument("--source-face-size", type=int, default=DEFAULT_SOURCE_FACE_SIZE,
+                    help="size the faces cropped from the source file must reach.")
+parser.add_argument("--age-encoding", default="jpg:90", metavar="FORMAT:QUALITY[:MAX_SIZE][:gray]",
+                    help="encoding of the faces sent to the age estimation service, for example jpg:85:256.")
+parser.add_argument("--age-latency", default="lognormal:0.02:0.01", metavar="KIND:MEAN[:DEVIATION]",
+                    help="latency distribution of the age estimation service, in seconds.")
+parser.add_argument("--detection-capacity", type=int, default=None,
+                    help="requests the face detection service processes at the same time; the rest queue.")
+parser.add_argument("--age-capacity", type=int, default=None,
+                    help="requests the age estimation service processes at the same time; the rest queue.")
+parser.add_argument("--max-concurrency", type=int, default=None,
+                    help="maximum requests in flight to each service; the actual limit adapts to its latency.")
+parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a backend request failing.")
+parser.add_argument("--workers", default=None, metavar="STAGE=COUNT[,STAGE=COUNT...]",
+                    help="worker threads of the pipeline stages, for example detect=8,infer=8.")
+parser.add_argument("--executor", default=None, choices=EXECUTOR_KINDS,
+                    help="run every filter of the multifilters in this kind of executor, instead of the default one of "
+                         "the kind of each filter.")
+parser.add_argument("--share-images", action="store_true",
+                    help="with the cpu-bound executor, hand the images to the workers through shared memory.")
+parser.add_argument("--batch", action="store_true", help="send the faces of each image in a batch request.")
+parser.add_argument("--expected-age-range", default="0-99", metavar="MIN-MAX",
+                    help="faces outside this age range are discarded.")
+parser.add_argument("--cache-folder", default=None,
+                    help="folder of a response cache. Run twice with the same folder to measure a warm cache.")
+parser.add_argument("--fast-image-hash", action="store_true",
+                    help="address the images of the response cache by a BLAKE2b hash instead of md5.")
+parser.add_argument("--port", type=int, default=9096,
+                    help="port of the mock backend. Responses are cached by URL, so keep it to reuse a cache.")
+parser.add_argument("--timeout", type=float, default=None, help="deadline in seconds of each backend request.")
+parser.add_argument("--hedge-percentile", type=float, default=None,
+                    help="latency percentile after which a slow backend request is duplicated.")
+parser.add_argument("--outage", default=None, metavar="START:DURATION",
+                    help="seconds since the start of the mock backend when both services of its first replica go "
+                         "down, and for how long.")
+parser.add_argument("--replicas", type=int, default=1,
+                    help="number of mock backends, listening on consecutive ports, to balance the requests across.")
+parser.add_argument("--balancing-policy", default=POLICY_LEAST_OUTSTANDING,
+                    choices=[POLICY_LEAST_OUTSTANDING, POLICY_LATENCY_WEIGHTED])
+parser.add_argument("--attempts", type=int, default=1, help="maximum attempts of a backend request.")
+parser.add_argument("--circuit-threshold", type=int, default=None,
+                    help="consecutive failures that open the circuit breaker of a service.")
+parser.add_argument("--circuit-reset-timeout", type=float, default=5,
+                    help="seconds a circuit breaker stays open before probing its service again.")
+parser.add_argument("--deferred-delay", type=float, default=0,
+                    help="seconds to wait before processing again the images that failed because of the backend.")
+parser.add_argument("--seed", type=int, default=0)
+arguments = parser.parse_args()
+
+image_size = [int(value) for value in arguments.image_size.split("x")]
+detection_encoding_policy = parse_encoding_policy(arguments.detection_encoding)
+age_encoding_policy = parse_encoding_policy(arguments.age_encoding)
+expected_age_range = AgeRange(*[int(value) for value in arguments.expected_age_range.split("-")])
+outage = None
+workers = {}
+
+if arguments.outage:
+    outage = tuple(float(value) for value in arguments.outage.split(":"))
+
+if arguments.workers:
+    workers = {stage: int(count) for stage, count in [item.split("=") for item in arguments.workers.split(",")]}
+
+work_folder = tempfile.mkdtemp(prefix="inferencedb-benchmark-")
+source_folder = os.path.join(work_folder, "source")
+output_folder = os.path.join(work_folder, "output")
+
+mock_backends = [MockBackend(port=arguments.port + index,
+                             detection_service=MockService(LatencyDistribution.from_string(arguments.detection_latency),
+                                                           arguments.error_rate, outage if index == 0 else None,
+                                                           arguments.detection_capacity),
+                             age_estimation_service=MockService(LatencyDistribution.from_string(arguments.age_latency),
+                                                                arguments.error_rate, outage if index == 0 else None,
+                                                                arguments.age_capacity),
+                             max_faces=arguments.max_faces, seed=arguments.seed + index)
+                 for index in range(arguments.replicas)]
+mock_backend = mock_backends[0]
+executor = None
+
+if arguments.share_images:
+    executor = ProcessExecutor(share_images=True)
+
+elif arguments.executor:
+    executor = create_executor(arguments.executor)
+
+try:
+    print("Generating {} synthetic images into \"{}\"...".format(arguments.images, source_folder))
+    generate_synthetic_dataset(source_folder, arguments.images, image_size, arguments.seed)
+
+    raw_dataset = RawCrawledDataset(source_folder)
+    raw_dataset.load_dataset()
+
+    for replica_backend in mock_backends:
+        replica_backend.start()
+        print("Mock backend listening on {}".format(replica_backend.get_url()))
+
+    response_cache = None
+
+    if arguments.cache_folder:
+        response_cache = ResponseCache(arguments.cache_folder, fast_image_hash=arguments.fast_image_hash)
+
+    detection_url = mock_backend.get_url() + FACE_DETECTION_PATH
+    age_estimation_url = mock_backend.get_url() + AGE_ESTIMATION_PATH
+
+    resilience_kwargs = dict(retry_policy=RetryPolicy(arguments.attempts),
+                             failure_threshold=arguments.circuit_threshold,
+                             reset_timeout=arguments.circuit_reset_timeout,
+                             replica_hosts=[replica_backend.get_url() for replica_backend in mock_backends]
+                             if arguments.replicas > 1 else None,
+                             balancing_policy=arguments.balancing_policy, max_concurrency=arguments.max_concurrency)
+
+    face_filter = FaceDetectionFilter(1, detection_url + "/stream?service=mock", min_faces=1,
+                                      response_cache=response_cache, timeout=arguments.timeout,
+                                      hedge_percentile=arguments.hedge_percentile,
+                                      encoding_policy=detection_encoding_policy, **resilience_kwargs)
+    image_multifilter = Multifilter([
+        AgeEstimationFilter(6, age_estimation_url + "/stream?service=mock", min_age=0, max_age=99,
+                            batch_api_url=age_estimation_url + "/batch?service=mock" if arguments.batch else None,
+                            response_cache=response_cache, timeout=arguments.timeout,
+                            hedge_percentile=arguments.hedge_percentile, encoding_policy=age_encoding_policy,
+                            **resilience_kwargs),
+    ], executor=executor)
+    text_multifilter = Multifilter([AgeEstimationTextInferenceFilter(10, pattern=AGE_PATTERN)], executor=executor)
+    search_keywords_multifilter = Multifilter([AgeEstimationTextInferenceFilter(4, pattern=AGE_PATTERN)],
+                                              executor=executor)
+
+    age_inference_pipeline = AgeInferencePipeline(face_filter, text_multifilter, search_keywords_multifilter,
+                                                  image_multifilter, GenericImageAgeDataset(output_folder),
+                                                  source_folder, expected_age_range=expected_age_range,
+                                                  workers=workers, deferred_delay=arguments.deferred_delay,
+                                                  crop_from_source=arguments.crop_from_source,
+                                                  source_face_size=arguments.source_face_size)
+
+    start_time = time.perf_counter()
+    age_inference_pipeline.run(raw_dataset.get_metadata_content())
+    elapsed_time = time.perf_counter() - start_time
+
+    pipeline = age_inference_pipeline.get_pipeline()
+    processed_count = pipeline.get_processed_count()
+    errors_count = pipeline.get_errors_count()
+    processing_time = pipeline.get_processing_time()
+    peak_memory, children_peak_memory = get_peak_memory()
+
+    print("")
+    print("Images: {} in {:.2f}s ({:.2f} images/s)".format(arguments.images, elapsed_time,
+                                                          arguments.images / elapsed_time))
+    print("{:<10} {:>8} {:>8} {:>12} {:>14}".format("Stage", "Items", "Errors", "Mean (ms)", "Workers"))
+
+    for stage_name in DEFAULT_WORKERS:
+        items_count = processed_count[stage_name] + errors_count[stage_name]
+        mean_latency = processing_time[stage_name] / items_count * 1000 if items_count else 0
+        print("{:<10} {:>8} {:>8} {:>12.2f} {:>14}".format(stage_name, processed_count[stage_name],
+                                                            errors_count[stage_name], mean_latency,
+                                                            workers.get(stage_name, DEFAULT_WORKERS[stage_name])))
+
+    print("{:<50} {:>8} {:>10} {:>12} {:>8} {:>12} {:>9} {:>7} {:>8} {:>9}".format(
+        "Filter", "Calls", "Pass rate", "Mean (ms)", "Errors", "Uploaded KB", "Timeouts", "Hedged", "Retries",
+        "Rejected"))
+
+    for filter_name, metrics_dict in sorted(get_metrics_registry().get_snapshot()[METRICS_FILTER].items()):
+        latency = metrics_dict['latency']
+        mean_latency = latency['sum'] / latency['count'] * 1000 if latency['count'] else 0
+        print("{:<50} {:>8} {:>10.2f} {:>12.2f} {:>8} {:>12.1f} {:>9} {:>7} {:>8} {:>9}".format(
+            filter_name, metrics_dict['calls'], metrics_dict['pass_rate'], mean_latency, metrics_dict['errors'],
+            metrics_dict['bytes_uploaded'] / 1024, metrics_dict['timeouts'], metrics_dict['hedged_requests'],
+            metrics_dict['retries'], metrics_dict['rejected_requests']))
+
+    for gauge_name, value in sorted(get_metrics_registry().get_snapshot()['gauge'].items()):
+        if gauge_name.startswith(GAUGE_PREFIX):
+            print("Final {}: {}".format(gauge_name, value))
+
+    print("Faces discarded before applying all the filters: {}".format(age_inference_pipeline.skipped_faces_count))
+    for replica_backend in mock_backends:
+        print("Backend requests ({}): {}".format(replica_backend.get_url(), replica_backend.get_requests_count()))
+
+    if response_cache is not None:
+        print("Response cache: {} hits, {} misses.".format(response_cache.get_hits(), response_cache.get_misses()))
+
+    print("Peak memory: {:.1f} MB (pool workers: {:.1f} MB)".format(peak_memory, children_peak_memory))
+
+finally:
+    if executor is not None:
+        executor.close()
+
+    close_default_executors()
+    close_load_balancers()
+
+    for replica_backend in mock_backends:
+        replica_backend.stop()
+
+    shutil.rmtree(work_folder)
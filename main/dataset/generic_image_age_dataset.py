@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import hashlib
 import json
 import os
 import random
@@ -25,7 +26,8 @@ class GenericImageAgeDataset(Dataset):
     """
 
     def __init__(self, root_folder, metadata_file="labels.json",
-                 description="Generic Dataset JSON-Based of image with Age labels", dataset_normalizers=None):
+                 description="Generic Dataset JSON-Based of image with Age labels", dataset_normalizers=None,
+                 labels_log_file=None):
         """
         Initialization of a dataset of image with ages labeled.
         Metadata is built from a JSON file.
@@ -38,6 +40,8 @@ class GenericImageAgeDataset(Dataset):
                               Note: the working directory when loading the metadata_file is root_folder.
         :param description: description of the dataset for report purposes.
         :param dataset_normalizers: list of normalizers to normalize when storing image inside this dataset.
+        :param labels_log_file: append-only log of the labels added since the metadata_file was last saved, in JSON
+                                lines format. By default, it is the metadata_file name followed by ".log".
         :return:
         """
         # This dataset class is also capable of creating datasets.
@@ -49,6 +53,14 @@ class GenericImageAgeDataset(Dataset):
 
         Dataset.__init__(self, root_folder, metadata_file, description)
 
+        if not labels_log_file:
+            labels_log_file = metadata_file + ".log"
+
+        elif not self._is_absolute_uri(labels_log_file):
+            labels_log_file = os.path.join(root_folder, labels_log_file)
+
+        self.labels_log_file = labels_log_file
+        self.pending_labels = []
         self.autoencoded_uris = {}
 
         if not dataset_normalizers:
@@ -152,6 +164,7 @@ class GenericImageAgeDataset(Dataset):
                     normalizers_applied += 1
 
             cv2.imwrite(uri, image_blob)
+            self.pending_labels.append((key, self.metadata_content[key]))
             print("Saved into {} ({} normalizers applied)".format(uri, normalizers_applied))
 
         except Exception as ex:
@@ -225,8 +238,27 @@ class GenericImageAgeDataset(Dataset):
             self.metadata_content = "{}"
 
         self.metadata_content = self._preprocess_metadata(self.metadata_content)
+        self._load_labels_log()
         self._update_encoded_uris_cache()
 
+    def _load_labels_log(self):
+        """
+        Applies the labels of the log on top of the metadata content. A truncated last line (the process was killed
+        while writing) is ignored.
+        """
+        if not os.path.exists(self.labels_log_file):
+            return
+
+        with open(self.labels_log_file) as file:
+            for line in file:
+                try:
+                    key, age_range_string = json.loads(line)
+
+                except ValueError:
+                    continue
+
+                self.metadata_content[key] = AgeRange.from_string(age_range_string)
+
     @staticmethod
     def _preprocess_metadata(raw_metadata):
         """
@@ -256,14 +288,69 @@ class GenericImageAgeDataset(Dataset):
 
         return postprocessed_metadata
 
+    def save_labels_log(self):
+        """
+        Appends the labels added since the last call to the labels log, and syncs it to disk.
+        Its cost depends only on the number of new labels, so it can be called often during long processes.
+        Call save_dataset() at the end to compact the log into the metadata file.
+        """
+        pending_labels = self.pending_labels
+        self.pending_labels = []
+
+        if not pending_labels:
+            return
+
+        # A previous process may have been killed while writing, leaving a truncated line.
+        truncated_tail = False
+
+        if os.path.exists(self.labels_log_file) and os.path.getsize(self.labels_log_file) > 0:
+            with open(self.labels_log_file, 'rb') as file:
+                file.seek(-1, os.SEEK_END)
+                truncated_tail = file.read(1) != b"\n"
+
+        with open(self.labels_log_file, 'a') as file:
+            if truncated_tail:
+                file.write("\n")
+
+            file.write("".join([json.dumps([key, age_range.to_dict()["Age_range"]]) + "\n"
+                                for key, age_range in pending_labels]))
+            file.flush()
+            os.fsync(file.fileno())
+
     def save_dataset(self):
         """
         Dumps the metadata labels in JSON format inside the dataset's folder with name labels.json
+        The file is written into a temporary file first and then renamed, so it is replaced atomically. Afterwards, the
+        labels log is not needed anymore and it is removed.
         :return:
         """
+        temporary_file = self.metadata_file + ".tmp"
 
-        with open(self.metadata_file, 'w') as outfile:
+        with open(temporary_file, 'w') as outfile:
             json.dump(self._postprocess_metadata(self.metadata_content), outfile, indent=4)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+
+        os.replace(temporary_file, self.metadata_file)
+
+        self.pending_labels = []
+
+        if os.path.exists(self.labels_log_file):
+            os.remove(self.labels_log_file)
+
+    def get_labels_log_filename(self):
+        """
+        Getter for the labels log filename.
+        """
+        return self.labels_log_file
+
+    def is_saved(self):
+        """
+        Checks if there is any saved content of the dataset in its folder, either in the metadata file or in the
+        labels log.
+        :return: True if there is saved content, False otherwise.
+        """
+        return os.path.exists(self.metadata_file) or os.path.exists(self.labels_log_file)
 
     def get_dataset_size(self):
         """
@@ -436,6 +523,48 @@ class GenericImageAgeDataset(Dataset):
         for k,v in previous_metadata_content.items():
             self.metadata_content[k] = v
 
+    def import_from_dataset(self, dataset):
+        """
+        Imports the content of another age dataset into this one, for example a shard of a sharded run.
+        Image files are copied as they are, and their URIs are encoded again so they don't collide with the URIs of
+        this dataset. Images whose file and label are already in this dataset are skipped, so importing the same
+        dataset twice does not duplicate its images.
+        :param dataset: GenericImageAgeDataset to import. It must have been loaded.
+        :return: number of images imported.
+        """
+        imported_entries = {(self._hash_file(self._get_key_absolute_uri(key)), str(self.get_key_metadata(key)))
+                            for key in self.get_keys()}
+        imported_count = 0
+
+        for key in dataset.get_keys():
+            image = dataset.get_image(key)
+            entry = (self._hash_file(image.get_uri()), str(image.get_metadata()[0]))
+
+            if entry in imported_entries:
+                continue
+
+            imported_entries.add(entry)
+            imported_count += 1
+            uri = self._encode_uri_for_image(image)
+            absolute_uri = self._get_key_absolute_uri(uri)
+
+            mkdir_p(os.path.dirname(absolute_uri))
+            shutil.copyfile(image.get_uri(), absolute_uri)
+
+            self.metadata_content[uri] = image.get_metadata()[0]
+            self.pending_labels.append((uri, image.get_metadata()[0]))
+
+        return imported_count
+
+    @staticmethod
+    def _hash_file(uri):
+        """
+        :param uri: absolute URI of a file.
+        :return: md5 hash of the content of the file.
+        """
+        with open(uri, "rb") as file:
+            return hashlib.md5(file.read()).hexdigest()
+
     def get_metadata_proto(self):
         """
         Retrieves the metadata proto used by this class.
@@ -458,6 +587,10 @@ class GenericImageAgeDataset(Dataset):
                 os.remove(absolute_uri)
                 os.remove(self.metadata_file)
 
+            if os.path.exists(self.labels_log_file):
+                os.remove(self.labels_log_file)
+
         self.metadata_content = {}
+        self.pending_labels = []
 
 dataset_proto[GenericImageAgeDataset.__name__] = GenericImageAgeDataset
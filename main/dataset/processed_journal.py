@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+
+__author__ = "Ivan de Paz Centeno"
+
+
+OUTCOME_ACCEPTED = "accepted"
+OUTCOME_DISCARDED = "discarded"
+OUTCOME_FAILED = "failed"
+
+
+class ProcessedJournal(object):
+    """
+    Append-only journal of the elements of a raw dataset that have already been processed, and their outcomes.
+    It lives inside the output dataset folder, so a run restarted against the same folder can skip them.
+
+    Records are buffered and only written by flush(). Flush it right after saving the dataset, so every element
+    recorded as accepted has its labels stored.
+    """
+
+    def __init__(self, root_folder, journal_file="journal.jsonl"):
+        """
+        Initializes the journal.
+        :param root_folder: folder of the output dataset.
+        :param journal_file: name of the journal file inside the root folder.
+        """
+        self.journal_file = os.path.join(root_folder, journal_file)
+        self.outcomes = {}
+        self.pending_records = []
+        self.lock = threading.Lock()
+        self.truncated_tail = False
+
+    def load(self):
+        """
+        Loads the outcomes recorded by previous runs. A truncated last line (the run was killed while writing) is
+        ignored.
+        """
+        self.outcomes = {}
+        self.truncated_tail = False
+
+        if not os.path.exists(self.journal_file):
+            return
+
+        with open(self.journal_file) as file:
+            for line in file:
+                # Next records must not be appended to a truncated line.
+                self.truncated_tail = not line.endswith("\n")
+
+                try:
+                    record = json.loads(line)
+
+                except ValueError:
+                    continue
+
+                self.outcomes[record['hash']] = record['outcome']
+
+    def is_processed(self, image_hash):
+        """
+        Checks if the specified element has already been processed.
+        :param image_hash: hash key of the element in the raw dataset.
+        :return: True if it is recorded in the journal, False otherwise.
+        """
+        return image_hash in self.outcomes
+
+    def get_outcome(self, image_hash):
+        """
+        Getter for the outcome of an element.
+        :param image_hash: hash key of the element in the raw dataset.
+        :return: OUTCOME_ACCEPTED, OUTCOME_DISCARDED or OUTCOME_FAILED. None if it is not recorded.
+        """
+        return self.outcomes.get(image_hash)
+
+    def record(self, image_hash, outcome, age_ranges=None):
+        """
+        Records the outcome of an element. It is not persisted until flush() is called.
+        :param image_hash: hash key of the element in the raw dataset.
+        :param outcome: OUTCOME_ACCEPTED, OUTCOME_DISCARDED or OUTCOME_FAILED.
+        :param age_ranges: list of AgeRange of the faces accepted from the element.
+        """
+        if age_ranges is None:
+            age_ranges = []
+
+        record = {'hash': image_hash, 'outcome': outcome,
+                  'age_ranges': [age_range.to_dict()['Age_range'] for age_range in age_ranges]}
+
+        with self.lock:
+            self.pending_records.append(record)
+            self.outcomes[image_hash] = outcome
+
+    def get_pending_count(self):
+        """
+        :return: number of records not flushed yet.
+        """
+        return len(self.pending_records)
+
+    def flush(self):
+        """
+        Appends the pending records to the journal file and syncs it to disk.
+        """
+        with self.lock:
+            pending_records = self.pending_records
+            self.pending_records = []
+
+        if not pending_records:
+            return
+
+        with open(self.journal_file, 'a') as file:
+            if self.truncated_tail:
+                file.write("\n")
+                self.truncated_tail = False
+
+            file.write("".join([json.dumps(record) + "\n" for record in pending_records]))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def __len__(self):
+        return len(self.outcomes)
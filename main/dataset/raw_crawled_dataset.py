@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import hashlib
 import json
 import os
 import shutil
@@ -59,3 +60,26 @@ class RawCrawledDataset(Dataset):
 
         if 'data' in self.metadata_content:
             self.metadata_content = self.metadata_content['data']
+
+    @staticmethod
+    def get_shard_index(image_hash, shards_count):
+        """
+        Computes the shard an element belongs to. The assignment is stable across runs and machines.
+        :param image_hash: hash key of the element in the metadata.
+        :param shards_count: total number of shards.
+        :return: index of the shard, between 0 and shards_count - 1.
+        """
+        return int(hashlib.md5(image_hash.encode("UTF-8")).hexdigest(), 16) % shards_count
+
+    def get_shard_metadata_content(self, shard_index, shards_count):
+        """
+        Retrieves the part of the metadata content that belongs to the specified shard.
+        :param shard_index: index of the shard, between 0 and shards_count - 1.
+        :param shards_count: total number of shards.
+        :return: metadata dictionary with the elements of the shard.
+        """
+        if not 0 <= shard_index < shards_count:
+            raise Exception("Shard index {} is out of range for {} shards.".format(shard_index, shards_count))
+
+        return {image_hash: data for image_hash, data in self.metadata_content.items()
+                if self.get_shard_index(image_hash, shards_count) == shard_index}
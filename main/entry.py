@@ -1,18 +1,24 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import argparse
 import os
-import sys
 
 import shutil
 
+from main.backend.load_balancer import POLICY_LATENCY_WEIGHTED, close_load_balancers
+from main.backend.response_cache import ResponseCache
+from main.backend.retry_policy import RetryPolicy
 from main.dataset.generic_image_age_dataset import GenericImageAgeDataset
+from main.dataset.processed_journal import ProcessedJournal
 from main.dataset.raw_crawled_dataset import RawCrawledDataset
 from main.filter.advanced.age_estimation_filter import AgeEstimationFilter
 from main.filter.advanced.age_estimation_text_inference_filter import AgeEstimationTextInferenceFilter
 from main.filter.advanced.face_detection_filter import FaceDetectionFilter
+from main.filter.executor import close_default_executors
 from main.filter.multifilter import Multifilter
-from main.resource.image import Image
-from main.resource.text import Text
+from main.metrics.metrics_exporter import MetricsExporter
+from main.pipeline.age_inference_pipeline import AgeInferencePipeline
+from main.resource.image import EncodingPolicy
 from main.tools.age_range import AgeRange
 
 __author__ = "Ivan de Paz Centeno"
@@ -22,11 +28,84 @@ MAX_IMAGE_SIZE = (1200, 1200)
 AGE_GROUPING_SIZE = 2
 EXPECTED_AGE_RANGE = AgeRange(0, 4)
 
-if len(sys.argv) != 2:
-    print("A parameter for folder/zip location of the processable dataset is needed.")
-    exit(-1)
+# Send all the faces of an image to the age estimation services in a single request. Requires backends that implement
+# the batch method.
+BATCH_REQUESTS = False
+MAX_BATCH_SIZE = 16
+
+# Faces are sent to the age estimation services no bigger than this, close to the input size of their models.
+AGE_ENCODING_POLICY = EncodingPolicy(quality=90, max_size=256)
+
+# Images are sent to the face detection service as a proxy no bigger than this. The faces are still cropped from the
+# image (see CROP_FROM_SOURCE). Set as_gray=True for detectors that work on gray scale images.
+DETECTION_ENCODING_POLICY = EncodingPolicy(quality=90, max_size=640)
+
+# Faces of the images bigger than MAX_IMAGE_SIZE that are smaller than the input of the age estimation services are
+# cropped from their source file, decoded again at the smallest reduced scale that keeps them that big. Off until it is
+# measured with main/benchmark.py --crop-from-source on real datasets.
+CROP_FROM_SOURCE = False
+
+# Seconds each image may wait for a backend before its request is given up as timed out.
+REQUEST_TIMEOUT = 30
+
+# Requests to the single image endpoints slower than this percentile of the service's latencies are duplicated, and
+# the first answer is used. None disables the hedging.
+HEDGE_PERCENTILE = 95
+
+# Requests failing with transient errors are retried with a jittered backoff. After too many consecutive failures the
+# circuit of the service opens and its requests fail fast until it recovers. The images that fail are processed again
+# at the end of the run.
+MAX_REQUEST_ATTEMPTS = 3
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_RESET_TIMEOUT = 30
+DEFERRED_ROUNDS = 1
+
+# Responses of the backends are cached here, so re-running a dataset does not reach them again.
+RESPONSE_CACHE_FOLDER = "/tmp/inferencedb/response_cache"
+RESPONSE_CACHE_SIZE = 1024 * 1024 * 1024
+
+# Worker threads for each stage of the pipeline. Stages not listed take the pipeline's default.
+PIPELINE_WORKERS = {
+    "decode": 2,
+    "detect": 4,
+    "infer": 4,
+}
+
+# Snapshots of the metrics of the filters and the pipeline stages are written into the output folder periodically.
+METRICS_EXPORT_INTERVAL = 60
+
+
+def parse_shard(value):
+    """
+    Parses the value of the --shard argument.
+    :param value: string in INDEX/COUNT format.
+    :return: tuple (shard index, shards count).
+    """
+    try:
+        shard_index, shards_count = [int(part) for part in value.split("/")]
+
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected INDEX/COUNT, got \"{}\".".format(value))
+
+    if not 0 <= shard_index < shards_count:
+        raise argparse.ArgumentTypeError("INDEX must be between 0 and COUNT - 1, got \"{}\".".format(value))
+
+    return shard_index, shards_count
+
+
+parser = argparse.ArgumentParser(description="Infers the age of the faces of a raw crawled dataset.")
+parser.add_argument("source", help="folder/zip location of the processable dataset.")
+parser.add_argument("output_folder", nargs="?", default=None,
+                    help="output dataset folder. A previous run stored in it is resumed.")
+parser.add_argument("--shard", default=None, metavar="INDEX/COUNT", type=parse_shard,
+                    help="process only the elements of the shard INDEX (0-based) out of COUNT shards. Each shard must "
+                         "use its own output folder; merge them afterwards with merge_shards.py.")
+arguments = parser.parse_args()
+
+source = arguments.source
 
-source = sys.argv[1]
+if arguments.shard:
+    shard_index, shards_count = arguments.shard
 
 if not os.path.exists(source):
     print("Given folder/filename does not exist.")
@@ -36,7 +115,14 @@ if os.path.isdir(source): source_type = "DIR"
 else: source_type = "FILE"
 
 
-BACKEND = 'http://192.168.2.110:9095'
+# Hosts running replicas of the same CV services. The requests of each filter are balanced across all of them, and the
+# replicas that fail are ejected until they pass a health check.
+BACKENDS = ['http://192.168.2.110:9095']
+BALANCING_POLICY = POLICY_LATENCY_WEIGHTED
+HEALTH_CHECK_INTERVAL = 10
+
+# Maximum requests in flight to each replica of a service. The actual limit adapts to the latency of the service.
+MAX_CONCURRENCY = 32
 #MAX_FACES = 1
 
 TYPE_MAP = {
@@ -45,7 +131,7 @@ TYPE_MAP = {
 }
 
 def build_api_url(type, method="stream", service_name="default"):
-    return "{}/{}/{}?service={}".format(BACKEND, TYPE_MAP[type], method, service_name)
+    return "{}/{}/{}?service={}".format(BACKENDS[0], TYPE_MAP[type], method, service_name)
 
 def create_temp_folder(name="GUID"):
     """
@@ -82,8 +168,25 @@ else:
     raw_dataset = RawCrawledDataset(folder)
     raw_dataset.import_from_zip(source)
 
-new_folder = create_temp_folder()
+if arguments.output_folder:
+    new_folder = arguments.output_folder
+else:
+    new_folder = create_temp_folder()
+
 age_dataset = GenericImageAgeDataset(new_folder)
+journal = ProcessedJournal(new_folder)
+
+# The journal is flushed only after the dataset is saved, but a run that discarded every element has a journal and no
+# saved dataset; it must be resumed too.
+journal.load()
+
+if age_dataset.is_saved() or len(journal) > 0:
+    print("Resuming previous run stored in \"{}\".".format(new_folder))
+    age_dataset.load_dataset()
+
+response_cache = ResponseCache(RESPONSE_CACHE_FOLDER, max_size=RESPONSE_CACHE_SIZE)
+metrics_exporter = MetricsExporter(os.path.join(new_folder, "metrics.json"), os.path.join(new_folder, "metrics.prom"),
+                                   interval=METRICS_EXPORT_INTERVAL)
 
 try:
     raw_dataset.load_dataset()
@@ -98,7 +201,14 @@ try:
 
     # Let's define the filters:
 
-    face_filter = FaceDetectionFilter(1, build_api_url("face-detection", service_name="mt-gpu-caffe-cnn-face-detection"), min_faces=1)
+    face_filter = FaceDetectionFilter(1, build_api_url("face-detection", service_name="mt-gpu-caffe-cnn-face-detection"), min_faces=1,
+                                      response_cache=response_cache, timeout=REQUEST_TIMEOUT,
+                                      hedge_percentile=HEDGE_PERCENTILE,
+                                      retry_policy=RetryPolicy(MAX_REQUEST_ATTEMPTS),
+                                      failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                                      replica_hosts=BACKENDS, balancing_policy=BALANCING_POLICY,
+                                      health_check_interval=HEALTH_CHECK_INTERVAL, max_concurrency=MAX_CONCURRENCY,
+                                      encoding_policy=DETECTION_ENCODING_POLICY)
 
     image_age_filters = [
         #AgeEstimationFilter(2, build_api_url("face-age-estimation",
@@ -109,7 +219,16 @@ try:
         #                    max_age=99),
         AgeEstimationFilter(6, build_api_url("face-age-estimation",
                                              service_name="gpu-cnn-levi-hassner-age-estimation"), min_age=0,
-                            max_age=99),
+                            max_age=99,
+                            batch_api_url=build_api_url("face-age-estimation", method="batch",
+                                                        service_name="gpu-cnn-levi-hassner-age-estimation")
+                            if BATCH_REQUESTS else None,
+                            max_batch_size=MAX_BATCH_SIZE, response_cache=response_cache, timeout=REQUEST_TIMEOUT,
+                            hedge_percentile=HEDGE_PERCENTILE, retry_policy=RetryPolicy(MAX_REQUEST_ATTEMPTS),
+                            failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT,
+                            replica_hosts=BACKENDS, balancing_policy=BALANCING_POLICY,
+                            health_check_interval=HEALTH_CHECK_INTERVAL, max_concurrency=MAX_CONCURRENCY,
+                            encoding_policy=AGE_ENCODING_POLICY),
     ]
 
     translate_dict1 = {
@@ -184,122 +303,44 @@ try:
                                          translate_dict=translate_dict2)
     ]
 
+    search_keywords_filters[0].set_name("search-keywords-years-old")
+    text_age_filters[0].set_name("text-years-old")
+    text_age_filters[1].set_name("text-baby-years-old")
+    text_age_filters[2].set_name("text-years-old-baby")
+    text_age_filters[3].set_name("text-birthday")
+
     image_multifilter = Multifilter(image_age_filters)
     text_multifilter = Multifilter(text_age_filters)
     search_keywords_multifilter = Multifilter(search_keywords_filters)
 
     # Let's process each image.
-    metadata_content = raw_dataset.get_metadata_content()
-
-    iteration = 0
-    size_metadata = len(metadata_content)
-    count = 0
-    for image_hash, data in metadata_content.items():
-        count +=1
-        if not 'metadata' in data:
-
-            print("Element {} hierarchy in the metadata is not correct (does not contain metadata for the image's hash "
-                  "key). May it be a different version of dataset? skipped.".format(image_hash))
-            continue
-
-        metadata = data['metadata']
-        text = Text(content=metadata['desc'])
-        search_keywords_text = Text(content="; ".join(metadata['searchwords']))
-        print(text.get_content())
-        print(search_keywords_text.get_content())
-
-        if not 'uri' in metadata:
-
-            print("Element's {} metadata does not reference any URI. May it be a different version of dataset? "
-                  "skipped.".format(image_hash))
-            continue
+    age_inference_pipeline = AgeInferencePipeline(face_filter, text_multifilter, search_keywords_multifilter,
+                                                  image_multifilter, age_dataset, folder,
+                                                  max_image_size=MAX_IMAGE_SIZE, age_grouping_size=AGE_GROUPING_SIZE,
+                                                  expected_age_range=EXPECTED_AGE_RANGE,
+                                                  save_batch_amount=SAVE_BATCH_AMMOUNT, workers=PIPELINE_WORKERS,
+                                                  journal=journal, deferred_rounds=DEFERRED_ROUNDS,
+                                                  deferred_delay=CIRCUIT_RESET_TIMEOUT,
+                                                  crop_from_source=CROP_FROM_SOURCE,
+                                                  source_face_size=AGE_ENCODING_POLICY.max_size)
 
-        uri = os.path.join(folder, metadata['uri'][0])
-        print("loading {}".format(uri))
-        image = Image(uri)
-        image.load_from_uri()
-
-        if not image.is_loaded():
-            continue
-
-        if image.get_size() > MAX_IMAGE_SIZE:
-            image.resize_to(MAX_IMAGE_SIZE)
-
-        try:
-            (faces_detected, weight, reason, bounding_boxes) = face_filter.apply_to(image)
-
-        except Exception as ex:
-            print("Backend failed for image \"{}\"".format(image.get_uri()))
-            faces_detected = False
-
-        if not faces_detected:
-            print("No faces detected for file {} ({})".format(image_hash, uri))
-            continue
-
-        print("Detected {} faces in {} ({}): \n{}".format(len(bounding_boxes), image_hash, uri, "\n".join([str(bounding_box) for bounding_box in bounding_boxes])))
-
-        for bounding_box in bounding_boxes:
-
-            bounding_box.expand(0.2)
-            bounding_box.fit_in_size(image.get_size())
-            new_image = image.crop_image(bounding_box, new_uri="None")
-
-            face_age_scores = text_multifilter.apply_to(text) \
-                              + search_keywords_multifilter.apply_to(search_keywords_text) \
-                              + image_multifilter.apply_to(new_image)
-
-            # Let's discard all those scores that didn't pass the filter.
-            face_age_scores = [(passed, weight, reason, age) for (passed, weight, reason, age) in face_age_scores if passed]
-
-            filtered_face_age_scores = [(age, weight) for (result, weight, reason, age) in face_age_scores if result]
-
-            [print(age, "x", weight) for (age, weight) in filtered_face_age_scores]
-
-
-            if len(filtered_face_age_scores) <= 2:
-
-                # Now we need to map the age ranges into a list.
-                ages_list = []
-                for (age, weight) in filtered_face_age_scores:
-                    ages_list += age.get_range() * weight
-
-                reduced_list = AgeEstimationTextInferenceFilter.ivan_algorithm(ages_list)
-
-                age_range = AgeRange(int(min(reduced_list)), int(max(reduced_list)))
-
-                print("Inferred age: {}".format(age_range), end="")
-
-            else:
-                # Bad, only two filters were effective here.
-                # This image is not trustworthy. Let's discard it into the unknown group.
-                age_range=AgeRange(99, 99)
-
-            # Let's fit the inferred age range inside an age group
-            mean_age = age_range.get_mean()
-
-            min_age = int(mean_age / AGE_GROUPING_SIZE) * AGE_GROUPING_SIZE        # This is not equal to "mean_age", they are INTEGERS, not REALS!
-            max_age = min_age + AGE_GROUPING_SIZE-1
-            age_range = AgeRange(min_age, max_age)
-
-            if min_age < EXPECTED_AGE_RANGE.get_range()[0] or max_age > EXPECTED_AGE_RANGE.get_range()[1]:
-                # This is not within the expected age range... let's discard this sample.
-                print("Discarded image as it overpasses expected age range.")
-                continue
-
-            print("; fitted age in group {}".format(age_range))
-
-            new_image.metadata=[age_range]
-            age_dataset.put_image(new_image)
+    metadata_content = raw_dataset.get_metadata_content()
 
-            if iteration % SAVE_BATCH_AMMOUNT == 0:
-                print("[{}%] Saved dataset into \"{}\".".format(round(count/size_metadata * 100, 2), new_folder))
-                age_dataset.save_dataset()
+    if arguments.shard:
+        metadata_content = raw_dataset.get_shard_metadata_content(shard_index, shards_count)
+        print("Processing shard {}/{} ({} elements).".format(shard_index, shards_count, len(metadata_content)))
 
-            iteration += 1
+    metrics_exporter.start()
+    age_inference_pipeline.run(metadata_content)
 
 finally:
+    close_default_executors()
+    close_load_balancers()
+    metrics_exporter.stop()
     print("Saved dataset into \"{}\".".format(new_folder))
     age_dataset.save_dataset()
+    journal.flush()
+    print("Backend response cache: {} hits, {} misses.".format(response_cache.get_hits(), response_cache.get_misses()))
 
     if source_type=="FILE":
         print("Removing temporary folder {}...".format(folder))
@@ -343,7 +384,7 @@ for bounding_box in valid_boxes:
 
 print([str(bounding_box) for bounding_box in valid_boxes])
 
-cropped_images = [image.crop_image(bounding_box, "cropped_face") for bounding_box in valid_boxes]
+cropped_images = [image.crop_image(bounding_box, "cropped_face", copy=False) for bounding_box in valid_boxes]
 
 age_filters = [
     AgeEstimationFilter(12, build_api_url("face-age-estimation", service_name="gpu-cnn-rothe-real-age-estimation"), min_age=0, max_age=99),
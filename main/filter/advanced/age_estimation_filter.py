@@ -1,25 +1,28 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import json
-
-import requests
-
+from main.backend.circuit_breaker import DEFAULT_RESET_TIMEOUT
+from main.backend.load_balancer import POLICY_LEAST_OUTSTANDING
 from main.filter.basic.age_range_filter import AgeRangeFilter, MAX_AGE_VALUE, MAX_RANGE_POSSIBLE
+from main.filter.basic.backend_filter import BackendFilter, DEFAULT_MAX_BATCH_SIZE
 from main.filter.filter import FILTERS_PROTO
-from main.resource.image import Image
+from main.resource.image import Image, DEFAULT_ENCODING_POLICY
 from main.tools.age_range import AgeRange
 
 __author__ = "Ivan de Paz Centeno"
 
 
-class AgeEstimationFilter(AgeRangeFilter):
+class AgeEstimationFilter(BackendFilter, AgeRangeFilter):
     """
     Applies an age estimation filter to an image.
     """
 
     def __init__(self, weight, api_url, age_range_to_cover=None, max_age=MAX_AGE_VALUE, min_age=0,
-                 max_range_distance_value=MAX_RANGE_POSSIBLE, strict_checks=False):
+                 max_range_distance_value=MAX_RANGE_POSSIBLE, strict_checks=False, batch_api_url=None,
+                 max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_batch_wait=0, response_cache=None, timeout=None,
+                 hedge_percentile=None, hedge_api_urls=None, retry_policy=None, failure_threshold=None,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT, replica_hosts=None, balancing_policy=POLICY_LEAST_OUTSTANDING,
+                 health_check_interval=None, max_concurrency=None, encoding_policy=DEFAULT_ENCODING_POLICY):
         """
         Constructor of the age estimation filter.
         :param weight: weight for this face detection filter.
@@ -31,26 +34,36 @@ class AgeEstimationFilter(AgeRangeFilter):
         :param max_range_distance_value: maximum range for the detected age
         :param strict_checks: if set to true, all the subfilters are strict. for example, with true, the age range
         estimated must fit inside the age_range_to_cover *completely*.
+        :param batch_api_url: URL to the batch endpoint of the age estimator.
+        :param max_batch_size: maximum number of images sent in a single batch request.
+        :param max_batch_wait: maximum seconds apply_to() waits for other threads to join its image into a batch.
+        :param response_cache: optional ResponseCache to reuse the responses for already seen images.
+        :param timeout: deadline in seconds for each image. Images that exceed it fail as timed out.
+        :param hedge_percentile: latency percentile of the service after which a slow request is duplicated.
+        :param hedge_api_urls: list of replica URLs to send the duplicated requests to.
+        :param retry_policy: optional RetryPolicy for the requests that fail with transient errors.
+        :param failure_threshold: consecutive failures that open the circuit breaker of the service. None disables it.
+        :param reset_timeout: seconds the circuit breaker stays open before probing the service again.
+        :param replica_hosts: optional list of hosts running replicas of the service, to balance the requests across.
+        :param balancing_policy: POLICY_LEAST_OUTSTANDING or POLICY_LATENCY_WEIGHTED, for the replicas.
+        :param health_check_interval: seconds between health checks of the ejected replicas.
+        :param max_concurrency: maximum requests in flight to the service. The actual limit adapts to its latency.
+        :param encoding_policy: EncodingPolicy the faces are sent with. A maximum size close to the input of the model
+            saves bandwidth without changing the estimation.
         """
         AgeRangeFilter.__init__(self, weight, age_range_to_cover, max_age, min_age,
                  max_range_distance_value, strict_checks)
+        BackendFilter.__init__(self, api_url, batch_api_url, max_batch_size, max_batch_wait, response_cache, timeout,
+                               hedge_percentile, hedge_api_urls, retry_policy, failure_threshold, reset_timeout,
+                               replica_hosts, balancing_policy, health_check_interval, max_concurrency,
+                               encoding_policy)
 
-        self.api_url = api_url
-
-    def apply_to(self, image):
+    def _process_response_json(self, response_json):
         """
-        Applies this filter to the specified image.
-        :param image:
+        Checks the age range of the backend's response.
+        :param response_json: parsed response of the backend for an image.
         :return: True if filter passes. False otherwise.
         """
-
-        response = requests.put(self.api_url, data=image.get_jpeg())
-
-        if response.status_code != 200:
-            raise Exception("Backend ({}) for filtering with {} is returning a bad response!".format(self.api_url,
-                                                                                        AgeEstimationFilter.__name__))
-
-        response_json = json.loads(response.text)
         if 'Age_range' not in response_json:
             raise Exception("This filter does not understand backend's language. It may be a different version.")
 
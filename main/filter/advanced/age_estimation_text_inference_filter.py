@@ -5,7 +5,7 @@ import re
 import numpy as np
 
 from main.filter.basic.age_range_filter import AgeRangeFilter, MAX_AGE_VALUE, MAX_RANGE_POSSIBLE
-from main.filter.filter import FILTERS_PROTO
+from main.filter.filter import FILTERS_PROTO, FILTER_KIND_LIGHTWEIGHT
 from main.resource.text import Text
 from main.tools.age_range import AgeRange
 
@@ -185,6 +185,13 @@ class AgeEstimationTextInferenceFilter(AgeRangeFilter):
 
         return passed, self.weight, reason, age_range
 
+    def get_kind(self):
+        """
+        Matching a regular expression against a short text takes less than handing it to a worker.
+        :return: FILTER_KIND_LIGHTWEIGHT.
+        """
+        return FILTER_KIND_LIGHTWEIGHT
+
     def get_type(self):
         return Text
 
@@ -1,26 +1,30 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import json
-
-import requests
 
+from main.backend.circuit_breaker import DEFAULT_RESET_TIMEOUT
+from main.backend.load_balancer import POLICY_LEAST_OUTSTANDING
+from main.filter.basic.backend_filter import BackendFilter, DEFAULT_MAX_BATCH_SIZE
 from main.filter.basic.bounding_box_filter import BoundingBoxFilter, MAX_DETECTIONS_POSSIBLE, MAX_AREA_POSSIBLE
 from main.filter.filter import FILTERS_PROTO
-from main.resource.image import Image
+from main.resource.image import Image, DEFAULT_ENCODING_POLICY
 from main.tools.boundingbox import BoundingBox
 
 __author__ = "Ivan de Paz Centeno"
 
 
 
-class FaceDetectionFilter(BoundingBoxFilter):
+class FaceDetectionFilter(BackendFilter, BoundingBoxFilter):
     """
     Applies a face detection filter to an image.
     """
 
     def __init__(self, weight, api_url, should_detect_face=True, face_location=None, min_faces=1,
                  max_faces=MAX_DETECTIONS_POSSIBLE, min_boundingbox_area=1, max_boundingbox_area=MAX_AREA_POSSIBLE,
-                 strict_checks=False):
+                 strict_checks=False, batch_api_url=None, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_batch_wait=0,
+                 response_cache=None, timeout=None, hedge_percentile=None, hedge_api_urls=None, retry_policy=None,
+                 failure_threshold=None, reset_timeout=DEFAULT_RESET_TIMEOUT, replica_hosts=None,
+                 balancing_policy=POLICY_LEAST_OUTSTANDING, health_check_interval=None, max_concurrency=None,
+                 encoding_policy=DEFAULT_ENCODING_POLICY):
         """
         Constructor of the face detection filter
         :param weight: weight for this face detection filter.
@@ -32,36 +36,69 @@ class FaceDetectionFilter(BoundingBoxFilter):
         :param min_faces: number of faces to pass the filter.
         :param min_boundingbox_area: minimum area of the bounding boxes to pass the filter. If there's at least one
         :param max_boundingbox_area: maximum area of the bounding boxes to pass the filter.
+        :param batch_api_url: URL to the batch endpoint of the face detector.
+        :param max_batch_size: maximum number of images sent in a single batch request.
+        :param max_batch_wait: maximum seconds apply_to() waits for other threads to join its image into a batch.
+        :param response_cache: optional ResponseCache to reuse the responses for already seen images.
+        :param timeout: deadline in seconds for each image. Images that exceed it fail as timed out.
+        :param hedge_percentile: latency percentile of the service after which a slow request is duplicated.
+        :param hedge_api_urls: list of replica URLs to send the duplicated requests to.
+        :param retry_policy: optional RetryPolicy for the requests that fail with transient errors.
+        :param failure_threshold: consecutive failures that open the circuit breaker of the service. None disables it.
+        :param reset_timeout: seconds the circuit breaker stays open before probing the service again.
+        :param replica_hosts: optional list of hosts running replicas of the service, to balance the requests across.
+        :param balancing_policy: POLICY_LEAST_OUTSTANDING or POLICY_LATENCY_WEIGHTED, for the replicas.
+        :param health_check_interval: seconds between health checks of the ejected replicas.
+        :param max_concurrency: maximum requests in flight to the service. The actual limit adapts to its latency.
+        :param encoding_policy: EncodingPolicy the images are sent with. A policy with a maximum size (and optionally in
+            gray scale) sends a smaller proxy of each image; the bounding boxes found in it are scaled back to the
+            coordinates of the image.
         """
         BoundingBoxFilter.__init__(self, weight, should_detect_face, face_location, min_faces, max_faces,
                                    min_boundingbox_area, max_boundingbox_area, strict_checks)
+        BackendFilter.__init__(self, api_url, batch_api_url, max_batch_size, max_batch_wait, response_cache, timeout,
+                               hedge_percentile, hedge_api_urls, retry_policy, failure_threshold, reset_timeout,
+                               replica_hosts, balancing_policy, health_check_interval, max_concurrency,
+                               encoding_policy)
 
-        self.api_url = api_url
-
-    def apply_to(self, image):
+    def _process_image_response(self, image, response_json):
         """
-        Applies this filter to the specified image.
-        :param image:
+        Checks the bounding boxes of the backend's response, once scaled from the encoded image to the image.
+        :param image: image the response belongs to.
+        :param response_json: parsed response of the backend for the image.
         :return: True if filter passes. False otherwise.
         """
+        bounding_boxes = self._parse_bounding_boxes(response_json)
 
-        response = requests.put(self.api_url, data=image.get_jpeg())
+        if image.is_loaded():
+            width, height = image.get_size()
+            encoded_width, encoded_height = self.encoding_policy.get_encoded_size(image.get_size())
 
-        if response.status_code != 200:
-            raise Exception("Backend ({}) for filtering with {} is returning a bad response({} - {})!".format(self.api_url,
-                                                                                        FaceDetectionFilter.__name__,
-                                                                                                 response.status_code,
-                                                                                                      response.text))
+            if (encoded_width, encoded_height) != (width, height):
+                for bounding_box in bounding_boxes:
+                    bounding_box.scale(width / encoded_width, height / encoded_height)
 
-        response_json = json.loads(response.text)
+        return self._bboxes_check_filter(bounding_boxes)
 
+    def _process_response_json(self, response_json):
+        """
+        Checks the bounding boxes of the backend's response.
+        :param response_json: parsed response of the backend for an image.
+        :return: True if filter passes. False otherwise.
+        """
+        return self._bboxes_check_filter(self._parse_bounding_boxes(response_json))
+
+    @staticmethod
+    def _parse_bounding_boxes(response_json):
+        """
+        :param response_json: parsed response of the backend for an image.
+        :return: list of the bounding boxes of the response.
+        """
         if 'bounding_boxes' not in response_json:
             raise Exception("This filter does not understand backend language. It may be a different version.")
 
-        bounding_boxes = [ BoundingBox.from_string(bbox_string)
-                           for bbox_string in response_json['bounding_boxes'] ]
-
-        return self._bboxes_check_filter(bounding_boxes)
+        return [ BoundingBox.from_string(bbox_string)
+                 for bbox_string in response_json['bounding_boxes'] ]
 
     def get_type(self):
         return Image
@@ -0,0 +1,758 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import abc
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from main.backend.async_client import get_default_client
+from main.backend.batch_collector import get_batch_collector
+from main.backend.circuit_breaker import get_circuit_breaker, CircuitOpenError, DEFAULT_RESET_TIMEOUT
+from main.backend.concurrency_limiter import get_concurrency_limiter, ConcurrencyLimitTimeout
+from main.backend.latency_tracker import get_latency_tracker
+from main.backend.load_balancer import get_load_balancer, replace_host, POLICY_LEAST_OUTSTANDING
+from main.backend.session_pool import get_session_pool, SessionPool
+from main.filter.filter import FILTER_KIND_IO_BOUND
+from main.resource.image import DEFAULT_ENCODING_POLICY
+
+__author__ = "Ivan de Paz Centeno"
+
+
+DEFAULT_MAX_BATCH_SIZE = 16
+
+# Reason of the scores of the requests that exceeded their deadline.
+TIMED_OUT_REASON = "Timed out"
+
+# Hedged requests are not sent until this amount of latencies has been observed for the service.
+HEDGE_MIN_SAMPLES = 20
+
+REQUEST_EXECUTOR_WORKERS = 32
+
+# Errors that do not depend on the request, so sending it again may succeed.
+TIMEOUT_ERRORS = (TimeoutError, concurrent.futures.TimeoutError, requests.exceptions.Timeout, asyncio.TimeoutError)
+TRANSIENT_ERRORS = (requests.exceptions.ConnectionError, ConnectionError)
+
+
+class BackendError(Exception):
+    """
+    Raised when a backend answers with an error.
+    """
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+    def __reduce__(self):
+        # Errors raised in pool workers are pickled back to the parent process.
+        return type(self), (str(self), self.status_code)
+
+    def is_transient(self):
+        """
+        :return: True if the error comes from the state of the backend (overloaded, restarting...) rather than from
+            the request.
+        """
+        return self.status_code == 429 or self.status_code >= 500
+
+
+def is_transient_error(error):
+    """
+    Checks if an error of a request comes from the state of the backend, so the same request may succeed later.
+    Timeouts are not included: the deadline of the request is already over.
+    :param error: exception raised by the request.
+    :return: True if the request can be retried.
+    """
+    if isinstance(error, BackendError):
+        return error.is_transient()
+
+    return isinstance(error, TRANSIENT_ERRORS) and not isinstance(error, TIMEOUT_ERRORS)
+
+
+def get_remaining_time(deadline):
+    """
+    Computes the time left to a deadline, to wait for a backend.
+    :param deadline: monotonic time, or None if there is no deadline.
+    :return: seconds left, None if there is no deadline.
+    """
+    if deadline is None:
+        return None
+
+    remaining_time = deadline - time.monotonic()
+
+    if remaining_time <= 0:
+        raise TimeoutError()
+
+    return remaining_time
+
+
+def is_service_failure(error):
+    """
+    Checks if an error of a request is a failure of the service (it is down, overloaded or too slow), as opposed to a
+    problem of the request itself. Requests that timed out waiting for room under the concurrency limit were never sent,
+    so they are not failures of the service.
+    :param error: exception raised by the request.
+    :return: True if the service failed.
+    """
+    if isinstance(error, ConcurrencyLimitTimeout):
+        return False
+
+    return isinstance(error, TIMEOUT_ERRORS) or is_transient_error(error)
+
+
+def is_timed_out(score):
+    """
+    Checks if a filter score comes from a request that exceeded its deadline.
+    :param score: filter score.
+    :return: True if the request timed out, False otherwise.
+    """
+    return score[2].startswith(TIMED_OUT_REASON)
+
+
+_request_executor = None
+_request_executor_lock = threading.Lock()
+
+
+def _get_request_executor():
+    """
+    Retrieves the process-local executor that runs the requests with a deadline, creating it if needed.
+    :return: ThreadPoolExecutor.
+    """
+    global _request_executor
+
+    with _request_executor_lock:
+        if _request_executor is None:
+            _request_executor = concurrent.futures.ThreadPoolExecutor(max_workers=REQUEST_EXECUTOR_WORKERS,
+                                                                      thread_name_prefix="backend-request")
+
+        return _request_executor
+
+
+def _reset_after_fork():
+    """
+    Forgets the executor inherited from the parent process; its threads do not exist in the child.
+    """
+    global _request_executor, _request_executor_lock
+
+    _request_executor = None
+    _request_executor_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class BackendFilter(abc.ABC):
+    """
+    Generic filter backed by a CVMLModulerized service. Inherit this class, before the filter class that checks the
+    results, to filter images through a backend.
+    Subclasses must implement _process_response_json() to turn the response of the backend into a filter score.
+    """
+
+    def __init__(self, api_url, batch_api_url=None, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_batch_wait=0,
+                 response_cache=None, timeout=None, hedge_percentile=None, hedge_api_urls=None, retry_policy=None,
+                 failure_threshold=None, reset_timeout=DEFAULT_RESET_TIMEOUT, replica_hosts=None,
+                 balancing_policy=POLICY_LEAST_OUTSTANDING, health_check_interval=None, max_concurrency=None,
+                 encoding_policy=DEFAULT_ENCODING_POLICY):
+        """
+        Constructor of the backend filter.
+        :param api_url: URL to the service, which processes one image per request.
+        :param batch_api_url: URL to the batch endpoint of the service, which processes several images per request. If
+            not specified, images are always sent one by one.
+        :param max_batch_size: maximum number of images sent in a single batch request.
+        :param max_batch_wait: maximum seconds apply_to() waits for other threads to join its image into a batch
+            request. If set to 0, apply_to() sends a request for its image alone.
+        :param response_cache: optional ResponseCache to store the responses of the backend into. Images already
+            cached are not sent to the backend again.
+        :param timeout: deadline in seconds for each image. When it is exceeded, the score fails with a reason
+            starting with TIMED_OUT_REASON. If not specified, requests wait indefinitely.
+        :param hedge_percentile: if specified, when a single image request has not been answered after this
+            percentile (0-100) of the latencies observed for the service, a duplicate request is sent and the first
+            answer is used.
+        :param hedge_api_urls: list of replica URLs to send the hedged requests to, in turns. If not specified, they
+            are sent to api_url, so they are balanced across the replica hosts if the filter has them.
+        :param retry_policy: optional RetryPolicy for the requests that fail with transient errors (connection errors,
+            5xx and 429 responses). If not specified, failed requests are not retried.
+        :param failure_threshold: if specified, consecutive failed requests that open the circuit breaker of the
+            service. While it is open, requests fail fast with CircuitOpenError.
+        :param reset_timeout: seconds the circuit breaker stays open before probing the service again.
+        :param replica_hosts: optional list of hosts, in "scheme://hostname:port" format, that run replicas of the
+            service. Requests to the host of api_url and batch_api_url are spread across them by a load balancer.
+        :param balancing_policy: POLICY_LEAST_OUTSTANDING or POLICY_LATENCY_WEIGHTED, for the replicas.
+        :param health_check_interval: if specified, seconds between health checks of the ejected replicas. Otherwise,
+            they are re-admitted after their ejection time.
+        :param max_concurrency: if specified, the requests in flight to the service (to each replica of it) are limited
+            by an adaptive limiter, which finds the concurrency the service can take up to this maximum. Only the
+            blocking requests are limited; the asynchronous client has its own limits.
+        :param encoding_policy: EncodingPolicy the images are sent with. Filters with the same policy share the
+            encoding of an image. Responses cached with other policies are not reused.
+        """
+        if hedge_api_urls is None:
+            hedge_api_urls = []
+
+        self.api_url = api_url
+        self.batch_api_url = batch_api_url
+        self.max_batch_size = max_batch_size
+        self.max_batch_wait = max_batch_wait
+        self.response_cache = response_cache
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.hedge_api_urls = hedge_api_urls
+        self.hedges_count = 0
+        self.retry_policy = retry_policy
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.replica_hosts = replica_hosts
+        self.balancing_policy = balancing_policy
+        self.health_check_interval = health_check_interval
+        self.max_concurrency = max_concurrency
+        self.encoding_policy = encoding_policy
+        # Identifies the batch collector of the filter. The images of a batch are sent with the timeout, the retries
+        # and the metrics of the filter that processes it, so each filter (and its copies in other processes) has its
+        # own collector even if it shares the batch URL with other filters.
+        self.batch_collector_token = uuid.uuid4().hex
+
+        if max_concurrency is not None:
+            # Keep alive a connection for each request the limiters may let through to a host.
+            for host in self._get_hosts():
+                get_session_pool().ensure_pool_size(host, max_concurrency)
+
+    def _get_hosts(self):
+        """
+        :return: set of the hosts the filter may send requests to, in "scheme://hostname:port" format.
+        """
+        urls = [self.api_url, self.batch_api_url] + list(self.hedge_api_urls) + list(self.replica_hosts or [])
+
+        return {SessionPool.get_host(url) for url in urls if url}
+
+    def apply_to(self, image):
+        """
+        Applies this filter to the specified image.
+        :param image:
+        :return: True if filter passes. False otherwise.
+        """
+        response_json = self._get_cached_response(image)
+
+        if response_json is None:
+            try:
+                response_json = self._request(image)
+
+            except TIMEOUT_ERRORS:
+                return self._build_timed_out_score()
+
+            self._cache_response(image, response_json)
+
+        return self._process_image_response(image, response_json)
+
+    def apply_to_list(self, image_list):
+        """
+        Applies this filter to the specified list of images. If the filter has a batch URL, images are sent in batches
+        of max_batch_size.
+        :param image_list: list of images.
+        :return: list of filter scores, one for each image.
+        """
+        if not self.batch_api_url:
+            return [self.apply_to(image) for image in image_list]
+
+        response_jsons = [self._get_cached_response(image) for image in image_list]
+        missing_indexes = [index for index, response_json in enumerate(response_jsons) if response_json is None]
+
+        for batch_start in range(0, len(missing_indexes), self.max_batch_size):
+            batch_indexes = missing_indexes[batch_start:batch_start + self.max_batch_size]
+            jpegs = [image_list[index].encode(self.encoding_policy) for index in batch_indexes]
+            self.get_metrics().add_bytes_uploaded(sum([len(jpeg) for jpeg in jpegs]))
+
+            try:
+                batch_response_jsons = self._call_backend(self._send_batch_to_replica, jpegs)
+
+            except TIMEOUT_ERRORS:
+                # Their response stays None; they are scored as timed out.
+                continue
+
+            for index, response_json in zip(batch_indexes, batch_response_jsons):
+                response_jsons[index] = response_json
+                self._cache_response(image_list[index], response_json)
+
+        return [self._build_timed_out_score() if response_json is None else
+                self._process_image_response(image, response_json)
+                for image, response_json in zip(image_list, response_jsons)]
+
+    async def apply_to_async(self, image, client=None):
+        """
+        Applies this filter to the specified image without blocking the event loop.
+        :param image:
+        :param client: AsyncBackendClient to send the request with. If not specified, the default client is used.
+        :return: True if filter passes. False otherwise.
+        """
+        response_json = self._get_cached_response(image)
+
+        if response_json is None:
+            if client is None:
+                client = get_default_client()
+
+            jpeg = image.encode(self.encoding_policy)
+            self.get_metrics().add_bytes_uploaded(len(jpeg))
+
+            async def put(deadline):
+                with self._route(self.api_url) as api_url:
+                    status_code, text = await asyncio.wait_for(client.put(api_url, jpeg),
+                                                               get_remaining_time(deadline))
+                    return self._parse_response(status_code, text)
+
+            try:
+                response_json = await self._call_backend_async(put)
+
+            except TIMEOUT_ERRORS:
+                return self._build_timed_out_score()
+
+            self._cache_response(image, response_json)
+
+        return self._process_image_response(image, response_json)
+
+    def _request(self, image):
+        """
+        Sends the image to the backend, joining it into a batch if the filter is configured to do so.
+        :param image: image to send.
+        :return: JSON response of the backend for the image.
+        """
+        jpeg = image.encode(self.encoding_policy)
+        self.get_metrics().add_bytes_uploaded(len(jpeg))
+
+        if self.batch_api_url and self.max_batch_wait > 0:
+            collector = get_batch_collector((self.batch_api_url, self.batch_collector_token),
+                                            functools.partial(self._call_backend, self._send_batch_to_replica),
+                                            self.max_batch_size, self.max_batch_wait)
+            return collector.submit(jpeg)
+
+        if self.timeout is None and self.hedge_percentile is None:
+            return self._call_backend(self._put, self.api_url, jpeg)
+
+        return self._call_backend(self._put_with_deadline, jpeg)
+
+    def _call_backend(self, function, *args):
+        """
+        Calls a function that sends a request to the backend, through the circuit breaker of the service and retrying
+        it on transient errors as the filter is configured to. The timeout of the filter is a single deadline for all
+        the attempts: no retry is started once it is over.
+        :param function: function that sends the request. It receives the deadline as a keyword argument, after the
+            rest of the arguments.
+        :return: result of the function.
+        """
+        deadline = self._get_deadline()
+
+        def attempt():
+            self._check_circuit()
+
+            try:
+                result = function(*args, deadline=deadline)
+
+            except Exception as ex:
+                self._record_outcome(ex)
+                raise
+
+            except BaseException:
+                # Cancelled or interrupted: the outcome of the request is unknown.
+                self._cancel_probe()
+                raise
+
+            self._record_outcome(None)
+
+            return result
+
+        if self.retry_policy is None:
+            return attempt()
+
+        return self.retry_policy.call(attempt, is_transient_error, on_retry=self._on_retry, deadline=deadline)
+
+    async def _call_backend_async(self, coroutine_function):
+        """
+        Same as _call_backend(), for a coroutine function that sends a request to the backend.
+        :param coroutine_function: coroutine function that sends the request. It receives the deadline.
+        :return: result of the coroutine.
+        """
+        deadline = self._get_deadline()
+
+        async def attempt():
+            self._check_circuit()
+
+            try:
+                result = await coroutine_function(deadline)
+
+            except Exception as ex:
+                self._record_outcome(ex)
+                raise
+
+            except BaseException:
+                # Cancelled or interrupted: the outcome of the request is unknown.
+                self._cancel_probe()
+                raise
+
+            self._record_outcome(None)
+
+            return result
+
+        if self.retry_policy is None:
+            return await attempt()
+
+        return await self.retry_policy.call_async(attempt, is_transient_error, on_retry=self._on_retry,
+                                                  deadline=deadline)
+
+    def _get_deadline(self):
+        """
+        :return: monotonic time an image sent now must be answered by, None if the filter has no timeout.
+        """
+        if self.timeout is None:
+            return None
+
+        return time.monotonic() + self.timeout
+
+    def _get_circuit_breaker(self):
+        """
+        :return: the circuit breaker of the service in this process, None if the filter has none.
+        """
+        if self.failure_threshold is None:
+            return None
+
+        return get_circuit_breaker(self.api_url, self.failure_threshold, self.reset_timeout)
+
+    def _check_circuit(self):
+        """
+        Fails fast if the circuit of the service is open.
+        """
+        circuit_breaker = self._get_circuit_breaker()
+
+        if circuit_breaker is not None and not circuit_breaker.allow_request():
+            self.get_metrics().add_rejected_request()
+            raise CircuitOpenError("Circuit of the backend ({}) is open after {} consecutive failures.".format(
+                self.api_url, circuit_breaker.failures_count))
+
+    def _cancel_probe(self):
+        """
+        Gives the probe of the half-open circuit of the service back, for a request that did not reach the service.
+        """
+        circuit_breaker = self._get_circuit_breaker()
+
+        if circuit_breaker is not None:
+            circuit_breaker.cancel_probe()
+
+    def _record_outcome(self, error):
+        """
+        Feeds the circuit breaker of the service with the outcome of a request. Only timeouts and transient errors
+        count as failures; any other answer proves the service is up. Requests that were never sent are not recorded,
+        but if one was the probe of the half-open circuit, the next request probes the service instead.
+        :param error: exception raised by the request, None if it succeeded.
+        """
+        if isinstance(error, ConcurrencyLimitTimeout):
+            self._cancel_probe()
+            return
+
+        circuit_breaker = self._get_circuit_breaker()
+
+        if circuit_breaker is None:
+            return
+
+        if error is not None and is_service_failure(error):
+            circuit_breaker.record_failure()
+
+        else:
+            circuit_breaker.record_success()
+
+    def _on_retry(self, error):
+        """
+        Called before a request is retried.
+        :param error: exception raised by the failed attempt.
+        """
+        print("Retrying request to backend ({}) after error: {}".format(self.api_url, error))
+        self.get_metrics().add_retry()
+
+    def _put(self, api_url, jpeg, deadline=None):
+        """
+        Sends a single image to the service and waits for its response.
+        :param api_url: URL of the service or of one of its replicas.
+        :param jpeg: JPEG content of the image.
+        :param deadline: monotonic time to give up waiting for the backend at. If not specified, waits indefinitely.
+        :return: JSON response of the backend for the image.
+        """
+        with self._hold_replica(api_url, deadline) as api_url:
+            start_time = time.perf_counter()
+            response = get_session_pool().put(api_url, jpeg, timeout=get_remaining_time(deadline))
+            response_json = self._parse_response(response.status_code, response.text)
+
+        get_latency_tracker(self.api_url).observe(time.perf_counter() - start_time)
+
+        return response_json
+
+    def _send_batch_to_replica(self, jpegs, deadline=None):
+        """
+        Sends a set of JPEG images to the batch endpoint of the service, in the replica picked by the load balancer.
+        :param jpegs: list of JPEG binary contents.
+        :param deadline: monotonic time to give up waiting for the backend at. If not specified, waits indefinitely.
+        :return: list of the JSON responses, one for each image.
+        """
+        with self._hold_replica(self.batch_api_url, deadline) as batch_api_url:
+            return self._send_batch(batch_api_url, jpegs, get_remaining_time(deadline), self.encoding_policy)
+
+    def _route(self, url):
+        """
+        Points a URL of the service to one of its replicas, if the filter has them. URLs to other hosts, like the
+        explicit hedge URLs, are not touched.
+        :param url: URL of the service.
+        :return: context manager that gives the URL to send the request to.
+        """
+        load_balancer = self._get_load_balancer(url)
+
+        if load_balancer is None:
+            return contextlib.nullcontext(url)
+
+        return load_balancer.route(url)
+
+    @contextlib.contextmanager
+    def _hold_replica(self, url, deadline=None):
+        """
+        Points a URL of the service to one of its replicas, like _route(), and holds a slot of the concurrency limiter
+        of the replica while the request is in flight. The wait for the slot is not part of the request: the latency
+        recorded for the replica starts once the slot is taken, and if no slot frees up in time the replica is released
+        without recording anything about it.
+        :param url: URL of the service.
+        :param deadline: monotonic time to give up waiting for the slot at. If not specified, waits indefinitely.
+        :return: context manager that gives the URL to send the request to.
+        """
+        load_balancer = self._get_load_balancer(url)
+        host = None if load_balancer is None else load_balancer.acquire()
+        sent = False
+
+        try:
+            with self._limit_concurrency(url if host is None else replace_host(url, host), deadline):
+                sent = True
+                start_time = time.perf_counter()
+
+                try:
+                    yield url if host is None else replace_host(url, host)
+
+                except Exception as ex:
+                    if host is not None:
+                        load_balancer.release(host, failed=is_service_failure(ex))
+
+                    raise
+
+                if host is not None:
+                    load_balancer.release(host, time.perf_counter() - start_time)
+
+        finally:
+            if host is not None and not sent:
+                load_balancer.cancel(host)
+
+    def _get_load_balancer(self, url):
+        """
+        :param url: URL of the service.
+        :return: load balancer of the replicas of the service, None if the filter has no replicas or the URL points to
+            another host.
+        """
+        if not self.replica_hosts or SessionPool.get_host(url) != SessionPool.get_host(self.api_url):
+            return None
+
+        return get_load_balancer(self.api_url, self.replica_hosts, policy=self.balancing_policy,
+                                 is_failure=is_service_failure, health_check_interval=self.health_check_interval)
+
+    def _limit_concurrency(self, url, deadline=None):
+        """
+        Holds a slot of the adaptive concurrency limiter of the service in the host of the URL, if the filter limits
+        the concurrency. Single and batch requests to the same host share the limiter.
+        :param url: URL the request is sent to.
+        :param deadline: monotonic time to give up waiting for the slot at. If not specified, waits indefinitely.
+        :return: context manager that holds the slot while the request is in flight.
+        """
+        if self.max_concurrency is None:
+            return contextlib.nullcontext()
+
+        limiter = get_concurrency_limiter(replace_host(self.api_url, SessionPool.get_host(url)),
+                                          max_limit=self.max_concurrency, is_failure=is_service_failure)
+
+        return limiter.limit_request(get_remaining_time(deadline))
+
+    def _put_with_deadline(self, jpeg, deadline=None):
+        """
+        Sends a single image to the service, giving up when the deadline is exceeded. If the filter hedges requests,
+        a duplicate is sent when the first one is slower than the hedge percentile, and the first answer is used.
+        :param jpeg: JPEG content of the image.
+        :param deadline: monotonic time to give up at. If not specified, waits indefinitely.
+        :return: JSON response of the backend for the image.
+        """
+        executor = _get_request_executor()
+        futures = [executor.submit(self._put, self.api_url, jpeg, deadline)]
+        hedge_delay = self._get_hedge_delay()
+
+        if hedge_delay is not None and (deadline is None or time.monotonic() + hedge_delay < deadline):
+            done, _ = concurrent.futures.wait(futures, timeout=hedge_delay)
+
+            if not done:
+                futures.append(executor.submit(self._put, self._get_hedge_api_url(), jpeg, deadline))
+
+        pending = set(futures)
+        error = None
+
+        while pending:
+            remaining_time = None if deadline is None else max(deadline - time.monotonic(), 0)
+            done, pending = concurrent.futures.wait(pending, timeout=remaining_time,
+                                                    return_when=concurrent.futures.FIRST_COMPLETED)
+
+            if not done:
+                raise TimeoutError()
+
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+
+                error = future.exception()
+
+        raise error
+
+    def _get_hedge_delay(self):
+        """
+        :return: seconds to wait before hedging a request, None if it must not be hedged.
+        """
+        if self.hedge_percentile is None:
+            return None
+
+        latency_tracker = get_latency_tracker(self.api_url)
+
+        if len(latency_tracker) < HEDGE_MIN_SAMPLES:
+            return None
+
+        return latency_tracker.get_percentile(self.hedge_percentile)
+
+    def _get_hedge_api_url(self):
+        """
+        :return: URL to send the next hedged request to.
+        """
+        self.hedges_count += 1
+        self.get_metrics().add_hedged_request()
+
+        if not self.hedge_api_urls:
+            return self.api_url
+
+        return self.hedge_api_urls[self.hedges_count % len(self.hedge_api_urls)]
+
+    def _build_timed_out_score(self):
+        """
+        Builds the score of an image whose request exceeded its deadline.
+        :return: failed filter score.
+        """
+        self.get_metrics().add_timeout()
+
+        return False, self.weight, "{} after {} seconds.".format(TIMED_OUT_REASON, self.timeout), None
+
+    def _get_cached_response(self, image):
+        """
+        Retrieves the cached response of the backend for the image.
+        :param image: image to retrieve the response for.
+        :return: JSON response, None if it is not cached or the filter has no cache.
+        """
+        if self.response_cache is None:
+            return None
+
+        return self.response_cache.get(self.response_cache.get_image_hash(image), self._get_cache_url())
+
+    def _cache_response(self, image, response_json):
+        """
+        Stores the response of the backend for the image, if the filter has a cache.
+        :param image: image the response belongs to.
+        :param response_json: JSON response of the backend.
+        """
+        if self.response_cache is not None:
+            self.response_cache.put(self.response_cache.get_image_hash(image), self._get_cache_url(), response_json)
+
+    def _get_cache_url(self):
+        """
+        :return: URL the responses of this filter are cached by. It includes the encoding policy when it is not the
+            default one, since the responses may differ for images encoded differently.
+        """
+        if self.encoding_policy == DEFAULT_ENCODING_POLICY:
+            return self.api_url
+
+        return "{}|{}".format(self.api_url, self.encoding_policy)
+
+    @staticmethod
+    def _send_batch(batch_api_url, jpegs, timeout=None, encoding_policy=DEFAULT_ENCODING_POLICY):
+        """
+        Sends a set of encoded images to the batch endpoint of a service in a single multipart request.
+        The backend answers with {"results": [...]}, holding the response of each image in the same order.
+        :param batch_api_url: URL to the batch endpoint.
+        :param jpegs: list of binary contents of the images.
+        :param timeout: seconds to wait for the backend. If not specified, waits indefinitely.
+        :param encoding_policy: EncodingPolicy the images were encoded with.
+        :return: list of the JSON responses, one for each image.
+        """
+        files = [("images", ("{}{}".format(index, encoding_policy.image_format), jpeg,
+                             encoding_policy.get_mime_type())) for index, jpeg in enumerate(jpegs)]
+
+        response = get_session_pool().put(batch_api_url, None, files=files, timeout=timeout)
+
+        if response.status_code != 200:
+            raise BackendError("Backend ({}) for batch filtering is returning a bad response({} - {})!".format(
+                batch_api_url, response.status_code, response.text), response.status_code)
+
+        response_json = json.loads(response.text)
+
+        if 'results' not in response_json or len(response_json['results']) != len(jpegs):
+            raise Exception("Backend ({}) returned a batch response that does not match the {} images "
+                            "sent.".format(batch_api_url, len(jpegs)))
+
+        return response_json['results']
+
+    def _parse_response(self, status_code, text):
+        """
+        Checks and parses the response of the backend for a single image.
+        :param status_code: HTTP status code of the response.
+        :param text: body of the response.
+        :return: parsed JSON response.
+        """
+        if status_code != 200:
+            raise BackendError("Backend ({}) for filtering with {} is returning a bad response({} - {})!".format(
+                self.api_url, type(self).__name__, status_code, text), status_code)
+
+        return json.loads(text)
+
+    def _get_default_name(self):
+        """
+        Backend filters are named after the service they request, when the URL specifies it.
+        :return: default name of the filter.
+        """
+        services = parse_qs(urlparse(self.api_url).query).get("service")
+
+        if services:
+            return "{}[{}]".format(type(self).__name__, services[0])
+
+        return "{}[{}]".format(type(self).__name__, self.api_url)
+
+    def get_kind(self):
+        """
+        Backend filters spend their time waiting for the service.
+        :return: FILTER_KIND_IO_BOUND.
+        """
+        return FILTER_KIND_IO_BOUND
+
+    def _process_image_response(self, image, response_json):
+        """
+        Turns the JSON response of the backend for an image into a filter score. Filters whose responses depend on how
+        the image was encoded, like the ones with coordinates, override it to map them back to the image.
+        :param image: image the response belongs to.
+        :param response_json: parsed response of the backend.
+        :return: filter score.
+        """
+        return self._process_response_json(response_json)
+
+    @abc.abstractmethod
+    def _process_response_json(self, response_json):
+        """
+        Turns the JSON response of the backend for an image into a filter score.
+        :param response_json: parsed response of the backend.
+        :return: filter score.
+        """
@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import abc
+import concurrent.futures
+import functools
+import os
+import pickle
+import threading
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker
+
+from main.filter.filter import FILTER_KIND_CPU_BOUND, FILTER_KIND_IO_BOUND, FILTER_KIND_LIGHTWEIGHT
+from main.metrics.metrics_registry import get_metrics_registry
+from main.resource.shared_image import share_resource, attach_resource
+
+__author__ = "Ivan de Paz Centeno"
+
+
+# Threads of the default executor of the I/O bound filters. They spend most of their time waiting for backends.
+DEFAULT_THREAD_WORKERS = 32
+
+
+# Filters installed in this process, when it is a worker of a ProcessExecutor, by their token.
+_installed_filters = {}
+
+_filter_tokens_lock = threading.Lock()
+
+
+class InstalledFilter(object):
+    """
+    Reference to a filter installed in the workers of a ProcessExecutor. It is sent in place of the filter, so the
+    filter is not pickled for each call.
+    """
+
+    def __init__(self, filter_token):
+        self.filter_token = filter_token
+
+
+def _get_filter_token(_filter):
+    """
+    Retrieves the token that identifies a filter in the workers of the ProcessExecutors, assigning it the first time.
+    Unlike id(), it is never reused by another filter.
+    :param _filter: filter to retrieve the token of.
+    :return: token string.
+    """
+    with _filter_tokens_lock:
+        if getattr(_filter, "executor_token", None) is None:
+            _filter.executor_token = uuid.uuid4().hex
+
+        return _filter.executor_token
+
+
+def _install_filters(pickled_filters):
+    """
+    Initializer of the workers of a ProcessExecutor.
+    :param pickled_filters: pickled dictionary with {filter_token: filter} format.
+    """
+    _installed_filters.clear()
+    _installed_filters.update(pickle.loads(pickled_filters))
+
+
+def _call_in_worker(function, args):
+    """
+    Multiprocessed function that calls a function in a worker of a ProcessExecutor.
+    :param function: picklable function to call.
+    :param args: arguments of the function. InstalledFilter references among them are replaced by their filters, and
+        SharedImage handles are attached as images for the call.
+    :return: tuple (result, snapshot of the metrics recorded by the worker since its previous task).
+    """
+    args = [_installed_filters[arg.filter_token] if isinstance(arg, InstalledFilter) else arg for arg in args]
+    attached_args = [attach_resource(arg) for arg in args]
+
+    try:
+        result = function(*[arg for arg, _ in attached_args])
+
+    finally:
+        handles = [handle for _, arg_handles in attached_args for handle in arg_handles]
+        del attached_args
+
+        for handle in handles:
+            handle.detach()
+
+    return result, get_metrics_registry().pop_snapshot()
+
+
+class FilterExecutor(abc.ABC):
+    """
+    Runs the filters of a multifilter. Submitted calls return concurrent.futures.Future objects, whatever the way they
+    are run. Executors must be closed once they are no longer needed; they can be used as context managers for that.
+    """
+
+    @abc.abstractmethod
+    def submit(self, function, *args):
+        """
+        Schedules a call.
+        :param function: function to call. Executors that run it in other processes require it to be picklable.
+        :param args: arguments of the function.
+        :return: Future of the result of the call.
+        """
+
+    def map(self, function, args_list):
+        """
+        Calls a function with each set of arguments, and waits for all the results.
+        :param function: function to call.
+        :param args_list: list of tuples of arguments.
+        :return: list of the results, in the same order.
+        """
+        futures = [self.submit(function, *args) for args in args_list]
+
+        return [future.result() for future in futures]
+
+    def submit_to_filters(self, function, filter_list, resource):
+        """
+        Schedules a call for each filter of a list, with the same resource.
+        :param function: function to call with each filter and the resource.
+        :param filter_list: list of filters.
+        :param resource: resource, or list of resources, to filter.
+        :return: list of futures of the results, ordered by filter.
+        """
+        return [self.submit(function, _filter, resource) for _filter in filter_list]
+
+    def register_filters(self, filter_list):
+        """
+        Announces the filters that are going to be submitted to this executor, so it can prepare them in advance.
+        :param filter_list: list of filters.
+        """
+        pass
+
+    def close(self):
+        """
+        Waits for the scheduled calls and releases the workers of the executor.
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class InlineExecutor(FilterExecutor):
+    """
+    Runs each call right away in the calling thread. For filters so cheap that handing them to a worker costs more
+    than running them.
+    """
+
+    def submit(self, function, *args):
+        future = concurrent.futures.Future()
+
+        try:
+            future.set_result(function(*args))
+
+        except Exception as ex:
+            future.set_exception(ex)
+
+        return future
+
+
+class ThreadExecutor(FilterExecutor):
+    """
+    Runs the calls in a pool of threads of this process. For I/O bound filters, like the ones backed by a service:
+    neither the filters nor the resources need to be pickled, and the metrics are recorded in this process directly.
+    """
+
+    def __init__(self, max_workers=DEFAULT_THREAD_WORKERS):
+        """
+        Initializes the executor.
+        :param max_workers: number of threads.
+        """
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers,
+                                                              thread_name_prefix="filter-executor")
+
+    def submit(self, function, *args):
+        return self.executor.submit(function, *args)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+class ProcessExecutor(FilterExecutor):
+    """
+    Runs the calls in a pool of worker processes. For CPU bound filters, which would hold the GIL in a thread. The
+    functions, the filters and the resources are pickled to the workers, and the metrics recorded by the workers are
+    added to the metrics registry of this process.
+
+    The registered filters are installed in each worker when it starts, and submit_to_filters() only sends a reference
+    to them. Registering a new filter restarts the workers, so filters must be registered before the work begins, and
+    must not change afterwards.
+
+    Optionally, the blobs of the images sent to several filters are placed once in shared memory, and only a handle
+    to them is pickled for each filter. The workers see them as read-only.
+
+    If a worker dies, the calls in flight fail with BrokenProcessPool, and the next calls start a new pool.
+    """
+
+    def __init__(self, processes=None, share_images=False):
+        """
+        Initializes the executor.
+        :param processes: number of worker processes. By default, the number of CPUs.
+        :param share_images: if True, submit_to_filters() hands the blobs of the images to the workers through shared
+            memory, instead of pickling them for each filter.
+        """
+        self.processes = processes
+        self.share_images = share_images
+        self.shared_images = set()
+        self.filters = {}
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def register_filters(self, filter_list):
+        """
+        Installs the filters in the workers, restarting them if any filter is new.
+        :param filter_list: list of filters.
+        """
+        tokens = [_get_filter_token(_filter) for _filter in filter_list]
+
+        with self.lock:
+            new_filters = {token: _filter for token, _filter in zip(tokens, filter_list) if token not in self.filters}
+
+            if not new_filters and self.pool is not None:
+                return
+
+            self.filters.update(new_filters)
+
+            # Calls are submitted under the lock too, so none can reach the previous pool once it is closed.
+            previous_pool = self.pool
+            self.pool = self._create_pool()
+
+            if previous_pool is not None:
+                previous_pool.shutdown(wait=False)
+
+        if previous_pool is not None:
+            previous_pool.shutdown(wait=True)
+
+    def submit(self, function, *args):
+        future = concurrent.futures.Future()
+
+        with self.lock:
+            pool = self._get_pool()
+
+            try:
+                pool_future = pool.submit(_call_in_worker, function, args)
+
+            except BrokenProcessPool:
+                # A worker died before the pool noticed it in a call of its own.
+                self._discard_pool(pool)
+                pool_future = self._get_pool().submit(_call_in_worker, function, args)
+
+        pool_future.add_done_callback(functools.partial(self._on_done, future, pool))
+
+        return future
+
+    def submit_to_filters(self, function, filter_list, resource):
+        with self.lock:
+            filter_list = [InstalledFilter(_filter.executor_token)
+                           if getattr(_filter, "executor_token", None) in self.filters else _filter
+                           for _filter in filter_list]
+
+        if not self.share_images:
+            return super().submit_to_filters(function, filter_list, resource)
+
+        shared_resource, handles = share_resource(resource)
+
+        if not handles:
+            return super().submit_to_filters(function, filter_list, resource)
+
+        with self.lock:
+            self.shared_images.update(handles)
+
+        futures = super().submit_to_filters(function, filter_list, shared_resource)
+        pending_futures = set(futures)
+
+        def on_done(future):
+            with self.lock:
+                pending_futures.discard(future)
+
+                if pending_futures:
+                    return
+
+                self.shared_images.difference_update(handles)
+
+            for handle in handles:
+                handle.release()
+
+        for future in futures:
+            future.add_done_callback(on_done)
+
+        return futures
+
+    def close(self):
+        with self.lock:
+            pool = self.pool
+            self.pool = None
+
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+        # Segments of calls that never finished, like the ones of a pool terminated by an error.
+        with self.lock:
+            handles = list(self.shared_images)
+            self.shared_images.clear()
+
+        for handle in handles:
+            handle.release()
+
+    def _get_pool(self):
+        """
+        The lock must be held.
+        :return: the pool of workers, started if needed.
+        """
+        if self.pool is None:
+            self.pool = self._create_pool()
+
+        return self.pool
+
+    def _create_pool(self):
+        """
+        Starts a pool of workers with the registered filters installed.
+        :return: the pool.
+        """
+        if self.share_images:
+            # Started before the workers, so they inherit it and the segments they attach are not reported as leaked
+            # by a tracker of their own.
+            resource_tracker.ensure_running()
+
+        # Workers are started on demand. The filters are pickled now, so all of them install the filters as they were
+        # registered.
+        return concurrent.futures.ProcessPoolExecutor(max_workers=self.processes, initializer=_install_filters,
+                                                      initargs=(pickle.dumps(self.filters),))
+
+    def _discard_pool(self, pool):
+        """
+        Forgets a broken pool, so the next call starts a new one. The lock must be held.
+        :param pool: broken pool.
+        """
+        if self.pool is pool:
+            self.pool = None
+
+        pool.shutdown(wait=False)
+
+    def _on_done(self, future, pool, pool_future):
+        """
+        Called by the pool when a call finishes, or when it fails because a worker died.
+        :param future: future returned by submit() for the call.
+        :param pool: pool the call was submitted to.
+        :param pool_future: future of the call in the pool.
+        """
+        error = pool_future.exception()
+
+        if error is not None:
+            if isinstance(error, BrokenProcessPool):
+                with self.lock:
+                    self._discard_pool(pool)
+
+            future.set_exception(error)
+            return
+
+        result, snapshot = pool_future.result()
+        get_metrics_registry().merge_snapshot(snapshot)
+        future.set_result(result)
+
+
+def create_executor(kind):
+    """
+    Creates the kind of executor that suits a kind of filter.
+    :param kind: FILTER_KIND_CPU_BOUND, FILTER_KIND_IO_BOUND or FILTER_KIND_LIGHTWEIGHT.
+    :return: a new executor. The caller must close it.
+    """
+    if kind == FILTER_KIND_CPU_BOUND:
+        return ProcessExecutor()
+
+    if kind == FILTER_KIND_IO_BOUND:
+        return ThreadExecutor()
+
+    if kind == FILTER_KIND_LIGHTWEIGHT:
+        return InlineExecutor()
+
+    raise Exception("Unknown filter kind {}.".format(kind))
+
+
+_default_executors = {}
+_default_executors_lock = threading.Lock()
+
+
+def get_default_executor(kind):
+    """
+    Retrieves the process-local executor shared by the filters of a kind, creating it if needed.
+    :param kind: kind of filter.
+    :return: the executor. It is closed by close_default_executors().
+    """
+    with _default_executors_lock:
+        if kind not in _default_executors:
+            _default_executors[kind] = create_executor(kind)
+
+        return _default_executors[kind]
+
+
+def close_default_executors():
+    """
+    Closes the executors shared by the filters of each kind. They are created again if a filter needs them later.
+    """
+    with _default_executors_lock:
+        executors = list(_default_executors.values())
+        _default_executors.clear()
+
+    for executor in executors:
+        executor.close()
+
+
+def _reset_after_fork():
+    """
+    Forgets the executors inherited from the parent process; their workers belong to the parent.
+    """
+    global _default_executors_lock
+
+    _default_executors.clear()
+    _default_executors_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
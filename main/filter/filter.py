@@ -1,10 +1,19 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import time
+
+from main.metrics.metrics_registry import get_metrics_registry, METRICS_FILTER
 from main.resource.resource import Resource
 
 __author__ = "Ivan de Paz Centeno"
 
 
+# Kinds of filters, by the resources their work takes. Multifilters pick the way to run each filter from its kind.
+FILTER_KIND_CPU_BOUND = "cpu-bound"
+FILTER_KIND_IO_BOUND = "io-bound"
+FILTER_KIND_LIGHTWEIGHT = "lightweight"
+
+
 class Filter(object):
     """
     Allows to apply a filter to a resource.
@@ -16,6 +25,7 @@ class Filter(object):
         :param weight: confidence weight for this filter. Useful for inferences.
         """
         self.weight = weight
+        self.name = None
 
     def apply_to(self, resource):
         """
@@ -25,6 +35,81 @@ class Filter(object):
         """
         pass
 
+    def apply_to_list(self, resource_list):
+        """
+        Applies the filter to each resource of the list. Override this method if the filter can process several
+        resources more efficiently at once.
+        :param resource_list: list of resources to filter.
+        :return: list of filter scores, one for each resource.
+        """
+        return [self.apply_to(resource) for resource in resource_list]
+
+    def apply_to_measured(self, resource):
+        """
+        Applies the filter to the resource, recording the call in the metrics registry of the process.
+        :param resource: resource to filter.
+        :return: a filter score.
+        """
+        start_time = time.perf_counter()
+
+        try:
+            score = self.apply_to(resource)
+
+        except Exception:
+            self.get_metrics().observe(time.perf_counter() - start_time, failed=True)
+            raise
+
+        self.get_metrics().observe(time.perf_counter() - start_time, passed=int(bool(score[0])))
+
+        return score
+
+    def apply_to_list_measured(self, resource_list):
+        """
+        Applies the filter to each resource of the list, recording the call in the metrics registry of the process.
+        :param resource_list: list of resources to filter.
+        :return: list of filter scores, one for each resource.
+        """
+        start_time = time.perf_counter()
+
+        try:
+            scores = self.apply_to_list(resource_list)
+
+        except Exception:
+            self.get_metrics().observe(time.perf_counter() - start_time, calls=len(resource_list), failed=True)
+            raise
+
+        self.get_metrics().observe(time.perf_counter() - start_time, calls=len(resource_list),
+                                   passed=sum([1 for score in scores if score[0]]))
+
+        return scores
+
+    def get_metrics(self):
+        """
+        Retrieves the metrics of this filter in the current process.
+        :return: Metrics instance.
+        """
+        return get_metrics_registry().get_metrics(METRICS_FILTER, self.get_name())
+
+    def get_name(self):
+        """
+        Getter for the name of the filter, used to report its metrics.
+        :return: the name set, or one built from the class and the weight if no name was set.
+        """
+        if self.name:
+            return self.name
+
+        return self._get_default_name()
+
+    def set_name(self, name):
+        """
+        Setter for the name of the filter.
+        :param name: name to report the metrics of the filter with.
+        """
+        self.name = name
+
+    def _get_default_name(self):
+        return "{}[{}]".format(type(self).__name__, self.weight)
+
     def get_weight(self):
         """
         getter for the weight
@@ -32,6 +117,13 @@ class Filter(object):
         """
         return self.weight
 
+    def get_kind(self):
+        """
+        Declares the kind of work of this filter. Override this method in filters that are not CPU bound.
+        :return: FILTER_KIND_CPU_BOUND, FILTER_KIND_IO_BOUND or FILTER_KIND_LIGHTWEIGHT.
+        """
+        return FILTER_KIND_CPU_BOUND
+
     def get_type(self):
         """
         Shows the prototype of the type of resource that this filter accepts.
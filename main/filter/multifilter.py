@@ -1,54 +1,158 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+import concurrent.futures
+
+from main.filter.executor import get_default_executor
 from main.filter.filter import Filter
-from multiprocessing import Pool
 
 __author__ = "Ivan de Paz Centeno"
 
 
-def apply_filter(resource_mapped_filter):
+def apply_filter(_filter, resource):
+    """
+    Function run by the executors to apply a given filter to a specified resource.
+    :param _filter: filter to apply.
+    :param resource: resource to filter.
+    :return: score of the filter.
+    """
+    return _filter.apply_to_measured(resource)
+
+
+def apply_filter_to_list(_filter, resource_list):
+    """
+    Function run by the executors to apply a given filter to a specified list of resources.
+    :param _filter: filter to apply.
+    :param resource_list: list of resources to filter.
+    :return: list of scores of the filter.
+    """
+    return _filter.apply_to_list_measured(resource_list)
+
+
+def weighted_majority_decision(scores, pending_filters):
     """
-    Multiprocessed function to apply a given filter to a specified resource.
-    :param resource_mapped_filter:
-    :return:
+    Decision function for the consensus mode of a Multifilter. The outcome is settled when the filters that passed, or
+    the ones that didn't, carry more than half of the total weight.
+    :param scores: scores of the filters that already answered.
+    :param pending_filters: filters that didn't answer yet.
+    :return: True if the pending filters can't change the outcome.
     """
-    _filter = resource_mapped_filter[0]
-    resource = resource_mapped_filter[1]
+    total_weight = sum([weight for (_, weight, _, _) in scores]) + sum([_filter.get_weight()
+                                                                       for _filter in pending_filters])
+    passed_weight = sum([weight for (passed, weight, _, _) in scores if passed])
+    failed_weight = sum([weight for (passed, weight, _, _) in scores if not passed])
 
-    return _filter.apply_to(resource)
+    return passed_weight > total_weight / 2 or failed_weight > total_weight / 2
 
 
 class Multifilter(Filter):
     """
     Wraps a set of filters in order to apply them all together in parallel.
     It is way faster than a list comprehension or a common loop.
+
+    Each filter runs in an executor. By default, the one shared by the filters of its kind (see Filter.get_kind()):
+    CPU bound filters run in a shared pool of processes, I/O bound ones in a shared pool of threads and lightweight ones
+    inline. The metrics of the filters are added to the metrics registry of the calling process.
+
+    In consensus mode (when a decision function is specified), apply_to() returns as soon as the filters that already
+    answered settle the outcome, without waiting for the slower ones.
     """
 
-    def __init__(self, filter_list):
+    def __init__(self, filter_list, decision_function=None, executor=None):
+        """
+        Initializes the multifilter.
+        :param filter_list: list of filters to apply.
+        :param decision_function: optional function that enables the consensus mode. It receives the scores of the
+            filters that already answered and the list of filters that didn't, and returns True when the outcome is
+            settled. See weighted_majority_decision().
+        :param executor: optional FilterExecutor to run all the filters in, instead of the default executor of the kind
+            of each filter. It is owned by the caller, who must close it.
+        """
         super().__init__(0)
 
         if filter_list is None:
             filter_list = []
 
         self.filter_list = filter_list
-        self.pool = Pool(processes=len(self.filter_list))
+        self.decision_function = decision_function
+
+        # Retrieved now, so the workers of the default executors are started before the caller starts its threads.
+        self.executors = [executor if executor is not None else get_default_executor(_filter.get_kind())
+                          for _filter in self.filter_list]
+
+        for executor in self._get_distinct_executors():
+            executor.register_filters(self._get_filters_of(executor))
 
     def apply_to(self, resource):
         """
         Applies the set of filters to the given resource.
         :param resource:
-        :return:
+        :return: list of scores, ordered by filter. In consensus mode, only the scores of the filters that answered
+            before the outcome was settled.
         """
-        resource_mapped_filter_list = [[_filter, resource] for _filter in self.filter_list]
-        result = self.pool.map(apply_filter, resource_mapped_filter_list)
-        return result
+        if self.decision_function is not None:
+            return self._apply_to_until_decided(resource)
+
+        return [future.result() for future in self._submit(apply_filter, resource)]
 
     def apply_to_list(self, resource_list):
         """
-        Applies the set of filters to the specified set of resources.
+        Applies the set of filters to the specified set of resources. Each filter receives the whole list, so filters
+        able to process several resources at once (like batched backend filters) can do it.
         :param resource:
-        :return:
+        :return: list of scores, ordered by filter and then by resource.
+        """
+        return [score for future in self._submit(apply_filter_to_list, resource_list) for score in future.result()]
+
+    def _submit(self, function, resource):
         """
-        resource_mapped_filter_list = [[_filter, resource] for _filter in self.filter_list for resource in resource_list]
-        return self.pool.map(apply_filter, resource_mapped_filter_list)
+        Submits the function for each filter to the executor of the filter. The filters that share an executor are
+        submitted together, so it can hand the resource to its workers once for all of them.
+        :param function: apply_filter() or apply_filter_to_list().
+        :param resource: resource, or list of resources, to filter.
+        :return: list of futures of the scores, ordered by filter.
+        """
+        futures = [None] * len(self.filter_list)
+
+        for executor in self._get_distinct_executors():
+            indexes = [index for index, filter_executor in enumerate(self.executors) if filter_executor is executor]
+            executor_futures = executor.submit_to_filters(function, self._get_filters_of(executor), resource)
+
+            for index, future in zip(indexes, executor_futures):
+                futures[index] = future
+
+        return futures
+
+    def _get_distinct_executors(self):
+        """
+        :return: list of the executors of the filters, without repetitions.
+        """
+        return list({id(executor): executor for executor in self.executors}.values())
+
+    def _get_filters_of(self, executor):
+        """
+        :param executor: executor of some of the filters.
+        :return: list of the filters run in the executor, in their order.
+        """
+        return [_filter for _filter, filter_executor in zip(self.filter_list, self.executors)
+                if filter_executor is executor]
+
+    def _apply_to_until_decided(self, resource):
+        """
+        Applies the set of filters to the given resource, until the decision function settles the outcome. The filters
+        that didn't answer yet are not awaited; their results are ignored when they come.
+        :param resource:
+        :return: list of the scores received, ordered by filter.
+        """
+        futures = self._submit(apply_filter, resource)
+        indexes = {future: index for index, future in enumerate(futures)}
+        scores = {}
+
+        for future in concurrent.futures.as_completed(futures):
+            scores[indexes[future]] = future.result()
+            pending_filters = [_filter for index, _filter in enumerate(self.filter_list) if index not in scores]
+
+            if self.decision_function([scores[index] for index in sorted(scores)], pending_filters):
+                break
+
+        return [scores[index] for index in sorted(scores)]
@@ -0,0 +1,38 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import sys
+
+from main.dataset.generic_image_age_dataset import GenericImageAgeDataset
+
+__author__ = "Ivan de Paz Centeno"
+
+# Merges the datasets written by the shards of a sharded run (entry.py --shard INDEX/COUNT) into a single dataset.
+
+if len(sys.argv) < 3:
+    print("Usage: merge_shards.py OUTPUT_FOLDER SHARD_FOLDER [SHARD_FOLDER ...]")
+    exit(-1)
+
+output_folder = sys.argv[1]
+shard_folders = sys.argv[2:]
+
+shard_datasets = [GenericImageAgeDataset(shard_folder) for shard_folder in shard_folders]
+
+for shard_dataset in shard_datasets:
+    if not shard_dataset.is_saved():
+        print("Shard folder \"{}\" does not contain a dataset.".format(shard_dataset.get_root_folder()))
+        exit(-1)
+
+merged_dataset = GenericImageAgeDataset(output_folder)
+
+if merged_dataset.is_saved():
+    merged_dataset.load_dataset()
+
+for shard_dataset in shard_datasets:
+    shard_dataset.load_dataset()
+
+    imported_count = merged_dataset.import_from_dataset(shard_dataset)
+    print("Merged {} images from \"{}\" ({} already merged).".format(imported_count, shard_dataset.get_root_folder(),
+                                                                    len(shard_dataset.get_keys()) - imported_count))
+
+merged_dataset.save_dataset()
+print("Saved merged dataset into \"{}\" ({} images).".format(output_folder, len(merged_dataset.get_keys())))
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+
+from main.metrics.metrics_registry import get_metrics_registry, Histogram
+
+__author__ = "Ivan de Paz Centeno"
+
+
+DEFAULT_EXPORT_INTERVAL = 60
+PROMETHEUS_PREFIX = "inferencedb"
+
+
+def _escape_label(value):
+    """
+    Escapes a label value for the Prometheus text format.
+    :param value: label value.
+    :return: escaped value.
+    """
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(float(bound))
+
+
+def _split_gauge_name(name):
+    """
+    Splits the name of a gauge of a service, in "gauge[service]" format, so all the services share the metric name.
+    :param name: name of the gauge.
+    :return: tuple (gauge name, service), with None as service if the gauge does not belong to one.
+    """
+    if name.endswith("]") and "[" in name:
+        gauge_name, service = name[:-1].split("[", 1)
+        return gauge_name, service
+
+    return name, None
+
+
+def snapshot_to_prometheus(snapshot):
+    """
+    Converts a snapshot of a metrics registry into the Prometheus text format.
+    :param snapshot: snapshot in the format of MetricsRegistry.get_snapshot().
+    :return: text in Prometheus exposition format.
+    """
+    lines = []
+
+    for kind, metrics_dicts in sorted(snapshot.items()):
+        if kind == 'gauge':
+            continue
+
+        prefix = "{}_{}".format(PROMETHEUS_PREFIX, kind)
+        counters = [("calls_total", "calls", "Resources processed."),
+                    ("passed_total", "passed", "Resources that passed."),
+                    ("errors_total", "errors", "Calls that raised an error."),
+                    ("uploaded_bytes_total", "bytes_uploaded", "Bytes sent to the backend."),
+                    ("timeouts_total", "timeouts", "Resources whose request exceeded its deadline."),
+                    ("hedged_requests_total", "hedged_requests", "Duplicate requests sent to slow backends."),
+                    ("retries_total", "retries", "Requests sent again after a transient error."),
+                    ("rejected_requests_total", "rejected_requests", "Requests rejected by an open circuit.")]
+
+        for metric_name, key, description in counters:
+            lines.append("# HELP {}_{} {}".format(prefix, metric_name, description))
+            lines.append("# TYPE {}_{} counter".format(prefix, metric_name))
+
+            for name, metrics_dict in sorted(metrics_dicts.items()):
+                lines.append("{}_{}{{{}=\"{}\"}} {}".format(prefix, metric_name, kind, _escape_label(name),
+                                                            metrics_dict[key]))
+
+        lines.append("# HELP {}_latency_seconds Latency of the calls.".format(prefix))
+        lines.append("# TYPE {}_latency_seconds histogram".format(prefix))
+
+        for name, metrics_dict in sorted(metrics_dicts.items()):
+            label = "{}=\"{}\"".format(kind, _escape_label(name))
+            histogram = Histogram(metrics_dict['latency']['buckets'])
+            histogram.merge(metrics_dict['latency'])
+
+            for bound, count in histogram.get_cumulative_counts():
+                lines.append("{}_latency_seconds_bucket{{{},le=\"{}\"}} {}".format(prefix, label,
+                                                                                  _format_bound(bound), count))
+
+            lines.append("{}_latency_seconds_sum{{{}}} {}".format(prefix, label, histogram.sum))
+            lines.append("{}_latency_seconds_count{{{}}} {}".format(prefix, label, histogram.count))
+
+    gauge_lines = {}
+
+    for name, value in sorted(snapshot.get('gauge', {}).items()):
+        gauge_name, service = _split_gauge_name(name)
+        metric_name = "{}_{}".format(PROMETHEUS_PREFIX, "".join([character if character.isalnum() else "_"
+                                                                 for character in gauge_name]))
+        label = "" if service is None else "{{service=\"{}\"}}".format(_escape_label(service))
+        gauge_lines.setdefault(metric_name, []).append("{}{} {}".format(metric_name, label, value))
+
+    for metric_name, metric_lines in sorted(gauge_lines.items()):
+        lines.append("# TYPE {} gauge".format(metric_name))
+        lines.extend(metric_lines)
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsExporter(object):
+    """
+    Periodically writes the metrics of a registry to a JSON file and to a Prometheus text format file (to be
+    collected by the node exporter's textfile collector, for example). Files are replaced atomically.
+    """
+
+    def __init__(self, json_file=None, prometheus_file=None, interval=DEFAULT_EXPORT_INTERVAL, registry=None):
+        """
+        Initializes the exporter. It does not export anything until start() or export() are called.
+        :param json_file: file to write the JSON snapshots into. If not specified, JSON is not exported.
+        :param prometheus_file: file to write the Prometheus snapshots into. If not specified, Prometheus text is not
+            exported.
+        :param interval: seconds between two snapshots.
+        :param registry: MetricsRegistry to export. By default, the registry of the current process.
+        """
+        if registry is None:
+            registry = get_metrics_registry()
+
+        self.json_file = json_file
+        self.prometheus_file = prometheus_file
+        self.interval = interval
+        self.registry = registry
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Starts exporting snapshots periodically in a background thread.
+        """
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread and exports a last snapshot.
+        """
+        self.stop_event.set()
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        self.export()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.export()
+
+            except Exception as ex:
+                print("Could not export metrics: {}".format(ex))
+
+    def export(self):
+        """
+        Writes a snapshot of the metrics into the files.
+        """
+        snapshot = self.registry.get_snapshot()
+
+        if self.json_file:
+            self._write(self.json_file, json.dumps(dict(snapshot, timestamp=time.time()), indent=2))
+
+        if self.prometheus_file:
+            self._write(self.prometheus_file, snapshot_to_prometheus(snapshot))
+
+    @staticmethod
+    def _write(filename, content):
+        """
+        Replaces the content of a file atomically, so readers never see a partial snapshot.
+        :param filename: file to write.
+        :param content: text to write.
+        """
+        temp_filename = filename + ".tmp"
+
+        with open(temp_filename, 'w') as file:
+            file.write(content)
+
+        os.replace(temp_filename, filename)
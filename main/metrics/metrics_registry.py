@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+
+__author__ = "Ivan de Paz Centeno"
+
+
+METRICS_FILTER = "filter"
+METRICS_STAGE = "stage"
+
+DEFAULT_LATENCY_BUCKETS = [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+
+class Histogram(object):
+    """
+    Counts observed values in buckets of configurable upper bounds. Values over the last bound fall in an overflow
+    bucket.
+    """
+
+    def __init__(self, buckets=None):
+        """
+        Initializes the histogram.
+        :param buckets: sorted list of the upper bounds of the buckets.
+        """
+        if buckets is None:
+            buckets = DEFAULT_LATENCY_BUCKETS
+
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Adds a value to the histogram.
+        :param value: value observed.
+        """
+        index = 0
+
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, histogram_dict):
+        """
+        Adds the values of another histogram with the same buckets.
+        :param histogram_dict: the other histogram, in the format of to_dict().
+        """
+        self.counts = [count + other_count for count, other_count in zip(self.counts, histogram_dict['counts'])]
+        self.sum += histogram_dict['sum']
+        self.count += histogram_dict['count']
+
+    def get_cumulative_counts(self):
+        """
+        :return: list of (upper_bound, count of values lower or equal than the bound), the last bound being infinite.
+        """
+        cumulative_counts = []
+        cumulative_count = 0
+
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            cumulative_count += count
+            cumulative_counts.append((bound, cumulative_count))
+
+        return cumulative_counts
+
+    def to_dict(self):
+        return {'buckets': list(self.buckets), 'counts': list(self.counts), 'sum': self.sum, 'count': self.count}
+
+
+class Metrics(object):
+    """
+    Metrics of a single filter or stage: how many resources it processed, how many passed, how many calls failed,
+    how many bytes were sent to the backend and how long each call took.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.passed = 0
+        self.errors = 0
+        self.bytes_uploaded = 0
+        self.timeouts = 0
+        self.hedged_requests = 0
+        self.retries = 0
+        self.rejected_requests = 0
+        self.latency = Histogram()
+        self.lock = threading.Lock()
+
+    def observe(self, latency, calls=1, passed=0, failed=False):
+        """
+        Records a call.
+        :param latency: seconds the call took.
+        :param calls: number of resources processed by the call.
+        :param passed: number of resources that passed.
+        :param failed: True if the call raised an error.
+        """
+        with self.lock:
+            self.calls += calls
+            self.passed += passed
+            self.errors += int(failed)
+            self.latency.observe(latency)
+
+    def add_bytes_uploaded(self, bytes_count):
+        """
+        Records data sent to a backend.
+        :param bytes_count: number of bytes sent.
+        """
+        with self.lock:
+            self.bytes_uploaded += bytes_count
+
+    def add_timeout(self):
+        """
+        Records a resource whose request to a backend exceeded its deadline.
+        """
+        with self.lock:
+            self.timeouts += 1
+
+    def add_hedged_request(self):
+        """
+        Records a duplicate request sent to a backend because the original one was too slow.
+        """
+        with self.lock:
+            self.hedged_requests += 1
+
+    def add_retry(self):
+        """
+        Records a request to a backend sent again after a transient error.
+        """
+        with self.lock:
+            self.retries += 1
+
+    def add_rejected_request(self):
+        """
+        Records a request not sent to a backend because its circuit breaker is open.
+        """
+        with self.lock:
+            self.rejected_requests += 1
+
+    def merge(self, metrics_dict):
+        """
+        Adds the values of other metrics.
+        :param metrics_dict: the other metrics, in the format of to_dict().
+        """
+        with self.lock:
+            self.calls += metrics_dict['calls']
+            self.passed += metrics_dict['passed']
+            self.errors += metrics_dict['errors']
+            self.bytes_uploaded += metrics_dict['bytes_uploaded']
+            self.timeouts += metrics_dict['timeouts']
+            self.hedged_requests += metrics_dict['hedged_requests']
+            self.retries += metrics_dict['retries']
+            self.rejected_requests += metrics_dict['rejected_requests']
+            self.latency.merge(metrics_dict['latency'])
+
+    def to_dict(self):
+        with self.lock:
+            return {'calls': self.calls, 'passed': self.passed,
+                    'pass_rate': self.passed / self.calls if self.calls else 0.0, 'errors': self.errors,
+                    'bytes_uploaded': self.bytes_uploaded, 'timeouts': self.timeouts,
+                    'hedged_requests': self.hedged_requests, 'retries': self.retries,
+                    'rejected_requests': self.rejected_requests, 'latency': self.latency.to_dict()}
+
+
+class MetricsRegistry(object):
+    """
+    Holds the metrics of the filters and the stages of a process, by kind (METRICS_FILTER or METRICS_STAGE) and
+    name.
+    Metrics recorded by the workers of a pool are sent back to the parent with pop_snapshot() and added to its
+    registry with merge_snapshot().
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def get_metrics(self, kind, name):
+        """
+        Retrieves the metrics of a filter or a stage, creating them if needed.
+        :param kind: METRICS_FILTER or METRICS_STAGE.
+        :param name: name of the filter or the stage.
+        :return: Metrics instance.
+        """
+        key = (kind, name)
+
+        with self.lock:
+            if key not in self.metrics:
+                self.metrics[key] = Metrics()
+
+            return self.metrics[key]
+
+    def set_gauge(self, name, value):
+        """
+        Sets the current value of a gauge, like the size of a queue.
+        :param name: name of the gauge. The gauges of a service are named "gauge[service]", and exported to Prometheus
+            as a single metric with a service label.
+        :param value: value to set.
+        """
+        with self.lock:
+            self.gauges[name] = value
+
+    def get_snapshot(self):
+        """
+        :return: dictionary with {kind: {name: metrics_dict}} format, with an extra "gauge" kind for the gauges.
+        """
+        with self.lock:
+            metrics = dict(self.metrics)
+            gauges = dict(self.gauges)
+
+        return self._build_snapshot(metrics, gauges)
+
+    def pop_snapshot(self):
+        """
+        Retrieves the snapshot of the metrics and resets them, so the next snapshot only holds the newer values.
+        :return: snapshot in the format of get_snapshot().
+        """
+        with self.lock:
+            metrics = self.metrics
+            gauges = self.gauges
+            self.metrics = {}
+            self.gauges = {}
+
+        return self._build_snapshot(metrics, gauges)
+
+    @staticmethod
+    def _build_snapshot(metrics, gauges):
+        """
+        Builds a snapshot from a set of metrics and gauges.
+        :param metrics: dictionary with {(kind, name): Metrics} format.
+        :param gauges: dictionary with {name: value} format.
+        :return: snapshot in the format of get_snapshot().
+        """
+        snapshot = {METRICS_FILTER: {}, METRICS_STAGE: {}}
+
+        for (kind, name), kind_metrics in metrics.items():
+            snapshot.setdefault(kind, {})[name] = kind_metrics.to_dict()
+
+        snapshot['gauge'] = gauges
+
+        return snapshot
+
+    def merge_snapshot(self, snapshot):
+        """
+        Adds the values of a snapshot of another registry. Gauges are overwritten.
+        :param snapshot: snapshot in the format of get_snapshot().
+        """
+        for kind, metrics_dicts in snapshot.items():
+            if kind == 'gauge':
+                for name, value in metrics_dicts.items():
+                    self.set_gauge(name, value)
+
+                continue
+
+            for name, metrics_dict in metrics_dicts.items():
+                self.get_metrics(kind, name).merge(metrics_dict)
+
+    def reset(self):
+        """
+        Forgets all the metrics.
+        """
+        with self.lock:
+            self.metrics = {}
+            self.gauges = {}
+
+    def _reset_after_fork(self):
+        """
+        Forgets the metrics inherited from the parent process, so they are not reported twice.
+        """
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.gauges = {}
+
+
+_metrics_registry = MetricsRegistry()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_metrics_registry._reset_after_fork)
+
+
+def get_metrics_registry():
+    """
+    Retrieves the metrics registry of the current process.
+    :return:
+    """
+    return _metrics_registry
@@ -0,0 +1,659 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+
+from main.dataset.processed_journal import OUTCOME_ACCEPTED, OUTCOME_DISCARDED, OUTCOME_FAILED
+from main.filter.advanced.age_estimation_text_inference_filter import AgeEstimationTextInferenceFilter
+from main.filter.basic.age_range_filter import MAX_AGE_VALUE
+from main.filter.basic.backend_filter import is_timed_out
+from main.metrics.metrics_registry import get_metrics_registry
+from main.pipeline.evaluation_planner import EvaluationPlanner
+from main.pipeline.pipeline import Pipeline, DEFAULT_QUEUE_SIZE
+from main.pipeline.stage import Stage
+from main.resource.image import Image, get_fit_scale
+from main.resource.text import Text
+from main.tools.age_range import AgeRange
+
+__author__ = "Ivan de Paz Centeno"
+
+
+STAGE_READ = "read"
+STAGE_DECODE = "decode"
+STAGE_RESIZE = "resize"
+STAGE_DETECT = "detect"
+STAGE_CROP = "crop"
+STAGE_INFER = "infer"
+STAGE_AGGREGATE = "aggregate"
+STAGE_WRITE = "write"
+
+# Faces with more than this amount of filters passing are not trustworthy; they go to the unknown age group.
+MAX_PASSED_SCORES = 2
+UNKNOWN_AGE_RANGE = AgeRange(99, 99)
+
+# Faces cropped from the source file are decoded big enough for their longest side to reach this size, which is the
+# input size of the age estimation models.
+DEFAULT_SOURCE_FACE_SIZE = 256
+
+DEFAULT_WORKERS = {
+    STAGE_READ: 1,
+    STAGE_DECODE: 2,
+    STAGE_RESIZE: 1,
+    STAGE_DETECT: 4,
+    # Images are decoded when cropped.
+    STAGE_CROP: 2,
+    STAGE_INFER: 4,
+    STAGE_AGGREGATE: 1,
+    STAGE_WRITE: 1,
+}
+
+
+class ImageTask(object):
+    """
+    Work item of the pipeline that represents an element of the raw crawled dataset.
+    """
+
+    def __init__(self, image_hash, uri, text, search_keywords_text):
+        self.image_hash = image_hash
+        self.uri = uri
+        self.text = text
+        self.search_keywords_text = search_keywords_text
+        self.metadata_item = None
+        self.image = None
+        self.bounding_boxes = []
+        self.face_images = []
+        self.text_age_scores = []
+        self.pending_faces = 0
+        self.accepted_age_ranges = []
+
+
+class FaceTask(object):
+    """
+    Work item of the pipeline that represents a face cropped from the image of an ImageTask.
+    """
+
+    def __init__(self, image_task, face_image):
+        self.image_task = image_task
+        self.face_image = face_image
+        self.face_age_scores = []
+        self.age_range = None
+
+
+class AgeInferencePipeline(object):
+    """
+    Infers the age of the faces of a raw crawled dataset and stores them into an age dataset.
+    The process is split in stages (read, decode, resize, detect, crop, infer, aggregate and write) that run
+    concurrently.
+    """
+
+    def __init__(self, face_filter, text_multifilter, search_keywords_multifilter, image_multifilter, age_dataset,
+                 source_folder, max_image_size=(1200, 1200), age_grouping_size=2, expected_age_range=None,
+                 save_batch_amount=200, workers=None, queue_size=DEFAULT_QUEUE_SIZE, journal=None, deferred_rounds=1,
+                 deferred_delay=0, crop_from_source=False, source_face_size=DEFAULT_SOURCE_FACE_SIZE):
+        """
+        Initializes the pipeline.
+        :param face_filter: filter to detect the faces of each image.
+        :param text_multifilter: multifilter to infer the age from the description of the image.
+        :param search_keywords_multifilter: multifilter to infer the age from the search keywords of the image.
+        :param image_multifilter: multifilter to estimate the age from each face.
+        :param age_dataset: dataset to store the faces into.
+        :param source_folder: folder where the URIs of the raw dataset are relative to.
+        :param max_image_size: images bigger than this size are resized to fit it.
+        :param age_grouping_size: size of the age groups where faces are fitted in.
+        :param expected_age_range: faces whose age group does not fit inside this range are discarded.
+        :param save_batch_amount: the labels of the dataset are saved each time this amount of faces is stored.
+        :param workers: dictionary with {stage_name: workers_count} format. Stages not specified take the count from
+            DEFAULT_WORKERS.
+        :param queue_size: maximum number of items waiting between two stages.
+        :param journal: optional ProcessedJournal. Elements already recorded in it are skipped, and the outcome of each
+            processed element is recorded in it.
+        :param deferred_rounds: number of times the elements that failed because of a backend are processed again at
+            the end of the run. Elements that still fail afterwards are recorded as failed.
+        :param deferred_delay: seconds to wait before each round of deferred elements, so the backends (and their
+            circuit breakers) have time to recover.
+        :param crop_from_source: if True, the faces of the resized images that are smaller than source_face_size are
+            cropped from their source file, which is decoded again for them. Otherwise, they are cropped from the
+            resized image.
+        :param source_face_size: size in pixels the longest side of the faces cropped from the source file must reach.
+            JPEG files are decoded at the smallest reduced scale that keeps every face of the image this big.
+        """
+        if expected_age_range is None:
+            expected_age_range = AgeRange(0, 99)
+
+        if workers is None:
+            workers = {}
+
+        self.face_filter = face_filter
+        self.text_multifilter = text_multifilter
+        self.search_keywords_multifilter = search_keywords_multifilter
+        self.image_multifilter = image_multifilter
+        self.age_dataset = age_dataset
+        self.source_folder = source_folder
+        self.max_image_size = max_image_size
+        self.age_grouping_size = age_grouping_size
+        self.expected_age_range = expected_age_range
+        self.save_batch_amount = save_batch_amount
+        self.workers = dict(DEFAULT_WORKERS, **workers)
+        self.journal = journal
+        self.deferred_rounds = deferred_rounds
+        self.deferred_delay = deferred_delay
+        self.crop_from_source = crop_from_source
+        self.source_face_size = source_face_size
+
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.read_count = 0
+        self.iteration = 0
+        self.size_metadata = 0
+        self.skipped_faces_count = 0
+        self.deferred_items = []
+        self.deferred_round = 0
+        self.planner = EvaluationPlanner(self._is_discard_certain)
+
+        self.pipeline = Pipeline([
+            Stage(STAGE_READ, self._read, self.workers[STAGE_READ]),
+            Stage(STAGE_DECODE, self._decode, self.workers[STAGE_DECODE]),
+            Stage(STAGE_RESIZE, self._resize, self.workers[STAGE_RESIZE]),
+            Stage(STAGE_DETECT, self._detect, self.workers[STAGE_DETECT]),
+            Stage(STAGE_CROP, self._crop, self.workers[STAGE_CROP]),
+            Stage(STAGE_INFER, self._infer, self.workers[STAGE_INFER], fan_out=True),
+            Stage(STAGE_AGGREGATE, self._aggregate, self.workers[STAGE_AGGREGATE]),
+            Stage(STAGE_WRITE, self._write, self.workers[STAGE_WRITE]),
+        ], queue_size=queue_size)
+
+    def run(self, metadata_content):
+        """
+        Processes the specified metadata content of a raw crawled dataset. Blocks until all the elements are processed.
+        The elements that fail because of a backend are deferred, and processed again once the rest are done.
+        :param metadata_content: metadata dictionary with {image_hash: data} format.
+        """
+        self.read_count = 0
+        self.iteration = 0
+        self.size_metadata = len(metadata_content)
+        self.deferred_items = []
+        self.deferred_round = 0
+
+        metadata_items = metadata_content.items()
+
+        if self.journal is not None:
+            skipped_count = sum(1 for image_hash in metadata_content if self.journal.is_processed(image_hash))
+            print("Skipping {} elements already processed in previous runs.".format(skipped_count))
+
+            self.read_count = skipped_count
+            metadata_items = ((image_hash, data) for image_hash, data in metadata_items
+                              if not self.journal.is_processed(image_hash))
+
+        self.pipeline.run(metadata_items)
+
+        while self.deferred_items and self.deferred_round < self.deferred_rounds:
+            self.deferred_round += 1
+            deferred_items, self.deferred_items = self.deferred_items, []
+
+            print("Processing again {} elements that failed because of the backend in {} seconds (round {} of "
+                  "{}).".format(len(deferred_items), self.deferred_delay, self.deferred_round, self.deferred_rounds))
+            time.sleep(self.deferred_delay)
+
+            self.read_count -= len(deferred_items)
+            self.pipeline.run(deferred_items, keep_counts=True)
+
+    def get_pipeline(self):
+        """
+        Getter for the underlying generic pipeline.
+        :return:
+        """
+        return self.pipeline
+
+    def _read(self, metadata_item):
+        """
+        Read stage: builds the work item from the metadata of an element.
+        :param metadata_item: tuple (image_hash, data) of the metadata content.
+        :return: ImageTask for the element, None if the metadata is not valid.
+        """
+        image_hash, data = metadata_item
+
+        with self.lock:
+            self.read_count += 1
+
+        if 'metadata' not in data:
+            print("Element {} hierarchy in the metadata is not correct (does not contain metadata for the image's hash "
+                  "key). May it be a different version of dataset? skipped.".format(image_hash))
+            self._record(image_hash, OUTCOME_DISCARDED)
+            return None
+
+        metadata = data['metadata']
+
+        if 'uri' not in metadata:
+            print("Element's {} metadata does not reference any URI. May it be a different version of dataset? "
+                  "skipped.".format(image_hash))
+            self._record(image_hash, OUTCOME_DISCARDED)
+            return None
+
+        text = Text(content=metadata['desc'])
+        search_keywords_text = Text(content="; ".join(metadata['searchwords']))
+        uri = os.path.join(self.source_folder, metadata['uri'][0])
+
+        image_task = ImageTask(image_hash, uri, text, search_keywords_text)
+        image_task.metadata_item = metadata_item
+
+        return image_task
+
+    def _decode(self, image_task):
+        """
+        Decode stage: loads the image of the work item. Images that fit in the maximum size are loaded lazily: their
+        pixels are decoded by the stages that need them, and images sent to the backends as they are never get decoded.
+        Bigger images are decoded at a reduced scale and resized to fit it.
+        :param image_task: ImageTask to load the image for.
+        :return: the ImageTask, None if the image could not be loaded.
+        """
+        print("loading {}".format(image_task.uri))
+        image = Image(image_task.uri)
+        image.load_from_uri(lazy=True, max_size=self.max_image_size)
+
+        if not image.is_loaded():
+            self._record(image_task.image_hash, OUTCOME_DISCARDED)
+            return None
+
+        image_task.image = image
+
+        return image_task
+
+    def _resize(self, image_task):
+        """
+        Resize stage: resizes the image of the work item if it is too big. Images loaded by the decode stage already
+        fit, unless they were replaced afterwards.
+        :param image_task: ImageTask with the image loaded.
+        :return: the ImageTask.
+        """
+        image = image_task.image
+
+        if get_fit_scale(image.get_size(), self.max_image_size) < 1:
+            image.resize_to(self.max_image_size)
+
+        return image_task
+
+    def _detect(self, image_task):
+        """
+        Detect stage: finds the faces of the image.
+        :param image_task: ImageTask with the image loaded.
+        :return: the ImageTask with the bounding boxes of the faces, None if no faces were detected.
+        """
+        image = image_task.image
+
+        try:
+            (faces_detected, weight, reason, bounding_boxes) = self.face_filter.apply_to_measured(image)
+
+        except Exception as ex:
+            print("Backend failed for image \"{}\": {}".format(image.get_uri(), ex))
+            self._defer(image_task)
+            return None
+
+        if not faces_detected and is_timed_out((faces_detected, weight, reason, bounding_boxes)):
+            # Not a discard: the image is processed again.
+            print("Backend timed out for image \"{}\"".format(image.get_uri()))
+            self._defer(image_task)
+            return None
+
+        if not faces_detected:
+            print("No faces detected for file {} ({})".format(image_task.image_hash, image_task.uri))
+            self._record(image_task.image_hash, OUTCOME_DISCARDED)
+            return None
+
+        print("Detected {} faces in {} ({}): \n{}".format(len(bounding_boxes), image_task.image_hash, image_task.uri,
+                                                          "\n".join([str(bounding_box)
+                                                                     for bounding_box in bounding_boxes])))
+        image_task.bounding_boxes = bounding_boxes
+
+        return image_task
+
+    def _crop(self, image_task):
+        """
+        Crop stage: crops each face of the image, or of its source file if the pipeline crops from the source.
+        :param image_task: ImageTask with the bounding boxes of the faces.
+        :return: the ImageTask with the images of the faces.
+        """
+        image = image_task.image
+
+        if self.crop_from_source:
+            image = self._load_source(image_task)
+
+        for bounding_box in image_task.bounding_boxes:
+            bounding_box.expand(0.2)
+            bounding_box.fit_in_size(image.get_size())
+            image_task.face_images.append(image.crop_image(bounding_box, new_uri="None"))
+
+        # The full image is not needed anymore; the crops hold their own copy of the pixels.
+        image_task.image = None
+
+        return image_task
+
+    def _load_source(self, image_task):
+        """
+        Loads the image of the work item from its source file, big enough for its smallest face to reach the source
+        face size, and scales its bounding boxes to it. The file is decoded once, at the smallest reduced scale that
+        meets the size.
+        :param image_task: ImageTask with the bounding boxes of the faces.
+        :return: the image loaded from the source file. The image of the work item if it was not resized, if its faces
+            already reach the size, or if its source file can't be loaded again.
+        """
+        image = image_task.image
+
+        if image.source_content is not None or not image_task.bounding_boxes:
+            # Loaded lazily and never resized, it is the source file already; or there is nothing to crop.
+            return image
+
+        source_image = Image(image_task.uri)
+        source_image.load_from_uri(lazy=True)
+
+        if not source_image.is_loaded():
+            return image
+
+        width, height = image.get_size()
+        source_width, source_height = source_image.get_size()
+        smallest_face_size = min([max(bounding_box.get_width(), bounding_box.get_height(), 1)
+                                  for bounding_box in image_task.bounding_boxes])
+
+        # Scale of the image regarding the source file, and the one its smallest face reaches the size at.
+        image_scale = width / source_width
+        min_scale = min(1, image_scale * self.source_face_size / smallest_face_size)
+
+        if min_scale <= image_scale:
+            return image
+
+        source_image.decode_reduced(min_scale)
+
+        if not source_image.is_loaded():
+            return image
+
+        source_width, source_height = source_image.get_size()
+
+        for bounding_box in image_task.bounding_boxes:
+            bounding_box.scale(source_width / width, source_height / height)
+
+        return source_image
+
+    def _infer(self, image_task):
+        """
+        Infer stage: applies the age filters to the faces of the image and to its texts. The multifilters are applied
+        cheapest first, and the remaining ones are skipped for the faces whose discard is already certain.
+        The texts are the same for every face, so they are filtered once per image. All the faces of the image are sent
+        together to the image filters, so they can be batched in a single request.
+        :param image_task: ImageTask with the images of the faces.
+        :return: list of FaceTask with the scores of the filters, one for each face not discarded yet.
+        """
+        face_images = image_task.face_images
+        image_task.pending_faces = len(face_images)
+
+        if len(face_images) == 0:
+            self._record(image_task.image_hash, OUTCOME_DISCARDED)
+            return []
+
+        face_tasks = [FaceTask(image_task, face_image) for face_image in face_images]
+        undecided_face_tasks = face_tasks
+        multifilters = self.planner.sort([self.text_multifilter, self.search_keywords_multifilter,
+                                          self.image_multifilter])
+
+        try:
+            for index, multifilter in enumerate(multifilters):
+                undecided_face_tasks = [face_task for face_task in undecided_face_tasks
+                                        if not self.planner.is_decided(face_task.face_age_scores, multifilters[index:])]
+
+                if not undecided_face_tasks:
+                    break
+
+                self._apply_multifilter(multifilter, image_task, undecided_face_tasks)
+
+        except Exception as ex:
+            print("Filters failed for image {} ({}): {}".format(image_task.image_hash, image_task.uri, ex))
+            self._defer(image_task)
+            return []
+
+        skipped_face_tasks = [face_task for face_task in face_tasks if face_task not in undecided_face_tasks]
+
+        if skipped_face_tasks:
+            print("Discarded {} faces of {} before applying all the filters, as they can't fit in the expected age "
+                  "range.".format(len(skipped_face_tasks), image_task.image_hash))
+
+            with self.lock:
+                self.skipped_faces_count += len(skipped_face_tasks)
+                get_metrics_registry().set_gauge("skipped_faces", self.skipped_faces_count)
+
+        for face_task in skipped_face_tasks:
+            self._finish_face(face_task)
+
+        return undecided_face_tasks
+
+    def _apply_multifilter(self, multifilter, image_task, face_tasks):
+        """
+        Applies a multifilter and adds its scores to the specified faces.
+        :param multifilter: one of the multifilters of the pipeline.
+        :param image_task: ImageTask the faces belong to.
+        :param face_tasks: list of FaceTask to add the scores to.
+        """
+        if multifilter is self.image_multifilter:
+            # Scores are ordered by filter and then by face.
+            image_scores = multifilter.apply_to_list([face_task.face_image for face_task in face_tasks])
+
+            for index, face_task in enumerate(face_tasks):
+                face_task.face_age_scores = face_task.face_age_scores + image_scores[index::len(face_tasks)]
+
+            return
+
+        if multifilter is self.text_multifilter:
+            text_scores = multifilter.apply_to(image_task.text)
+
+        else:
+            text_scores = multifilter.apply_to(image_task.search_keywords_text)
+
+        image_task.text_age_scores = image_task.text_age_scores + text_scores
+
+        for face_task in face_tasks:
+            face_task.face_age_scores = face_task.face_age_scores + text_scores
+
+    def _is_discard_certain(self, face_age_scores, remaining_filters):
+        """
+        Checks if a face is going to be discarded whatever the scores of the remaining filters are. Each remaining
+        filter either fails or passes with an age between its min_age and its max_age.
+        :param face_age_scores: scores gathered for the face.
+        :param remaining_filters: filters not applied to the face yet.
+        :return: True if the face is going to be discarded, False if it may be accepted.
+        """
+        passed_ages = [age for (passed, weight, reason, age) in face_age_scores if passed]
+        passed_values = [value for age in passed_ages for value in age.get_range()]
+
+        remaining_min_age = min([getattr(_filter, 'min_age', 0) for _filter in remaining_filters], default=0)
+        remaining_max_age = max([getattr(_filter, 'max_age', MAX_AGE_VALUE) for _filter in remaining_filters],
+                                default=0)
+
+        for extra_passed_count in range(len(remaining_filters) + 1):
+            passed_count = len(passed_ages) + extra_passed_count
+
+            if passed_count > MAX_PASSED_SCORES:
+                if self._is_expected(self._fit_in_age_group(UNKNOWN_AGE_RANGE)):
+                    return False
+
+                continue
+
+            if passed_count == 0:
+                # Faces that no filter passes are discarded by the aggregate stage.
+                continue
+
+            # The fused age is always between the lowest and the highest ages of the filters that pass.
+            values = passed_values
+
+            if extra_passed_count > 0:
+                values = passed_values + [remaining_min_age, remaining_max_age]
+
+            lowest_group = self._fit_in_age_group(AgeRange(int(min(values)), int(min(values))))
+            highest_group = self._fit_in_age_group(AgeRange(int(max(values)), int(max(values))))
+
+            # First group, from the lowest one, that starts inside the expected age range.
+            expected_min_age = -(-self.expected_age_range.get_range()[0] // self.age_grouping_size) \
+                               * self.age_grouping_size
+            min_age = max(lowest_group.get_range()[0], expected_min_age)
+
+            if min_age <= highest_group.get_range()[0] and \
+                    self._is_expected(AgeRange(min_age, min_age + self.age_grouping_size - 1)):
+                return False
+
+        return True
+
+    def _fit_in_age_group(self, age_range):
+        """
+        Fits an age range inside its age group.
+        :param age_range: age range to fit.
+        :return: AgeRange of the group.
+        """
+        mean_age = age_range.get_mean()
+
+        min_age = int(mean_age / self.age_grouping_size) * self.age_grouping_size  # They are INTEGERS, not REALS!
+        max_age = min_age + self.age_grouping_size - 1
+
+        return AgeRange(min_age, max_age)
+
+    def _is_expected(self, age_group):
+        """
+        Checks if an age group is inside the expected age range.
+        :param age_group: AgeRange of the group.
+        :return: True if it is inside, False otherwise.
+        """
+        return self.expected_age_range.get_range()[0] <= age_group.get_range()[0] and \
+            age_group.get_range()[1] <= self.expected_age_range.get_range()[1]
+
+    def _aggregate(self, face_task):
+        """
+        Aggregate stage: fuses the scores of the filters into an age group.
+        :param face_task: FaceTask with the scores of the filters.
+        :return: the FaceTask with the age range set, None if it is discarded.
+        """
+        # Let's discard all those scores that didn't pass the filter.
+        filtered_face_age_scores = [(age, weight) for (passed, weight, reason, age) in face_task.face_age_scores
+                                    if passed]
+
+        [print(age, "x", weight) for (age, weight) in filtered_face_age_scores]
+
+        if not filtered_face_age_scores:
+            # No filter could tell the age of this face.
+            print("Discarded face as no filter passed.")
+            self._finish_face(face_task)
+            return None
+
+        if len(filtered_face_age_scores) <= MAX_PASSED_SCORES:
+
+            # Now we need to map the age ranges into a list.
+            ages_list = []
+            for (age, weight) in filtered_face_age_scores:
+                ages_list += age.get_range() * weight
+
+            reduced_list = AgeEstimationTextInferenceFilter.ivan_algorithm(ages_list)
+
+            age_range = AgeRange(int(min(reduced_list)), int(max(reduced_list)))
+
+            print("Inferred age: {}".format(age_range))
+
+        else:
+            # Bad, only two filters were effective here.
+            # This image is not trustworthy. Let's discard it into the unknown group.
+            age_range = UNKNOWN_AGE_RANGE
+
+        # Let's fit the inferred age range inside an age group
+        age_range = self._fit_in_age_group(age_range)
+
+        if not self._is_expected(age_range):
+            # This is not within the expected age range... let's discard this sample.
+            print("Discarded image as it overpasses expected age range.")
+            self._finish_face(face_task)
+            return None
+
+        print("Fitted age in group {}".format(age_range))
+        face_task.age_range = age_range
+
+        return face_task
+
+    def _write(self, face_task):
+        """
+        Write stage: stores the face in the age dataset. The dataset is saved periodically.
+        :param face_task: FaceTask with the age range set.
+        :return: the FaceTask.
+        """
+        face_image = face_task.face_image
+        face_image.metadata = [face_task.age_range]
+
+        # The dataset is not thread-safe, writes are serialized.
+        with self.write_lock:
+            self.age_dataset.put_image(face_image)
+
+            if self.iteration % self.save_batch_amount == 0:
+                self._save()
+
+            self.iteration += 1
+
+        self._finish_face(face_task, face_task.age_range)
+
+        return face_task
+
+    def _save(self):
+        """
+        Appends the new labels to the dataset's labels log and, after it, flushes the journal. Must be called holding
+        the write lock.
+        """
+        print("[{}%] Saved dataset into \"{}\".".format(round(self.read_count / self.size_metadata * 100, 2),
+                                                        self.age_dataset.get_root_folder()))
+        self.age_dataset.save_labels_log()
+
+        if self.journal is not None:
+            self.journal.flush()
+
+    def _finish_face(self, face_task, age_range=None):
+        """
+        Marks a face as done. When all the faces of its image are done, the outcome of the image is recorded.
+        :param face_task: FaceTask done.
+        :param age_range: age range of the face if it was accepted into the dataset, None if it was discarded.
+        """
+        image_task = face_task.image_task
+
+        with self.lock:
+            if age_range is not None:
+                image_task.accepted_age_ranges.append(age_range)
+
+            image_task.pending_faces -= 1
+            image_done = image_task.pending_faces == 0
+
+        if not image_done:
+            return
+
+        if image_task.accepted_age_ranges:
+            self._record(image_task.image_hash, OUTCOME_ACCEPTED, image_task.accepted_age_ranges)
+        else:
+            self._record(image_task.image_hash, OUTCOME_DISCARDED)
+
+    def _defer(self, image_task):
+        """
+        Puts aside an element that failed because of a backend, to process it again at the end of the run. When there
+        are no rounds left, it is recorded as failed instead.
+        :param image_task: ImageTask that failed.
+        """
+        if self.deferred_round >= self.deferred_rounds or image_task.metadata_item is None:
+            self._record(image_task.image_hash, OUTCOME_FAILED)
+            return
+
+        with self.lock:
+            self.deferred_items.append(image_task.metadata_item)
+
+    def _record(self, image_hash, outcome, age_ranges=None):
+        """
+        Records the outcome of an element in the journal, if any. When too many records are pending, the dataset is
+        saved so they can be flushed.
+        :param image_hash: hash key of the element.
+        :param outcome: outcome of the element.
+        :param age_ranges: list of AgeRange of the faces accepted from the element.
+        """
+        if self.journal is None:
+            return
+
+        self.journal.record(image_hash, outcome, age_ranges)
+
+        if self.journal.get_pending_count() >= self.save_batch_amount:
+            with self.write_lock:
+                self._save()
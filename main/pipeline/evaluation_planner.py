@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from main.metrics.metrics_registry import get_metrics_registry, METRICS_FILTER
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class EvaluationPlanner(object):
+    """
+    Plans the evaluation of a set of multifilters over the same sample: the cheapest ones first, by the latency
+    measured for their filters in the metrics registry. Multifilters whose filters haven't been measured yet go last,
+    keeping their order.
+
+    A decision function tells when the outcome of a sample can't change anymore whatever the scores of the remaining
+    filters are, so they can be skipped.
+    """
+
+    def __init__(self, decision_function, registry=None):
+        """
+        Initializes the planner.
+        :param decision_function: function that receives the scores gathered for a sample and the list of filters
+            not applied yet, and returns True if the outcome is already decided.
+        :param registry: MetricsRegistry to read the costs from. By default, the registry of the current process.
+        """
+        if registry is None:
+            registry = get_metrics_registry()
+
+        self.decision_function = decision_function
+        self.registry = registry
+
+    def get_cost(self, multifilter, filter_snapshot=None):
+        """
+        Estimates the cost of applying a multifilter to one resource. Its filters run in parallel, so it is the cost of
+        the slowest one.
+        :param multifilter: multifilter to estimate the cost of.
+        :param filter_snapshot: snapshot of the filter metrics of the registry, in {name: metrics_dict} format. If not
+            specified, a snapshot is taken.
+        :return: mean seconds per resource, infinite if any of its filters has not been measured yet.
+        """
+        if filter_snapshot is None:
+            filter_snapshot = self.registry.get_snapshot()[METRICS_FILTER]
+
+        cost = 0.0
+
+        for _filter in multifilter.filter_list:
+            metrics_dict = filter_snapshot.get(_filter.get_name())
+
+            if metrics_dict is None or metrics_dict['calls'] == 0:
+                return float("inf")
+
+            cost = max(cost, metrics_dict['latency']['sum'] / metrics_dict['calls'])
+
+        return cost
+
+    def sort(self, multifilters):
+        """
+        Sorts the multifilters by their cost, cheapest first. The costs are read from a single snapshot of the registry.
+        :param multifilters: list of multifilters.
+        :return: sorted list of multifilters.
+        """
+        filter_snapshot = self.registry.get_snapshot()[METRICS_FILTER]
+        costs = {id(multifilter): self.get_cost(multifilter, filter_snapshot) for multifilter in multifilters}
+
+        return sorted(multifilters, key=lambda multifilter: costs[id(multifilter)])
+
+    def is_decided(self, scores, remaining_multifilters):
+        """
+        Checks if the outcome of a sample is already decided.
+        :param scores: list of scores gathered for the sample.
+        :param remaining_multifilters: list of multifilters not applied to the sample yet.
+        :return: True if the remaining multifilters can't change the outcome.
+        """
+        remaining_filters = [_filter for multifilter in remaining_multifilters for _filter in multifilter.filter_list]
+
+        return self.decision_function(scores, remaining_filters)
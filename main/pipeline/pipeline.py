@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import queue
+import threading
+import time
+import traceback
+
+from main.metrics.metrics_registry import get_metrics_registry, METRICS_STAGE
+
+__author__ = "Ivan de Paz Centeno"
+
+
+DEFAULT_QUEUE_SIZE = 32
+
+_END_OF_STREAM = object()
+
+
+class Pipeline(object):
+    """
+    Chains a set of stages joined by bounded queues. Each stage runs in its own set of worker threads, so the work of
+    the different stages (decoding, network round trips, disk writes...) overlaps. Since queues are bounded, a slow
+    stage makes the previous ones wait instead of accumulating items in memory.
+    The calls of each stage are recorded in the metrics registry of the process. An item passes a stage when the stage
+    does not drop it.
+    """
+
+    def __init__(self, stages, queue_size=DEFAULT_QUEUE_SIZE):
+        """
+        Initializes the pipeline.
+        :param stages: ordered list of Stage objects.
+        :param queue_size: maximum number of items waiting between two stages.
+        """
+        if not stages:
+            raise Exception("A pipeline requires at least one stage.")
+
+        self.stages = stages
+        self.queue_size = queue_size
+        self.processed = {}
+        self.errors = {}
+        self.processing_time = {}
+        self.lock = threading.Lock()
+
+    def run(self, items, on_result=None, keep_counts=False):
+        """
+        Pushes the specified items through the pipeline. Blocks until every item has gone through all the stages.
+        :param items: iterable of items to feed the first stage with. It is consumed lazily.
+        :param on_result: optional function called with each item that comes out of the last stage.
+        :param keep_counts: if True, the counts of this run are added to the ones of the previous run instead of
+            replacing them.
+        """
+        if not keep_counts or not self.processed:
+            self.processed = {stage.get_name(): 0 for stage in self.stages}
+            self.errors = {stage.get_name(): 0 for stage in self.stages}
+            self.processing_time = {stage.get_name(): 0.0 for stage in self.stages}
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        remaining_workers = [stage.get_workers() for stage in self.stages]
+        threads = []
+
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.get_workers()):
+                thread = threading.Thread(target=self._work, name="{}-worker".format(stage.get_name()),
+                                          args=(index, queues, remaining_workers, on_result), daemon=True)
+                thread.start()
+                threads.append(thread)
+
+        try:
+            for item in items:
+                queues[0].put(item)
+
+        finally:
+            for _ in range(self.stages[0].get_workers()):
+                queues[0].put(_END_OF_STREAM)
+
+            for thread in threads:
+                thread.join()
+
+    def _work(self, index, queues, remaining_workers, on_result):
+        """
+        Loop of a worker thread of the stage located at the specified index.
+        :param index: index of the stage.
+        :param queues: list of queues of the pipeline. Queue at index i feeds the stage at index i.
+        :param remaining_workers: list of counters of alive workers for each stage.
+        :param on_result: function to call with the items that come out of the last stage.
+        """
+        stage = self.stages[index]
+        input_queue = queues[index]
+        is_last_stage = index == len(self.stages) - 1
+        metrics = get_metrics_registry().get_metrics(METRICS_STAGE, stage.get_name())
+
+        try:
+            while True:
+                item = input_queue.get()
+
+                if item is _END_OF_STREAM:
+                    break
+
+                start_time = time.perf_counter()
+
+                try:
+                    results = stage.process(item)
+
+                    elapsed_time = time.perf_counter() - start_time
+                    metrics.observe(elapsed_time, passed=int(len(results) > 0))
+
+                    with self.lock:
+                        self.processed[stage.get_name()] += 1
+                        self.processing_time[stage.get_name()] += elapsed_time
+
+                    for result in results:
+                        if not is_last_stage:
+                            queues[index + 1].put(result)
+
+                        elif on_result is not None:
+                            on_result(result)
+
+                except Exception as ex:
+                    print("Stage {} failed processing an item: {}".format(stage.get_name(), ex))
+                    traceback.print_exc()
+
+                    elapsed_time = time.perf_counter() - start_time
+                    metrics.observe(elapsed_time, failed=True)
+
+                    with self.lock:
+                        self.errors[stage.get_name()] += 1
+                        self.processing_time[stage.get_name()] += elapsed_time
+
+        finally:
+            # The last worker of the stage alive is the one in charge of closing the stream for the next stage. Done
+            # even if the worker dies, so the run never waits for it forever.
+            with self.lock:
+                remaining_workers[index] -= 1
+                close_stream = remaining_workers[index] == 0
+
+            if close_stream and not is_last_stage:
+                for _ in range(self.stages[index + 1].get_workers()):
+                    queues[index + 1].put(_END_OF_STREAM)
+
+    def get_processed_count(self):
+        """
+        Getter for the number of items successfully processed by each stage in the last run.
+        :return: dictionary with {stage_name: count} format.
+        """
+        return dict(self.processed)
+
+    def get_errors_count(self):
+        """
+        Getter for the number of items that failed in each stage in the last run.
+        :return: dictionary with {stage_name: count} format.
+        """
+        return dict(self.errors)
+
+    def get_processing_time(self):
+        """
+        Getter for the seconds spent by the workers of each stage processing items in the last run, summed up across
+        workers. It does not include the time waiting for items or for room in the next queue.
+        :return: dictionary with {stage_name: seconds} format.
+        """
+        return dict(self.processing_time)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class Stage(object):
+    """
+    Represents a step of a pipeline. A stage wraps a function that is applied to every item that reaches it,
+    by a configurable number of worker threads.
+    """
+
+    def __init__(self, name, function, workers=1, fan_out=False):
+        """
+        Initializes the stage.
+        :param name: name of the stage. Useful for reports.
+        :param function: function to apply to each item. It receives an item and returns the item to pass to the next
+            stage. If it returns None, the item is dropped from the pipeline.
+        :param workers: number of threads working on this stage concurrently.
+        :param fan_out: if set to True, the function returns a list of items instead of a single one, and each one of
+            them is passed to the next stage separately.
+        """
+        if workers < 1:
+            raise Exception("A stage requires at least one worker.")
+
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.fan_out = fan_out
+
+    def get_name(self):
+        """
+        Getter for the name
+        :return:
+        """
+        return self.name
+
+    def get_workers(self):
+        """
+        Getter for the workers count
+        :return:
+        """
+        return self.workers
+
+    def process(self, item):
+        """
+        Applies the stage function to the specified item.
+        :param item: item to process.
+        :return: list of items to pass to the next stage.
+        """
+        result = self.function(item)
+
+        if result is None:
+            result = []
+
+        elif not self.fan_out:
+            result = [result]
+
+        return result
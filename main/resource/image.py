@@ -6,14 +6,161 @@ import os
 import cv2
 import numpy
 from main.resource.resource import Resource
+from main.tools.image_header import read_image_header, HEADER_FORMAT_JPEG
 
 __author__ = 'Iván de Paz Centeno'
 
 
+ENCODING_JPEG = ".jpg"
+ENCODING_PNG = ".png"
+ENCODING_WEBP = ".webp"
+
+MIME_TYPES = {
+    ENCODING_JPEG: "image/jpeg",
+    ENCODING_PNG: "image/png",
+    ENCODING_WEBP: "image/webp",
+}
+
+DEFAULT_ENCODING_QUALITY = 90
+
+# Flags to decode JPEG images at 1/N of their size, by N. The downscale is done by the decoder, which skips most of the
+# work of a full decode.
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+REDUCED_GRAYSCALE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def get_fit_scale(size, max_size):
+    """
+    Computes the factor an image is downscaled by to fit in some size boundaries, keeping its aspect ratio.
+    :param size: size of the image in [width, height] format.
+    :param max_size: size boundaries in [width, height] format.
+    :return: scale factor, 1 if the image already fits.
+    """
+    return min(1, max_size[0] / size[0], max_size[1] / size[1])
+
+
+def get_reduction(image_format, scale):
+    """
+    Picks the reduced scale a file is decoded at to get an image of at least the specified scale.
+    :param image_format: format of the file, from its header.
+    :param scale: minimum scale of the decoded image regarding the size of the file.
+    :return: N to decode the file at 1/N of its size, one of the keys of REDUCED_COLOR_FLAGS. Only JPEG files can be
+        decoded reduced; for the rest it is always 1.
+    """
+    if image_format != HEADER_FORMAT_JPEG:
+        return 1
+
+    return max([reduction for reduction in REDUCED_COLOR_FLAGS if reduction * scale <= 1])
+
+
+class EncodingPolicy(object):
+    """
+    Describes how an image is encoded before being sent to a consumer, like a service: the format, the quality, the
+    maximum dimension and the color. Images bigger than the maximum dimension are downscaled, keeping their aspect
+    ratio.
+    """
+
+    def __init__(self, image_format=ENCODING_JPEG, quality=DEFAULT_ENCODING_QUALITY, max_size=None, as_gray=False):
+        """
+        Initializes the policy.
+        :param image_format: ENCODING_JPEG, ENCODING_PNG or ENCODING_WEBP.
+        :param quality: quality between 0 and 100, for the lossy formats.
+        :param max_size: maximum width and height in pixels of the encoded image. Unlimited if not specified.
+        :param as_gray: if True, color images are encoded in gray scale.
+        """
+        if image_format not in MIME_TYPES:
+            raise Exception("Encoding format \"{}\" not supported. Use one of {}.".format(image_format,
+                                                                                        list(MIME_TYPES)))
+
+        self.image_format = image_format
+        self.quality = quality
+        self.max_size = max_size
+        self.as_gray = as_gray
+
+    def get_key(self):
+        """
+        :return: tuple that identifies the encoding.
+        """
+        return self.image_format, self.quality, self.max_size, self.as_gray
+
+    def get_params(self):
+        """
+        :return: parameters of the encoding for cv2.imencode().
+        """
+        if self.image_format == ENCODING_JPEG:
+            return [int(cv2.IMWRITE_JPEG_QUALITY), self.quality]
+
+        if self.image_format == ENCODING_WEBP:
+            return [int(cv2.IMWRITE_WEBP_QUALITY), self.quality]
+
+        return []
+
+    def get_mime_type(self):
+        """
+        :return: MIME type of the encoded images.
+        """
+        return MIME_TYPES[self.image_format]
+
+    def get_scale(self, size):
+        """
+        Computes the factor an image is downscaled by when encoded.
+        :param size: size of the image in [width, height] format.
+        :return: scale factor, 1 if the image is not downscaled.
+        """
+        if self.max_size is None or max(size) <= self.max_size:
+            return 1
+
+        return self.max_size / max(size)
+
+    def get_encoded_size(self, size):
+        """
+        :param size: size of an image in [width, height] format.
+        :return: size of the image once encoded, in [width, height] format.
+        """
+        scale = self.get_scale(size)
+
+        if scale == 1:
+            return tuple(size)
+
+        return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+    def __eq__(self, other):
+        return isinstance(other, EncodingPolicy) and self.get_key() == other.get_key()
+
+    def __hash__(self):
+        return hash(self.get_key())
+
+    def __str__(self):
+        description = "{}:{}:{}".format(self.image_format.lstrip("."), self.quality, self.max_size)
+
+        if self.as_gray:
+            description += ":gray"
+
+        return description
+
+
+DEFAULT_ENCODING_POLICY = EncodingPolicy()
+
+
 class Image(Resource):
     """
     Represents an image. It is capable of storing the content in memory and perform some basic operations and checks
     on it.
+
+    Images loaded lazily keep the content of their source file, and their pixels are decoded from it the first time
+    they are needed. As long as the pixels are the ones of the file, the file content itself is used for the encodings
+    in the format of the file.
     """
 
     def __init__(self, uri="", image_id="", metadata=None, blob_content=None):
@@ -31,7 +178,12 @@ class Image(Resource):
 
         self.cached_is_boolean_image = False
         self.cached_image_hash = None
-        self.blob_content = None
+        self.cached_fast_hash = None
+        self.cached_source_hash = None
+        self.cached_encodings = {}
+        self.source_content = None
+        self.source_header = None
+        self._blob_content = None
 
         if blob_content is None:
             blob_content = []
@@ -50,12 +202,14 @@ class Image(Resource):
 
         cv2.imwrite(self.uri, self.blob_content)
 
-    def crop_image(self, bounding_box, new_uri):
+    def crop_image(self, bounding_box, new_uri, copy=True):
         """
         Crops the current image and generates a new one with the cropped section.
 
         :param bounding_box: bounding box to crop
         :param new_uri: new uri to set to the resulting image.
+        :param copy: if True, the cropped image gets its own copy of the pixels. Otherwise, its blob is a view of the
+            blob of this image, which is kept in memory as long as the cropped image is, and sees its changes.
         :return: A new image object with the cropped content. The bounding box is associated as the metadata of the
         image. Also, the image_id will be "cropped"
         """
@@ -64,31 +218,131 @@ class Image(Resource):
         cropped_image = self.blob_content[numpy_format[0]:numpy_format[1],
                                           numpy_format[2]:numpy_format[3]]
 
-        # FIX for C-Contiguous problem with the calculation of the hash md5.
-        cropped_image = numpy.ascontiguousarray(cropped_image, cropped_image.dtype)
+        if copy:
+            cropped_image = cropped_image.copy()
 
         return Image(uri=new_uri, image_id="cropped", metadata=[bounding_box], blob_content=cropped_image)
 
-    def load_from_uri(self, as_gray=False):
+    @property
+    def blob_content(self):
+        if self._blob_content is None and self.source_content is not None:
+            self._decode_source()
+
+        return self._blob_content
+
+    @blob_content.setter
+    def blob_content(self, blob_content):
+        # The pixels are not the ones of the source file anymore.
+        self._blob_content = blob_content
+        self.source_content = None
+        self.source_header = None
+        self.cached_source_hash = None
+
+    def load_from_uri(self, as_gray=False, lazy=False, max_size=None):
         """
         Loads the blob from the URI.
         If the image couldn't be loaded, then is_load() method will return False.
+        :param as_gray: loads the image in gray scale.
+        :param lazy: if True, only the file is read now, and its pixels are decoded the first time they are needed.
+            Ignored for gray images, for images bigger than max_size and for files that are not JPEG or PNG, which are
+            decoded right away.
+        :param max_size: size boundaries in [width, height] format. Bigger images are resized to fit them, keeping their
+            aspect ratio. JPEG files are decoded at the smallest reduced scale (1/2, 1/4 or 1/8) that is not smaller
+            than the fitted size, and then resized from it.
         """
         uri = self.uri
-        color_flag = {False: cv2.IMREAD_COLOR, True: cv2.IMREAD_GRAYSCALE}[as_gray]
+        source_content = None
+        source_header = None
+
+        if lazy or max_size is not None:
+            try:
+                with open(uri, "rb") as source_file:
+                    source_content = source_file.read()
+
+            except OSError:
+                source_content = b""
+
+            source_header = read_image_header(source_content)
 
-        try:
-            blob_content = cv2.imread(uri, color_flag)
+        fit_scale = 1
 
-        except Exception as ex:
-            uri = os.fsencode(uri).decode('utf-8')
-            blob_content = cv2.imread(uri, color_flag)
+        if source_header is not None and max_size is not None:
+            fit_scale = get_fit_scale(source_header.get_decoded_size(), max_size)
+
+        if source_header is not None and lazy and not as_gray and fit_scale == 1:
+            self.update_blob(None)
+            self.source_content = source_content
+            self.source_header = source_header
+            return
+
+        reduction = 1
+
+        if source_header is not None:
+            reduction = get_reduction(source_header.image_format, fit_scale)
+
+        color_flag = {False: REDUCED_COLOR_FLAGS, True: REDUCED_GRAYSCALE_FLAGS}[as_gray][reduction]
+
+        if source_content is None:
+            try:
+                blob_content = cv2.imread(uri, color_flag)
+
+            except Exception as ex:
+                uri = os.fsencode(uri).decode('utf-8')
+                blob_content = cv2.imread(uri, color_flag)
+
+        elif source_content:
+            blob_content = cv2.imdecode(numpy.frombuffer(source_content, dtype=numpy.uint8), color_flag)
+
+        else:
+            blob_content = None
 
         if blob_content is None:
            blob_content = []
 
         self.update_blob(blob_content)
 
+        if max_size is not None and self.is_loaded() and get_fit_scale(self.get_size(), max_size) < 1:
+            self.resize_to(max_size)
+
+    def _decode_source(self):
+        """
+        Decodes the pixels of an image loaded lazily. If the file can't be decoded, the image is not loaded anymore.
+        """
+        blob_content = cv2.imdecode(numpy.frombuffer(self.source_content, dtype=numpy.uint8), cv2.IMREAD_COLOR)
+
+        if blob_content is None:
+            self.update_blob([])
+
+        else:
+            self._blob_content = blob_content
+
+    def decode_reduced(self, min_scale):
+        """
+        Decodes the pixels of an image loaded lazily at the smallest reduced scale (1/2, 1/4 or 1/8) that is not smaller
+        than the specified one, instead of at full size. Images already decoded are not touched.
+        :param min_scale: minimum scale of the decoded pixels regarding the size of the source file.
+        """
+        if self.is_decoded():
+            return
+
+        reduction = get_reduction(self.source_header.image_format, min_scale)
+
+        if reduction == 1:
+            self._decode_source()
+            return
+
+        blob_content = cv2.imdecode(numpy.frombuffer(self.source_content, dtype=numpy.uint8),
+                                    REDUCED_COLOR_FLAGS[reduction])
+
+        # The pixels are not the ones of the source file.
+        self.update_blob([] if blob_content is None else blob_content)
+
+    def is_decoded(self):
+        """
+        :return: False if the image was loaded lazily and its pixels were not needed yet, True otherwise.
+        """
+        return self._blob_content is not None or self.source_content is None
+
     def is_gray(self):
         """
         Checks whether the current image is in gray scale or not.
@@ -107,6 +361,9 @@ class Image(Resource):
         Checks if the image is loaded or not.
         :return: True if is loaded into memory, False otherwise.
         """
+        if not self.is_decoded():
+            return True
+
         return self.blob_content is not None and len(self.blob_content) > 0
 
     def get_blob(self, as_rgb=False):
@@ -129,7 +386,10 @@ class Image(Resource):
         :return: size of the image in [width, height] format.
         """
         size = ()
-        if self.is_loaded():
+        if not self.is_decoded():
+            size = self.source_header.get_decoded_size()
+
+        elif self.is_loaded():
             size = self.blob_content.shape[0:2][::-1]  # We reverse the order row, cols in order to get x, y
 
         return size
@@ -164,23 +424,32 @@ class Image(Resource):
         else:
             dim = (size[0], size[1])
 
-        self.blob_content = cv2.resize(self.blob_content, dim[::-1], interpolation=cv2.INTER_AREA)
+        self.update_blob(cv2.resize(self.blob_content, dim[::-1], interpolation=cv2.INTER_AREA))
 
     def update_blob(self, new_blob):
         """
         Updates the blob of the image.
         *Warning!* this method resets the flag that boolean saves that the image's pixels are in boolean format.
         If the blob is formed by boolean pixels, you must call convert_to_boolean() method again!.
+        The hashes and the encodings of the image are computed again the next time they are requested.
         :param new_blob: updated blob of the image.
         """
         self.blob_content = new_blob
+        self.cached_image_hash = None
+        self.cached_fast_hash = None
+        self.cached_encodings = {}
 
-        if new_blob is not None and len(new_blob) > 0:
-            self.cached_image_hash = hashlib.md5(self.blob_content).hexdigest()
+    def _get_hashable_content(self):
+        """
+        :return: content the hashes of the image are computed from: the pixels if the image is loaded, or its URI, ID
+            and metadata otherwise. The pixels of images loaded lazily are decoded for it, so the hashes don't depend
+            on how the image was loaded.
+        """
+        if self.is_loaded():
+            # Crops are views of the blob they come from, which hashlib can't read directly.
+            return numpy.ascontiguousarray(self.blob_content)
 
-        else:
-            id = "{}, {}, {}".format(self.uri, self.res_id, self.metadata).encode("UTF-8")
-            self.cached_image_hash = hashlib.md5(id).hexdigest()
+        return "{}, {}, {}".format(self.uri, self.res_id, self.metadata).encode("UTF-8")
 
     def convert_to_boolean(self):
         """
@@ -211,22 +480,89 @@ class Image(Resource):
 
     def md5hash(self):
         """
-        :return: the md5hash for the image content.
+        :return: the md5hash for the image content. It is computed on the first call after each update of the blob.
         """
+        if self.cached_image_hash is None:
+            self.cached_image_hash = hashlib.md5(self._get_hashable_content()).hexdigest()
+
         return self.cached_image_hash
 
+    def fast_hash(self):
+        """
+        Cheaper alternative to md5hash(), for keys that don't need to match the md5 of the content, like the ones of
+        caches. BLAKE2b runs faster than md5 on 64-bit CPUs.
+        :return: a 128-bit hash of the image content, in hexadecimal. It is computed on the first call after each
+            update of the blob.
+        """
+        if self.cached_fast_hash is None:
+            self.cached_fast_hash = hashlib.blake2b(self._get_hashable_content(), digest_size=16).hexdigest()
+
+        return self.cached_fast_hash
+
+    def source_hash(self):
+        """
+        Hash of the content of the source file, for keys that must not decode an image loaded lazily, like the ones of
+        caches. It differs from the hashes of the pixels.
+        :return: a 128-bit hash of the source file, in hexadecimal. None if the pixels are not the ones of a source
+            file.
+        """
+        if self.source_content is None:
+            return None
+
+        if self.cached_source_hash is None:
+            self.cached_source_hash = hashlib.blake2b(self.source_content, digest_size=16).hexdigest()
+
+        return self.cached_source_hash
+
     def get_jpeg(self):
         """
         :return: returns the image binary content in jpeg format.
         """
+        return self.encode(DEFAULT_ENCODING_POLICY)
+
+    def encode(self, encoding_policy=DEFAULT_ENCODING_POLICY):
+        """
+        Encodes the image as specified by the policy. The result is kept until the blob changes, so the image is
+        encoded once for all the consumers that share the same policy.
+        If the pixels are the ones of the source file, the file is in the format of the policy and it does not need to be
+        downscaled, the content of the file is returned as is. Files with an EXIF orientation are always encoded
+        again, since not every consumer applies it.
+        :param encoding_policy: EncodingPolicy to encode the image with.
+        :return: the encoded binary content, shared by all the callers: it must not be modified.
+        """
+        if self._can_use_source(encoding_policy):
+            return self.source_content
+
+        encoded_image = self.cached_encodings.get(encoding_policy.get_key())
+
+        if encoded_image is not None:
+            return encoded_image
 
         encoded_image = 0
 
         if self.is_loaded():
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 90]
-            result, encimg = cv2.imencode('.jpg', self.blob_content, encode_param)
+            blob = self.blob_content
+            encoded_size = encoding_policy.get_encoded_size(self.get_size())
+
+            if encoded_size != self.get_size():
+                blob = cv2.resize(blob, encoded_size, interpolation=cv2.INTER_AREA)
+
+            if encoding_policy.as_gray and len(blob.shape) == 3:
+                blob = cv2.cvtColor(blob, cv2.COLOR_BGR2GRAY)
+
+            result, encimg = cv2.imencode(encoding_policy.image_format, blob, encoding_policy.get_params())
 
             if result:
-                encoded_image = encimg.tostring()
+                encoded_image = encimg.tobytes()
+                self.cached_encodings[encoding_policy.get_key()] = encoded_image
 
         return encoded_image
+
+    def _can_use_source(self, encoding_policy):
+        """
+        :param encoding_policy: EncodingPolicy the image is going to be encoded with.
+        :return: True if the content of the source file is a valid encoding of the image for the policy.
+        """
+        return self.source_content is not None and not self.source_header.is_oriented() and \
+            not encoding_policy.as_gray and self.source_header.image_format == encoding_policy.image_format and \
+            encoding_policy.get_scale(self.get_size()) == 1
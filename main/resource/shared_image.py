@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from multiprocessing import shared_memory
+
+import numpy
+
+from main.resource.image import Image
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class SharedImage(object):
+    """
+    Handle to an image whose content lives in a shared memory segment. It is sent to worker processes instead of the
+    image, so the content is not pickled: only the name of the segment, the shape and the dtype of the blob and the size
+    of the source file travel through the pipe.
+    The segment holds the blob of the image, if it is decoded, followed by the content of its source file, if it was
+    loaded lazily. Images not decoded yet are shared as their source file, and decoded by the workers only if a filter
+    needs their pixels. The hashes of the image travel with the handle, so the workers see the same cache keys as this
+    process. The process that shares the image owns the segment, and must release it once the workers are done with it.
+    """
+
+    def __init__(self, image):
+        """
+        Copies the content of the image into a new shared memory segment.
+        :param image: loaded image to share.
+        """
+        blob = image.get_blob() if image.is_decoded() else None
+        source_content = image.source_content
+
+        self.uri = image.get_uri()
+        self.image_id = image.get_id()
+        self.metadata = image.get_metadata()
+        self.image_hash = image.cached_image_hash
+        self.fast_hash = image.cached_fast_hash
+        self.source_hash = image.cached_source_hash
+        self.source_header = image.source_header
+        self.shape = None if blob is None else blob.shape
+        self.dtype = None if blob is None else blob.dtype.str
+        self.blob_size = 0 if blob is None else blob.nbytes
+        self.source_size = 0 if source_content is None else len(source_content)
+
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=max(self.blob_size + self.source_size, 1))
+        self.name = self.shared_memory.name
+
+        if blob is not None:
+            shared_blob = numpy.ndarray(self.shape, dtype=blob.dtype, buffer=self.shared_memory.buf)
+            shared_blob[...] = blob
+            del shared_blob
+
+        if source_content is not None:
+            self.shared_memory.buf[self.blob_size:self.blob_size + self.source_size] = source_content
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['shared_memory'] = None
+
+        return state
+
+    def attach(self):
+        """
+        Maps the segment into this process. Must be paired with a detach() call.
+        :return: Image whose blob is a read-only view of the segment. The content of its source file, if any, is copied
+            out of the segment, since it is sent as is to the services.
+        """
+        self.shared_memory = shared_memory.SharedMemory(name=self.name)
+
+        image = Image(uri=self.uri, image_id=self.image_id, metadata=self.metadata)
+
+        if self.shape is None:
+            image.update_blob(None)
+
+        else:
+            blob = numpy.ndarray(self.shape, dtype=numpy.dtype(self.dtype), buffer=self.shared_memory.buf)
+            blob.flags.writeable = False
+            image.blob_content = blob
+
+        if self.source_header is not None:
+            image.source_content = bytes(self.shared_memory.buf[self.blob_size:self.blob_size + self.source_size])
+            image.source_header = self.source_header
+
+        image.cached_image_hash = self.image_hash
+        image.cached_fast_hash = self.fast_hash
+        image.cached_source_hash = self.source_hash
+
+        return image
+
+    def detach(self):
+        """
+        Unmaps the segment from this process. If views of the blob are still referenced (for example, by a result
+        of a filter), the segment is unmapped when they are garbage collected.
+        """
+        try:
+            self.shared_memory.close()
+
+        except BufferError:
+            pass
+
+    def release(self):
+        """
+        Frees the segment. Only the process that shared the image may call it.
+        """
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+
+def share_resource(resource):
+    """
+    Puts the blobs of the loaded images of a resource into shared memory.
+    :param resource: resource, or list of resources, to share.
+    :return: tuple (resource with the loaded images replaced by SharedImage handles, list of the handles created).
+    """
+    if isinstance(resource, list):
+        shared_resources = [share_resource(element) for element in resource]
+
+        return [shared_resource for shared_resource, _ in shared_resources], \
+            [handle for _, handles in shared_resources for handle in handles]
+
+    if isinstance(resource, Image) and resource.is_loaded():
+        handle = SharedImage(resource)
+
+        return handle, [handle]
+
+    return resource, []
+
+
+def attach_resource(resource):
+    """
+    Replaces the SharedImage handles of a resource with the images they point to.
+    :param resource: resource, or list of resources, as returned by share_resource().
+    :return: tuple (resource with the images attached, list of the handles to detach afterwards).
+    """
+    if isinstance(resource, list):
+        attached_resources = [attach_resource(element) for element in resource]
+
+        return [attached_resource for attached_resource, _ in attached_resources], \
+            [handle for _, handles in attached_resources for handle in handles]
+
+    if isinstance(resource, SharedImage):
+        return resource.attach(), [resource]
+
+    return resource, []
@@ -161,6 +161,18 @@ class BoundingBox(object):
         self.width += horizontally * 2
         self.height += vertically * 2
 
+    def scale(self, horizontal_factor, vertical_factor):
+        """
+        Scales the box coordinates, for example to map a box found in a resized image to the original one.
+
+        :param horizontal_factor: factor to multiply the x coordinate and the width by.
+        :param vertical_factor: factor to multiply the y coordinate and the height by.
+        """
+        self.x = int(round(self.x * horizontal_factor))
+        self.y = int(round(self.y * vertical_factor))
+        self.width = int(round(self.width * horizontal_factor))
+        self.height = int(round(self.height * vertical_factor))
+
     def fit_in_size(self, size_limit):
         """
         Adapts the size of the box in order to avoid exceeding the bounds specified in size_limit
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+
+__author__ = "Ivan de Paz Centeno"
+
+
+HEADER_FORMAT_JPEG = ".jpg"
+HEADER_FORMAT_PNG = ".png"
+
+# Start Of Frame markers of the JPEG format, which hold the dimensions of the image. C4, C8 and CC are not frames.
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Markers without a length field after them.
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+# EXIF orientations that rotate the image 90 or 270 degrees, swapping its width and height once decoded.
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+class ImageHeader(object):
+    """
+    Information read from the header of an encoded image, without decoding its pixels.
+    """
+
+    def __init__(self, image_format, size, orientation=1):
+        """
+        Initializes the header.
+        :param image_format: HEADER_FORMAT_JPEG or HEADER_FORMAT_PNG.
+        :param size: size of the encoded image in [width, height] format.
+        :param orientation: EXIF orientation of the image, 1 if it is not rotated.
+        """
+        self.image_format = image_format
+        self.size = size
+        self.orientation = orientation
+
+    def get_decoded_size(self):
+        """
+        :return: size in [width, height] format of the image once decoded, with its EXIF orientation applied.
+        """
+        if self.orientation in TRANSPOSED_ORIENTATIONS:
+            return self.size[::-1]
+
+        return self.size
+
+    def is_oriented(self):
+        """
+        :return: True if the decoded pixels are rotated or flipped regarding the encoded ones.
+        """
+        return self.orientation != 1
+
+
+def read_image_header(content):
+    """
+    Reads the header of an encoded image.
+    :param content: bytes-like content of a JPEG or PNG file.
+    :return: ImageHeader, None if the content is not a JPEG or a PNG or its header is not valid.
+    """
+    content = memoryview(content)
+
+    if content[:8] == b"\x89PNG\r\n\x1a\n":
+        return _read_png_header(content)
+
+    if content[:2] == b"\xff\xd8":
+        return _read_jpeg_header(content)
+
+    return None
+
+
+def _read_png_header(content):
+    """
+    :return: ImageHeader of a PNG, from its IHDR chunk.
+    """
+    if len(content) < 24 or content[12:16] != b"IHDR":
+        return None
+
+    width, height = struct.unpack(">II", content[16:24])
+
+    return ImageHeader(HEADER_FORMAT_PNG, (width, height))
+
+
+def _read_jpeg_header(content):
+    """
+    :return: ImageHeader of a JPEG, from its first Start Of Frame segment and its EXIF segment, if any.
+    """
+    orientation = 1
+    offset = 2
+
+    while offset + 4 <= len(content):
+        if content[offset] != 0xFF:
+            return None
+
+        marker = content[offset + 1]
+
+        if marker == 0xFF:
+            # Fill byte.
+            offset += 1
+            continue
+
+        if marker in JPEG_STANDALONE_MARKERS:
+            offset += 2
+            continue
+
+        length = struct.unpack(">H", content[offset + 2:offset + 4])[0]
+        segment = content[offset + 4:offset + 2 + length]
+
+        if marker in JPEG_SOF_MARKERS:
+            if len(segment) < 5:
+                return None
+
+            height, width = struct.unpack(">HH", segment[1:5])
+
+            return ImageHeader(HEADER_FORMAT_JPEG, (width, height), orientation)
+
+        if marker == 0xE1 and segment[:6] == b"Exif\x00\x00":
+            orientation = _read_exif_orientation(segment[6:])
+
+        offset += 2 + length
+
+    return None
+
+
+def _read_exif_orientation(tiff_content):
+    """
+    :param tiff_content: TIFF structure of an EXIF segment.
+    :return: orientation tag of its first IFD, 1 if it has none or the structure is not valid.
+    """
+    try:
+        byte_order = {b"II": "<", b"MM": ">"}[bytes(tiff_content[:2])]
+        ifd_offset = struct.unpack(byte_order + "I", tiff_content[4:8])[0]
+        entries_count = struct.unpack(byte_order + "H", tiff_content[ifd_offset:ifd_offset + 2])[0]
+
+        for index in range(entries_count):
+            entry_offset = ifd_offset + 2 + index * 12
+            tag, _, _, value = struct.unpack(byte_order + "HHIH", tiff_content[entry_offset:entry_offset + 10])
+
+            if tag == EXIF_ORIENTATION_TAG:
+                return value
+
+    except (KeyError, struct.error):
+        pass
+
+    return 1
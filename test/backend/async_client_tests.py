@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import unittest
+
+from aiohttp import web
+
+from main.backend.async_client import AsyncBackendClient
+from main.filter.advanced.age_estimation_filter import AgeEstimationFilter
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class JpegStub(object):
+    """
+    Stands for an image already encoded in JPEG.
+    """
+
+    def encode(self, encoding_policy):
+        return b"jpeg"
+
+
+class AsyncBackendClientTests(unittest.TestCase):
+    """
+    Test class for AsyncBackendClient methods
+    """
+
+    def test_max_in_flight_is_respected(self):
+        """
+        Tests if the client never exceeds the requests in flight limit of a service URL.
+        :return:
+        """
+        stats = {"in_flight": 0, "peak": 0}
+
+        async def handler(request):
+            await request.read()
+            stats["in_flight"] += 1
+            stats["peak"] = max(stats["peak"], stats["in_flight"])
+            await asyncio.sleep(0.01)
+            stats["in_flight"] -= 1
+            return web.Response(text=json.dumps({"Age_range": "(2, 4)"}))
+
+        async def scenario():
+            app = web.Application()
+            app.router.add_put("/estimation-requests/age/face/stream", handler)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = runner.addresses[0][1]
+
+            api_url = "http://127.0.0.1:{}/estimation-requests/age/face/stream?service=test".format(port)
+            client = AsyncBackendClient(max_in_flight=3)
+            age_filter = AgeEstimationFilter(1, api_url)
+            image = JpegStub()
+
+            try:
+                results = await asyncio.gather(*[age_filter.apply_to_async(image, client) for _ in range(12)])
+            finally:
+                await client.close()
+                await runner.cleanup()
+
+            return results
+
+        results = asyncio.run(scenario())
+
+        self.assertEqual(len(results), 12)
+        self.assertTrue(all(passed for (passed, _, _, _) in results))
+        self.assertEqual(results[0][3].get_range(), [2, 4])
+        self.assertLessEqual(stats["peak"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
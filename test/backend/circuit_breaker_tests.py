@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from main.backend.circuit_breaker import CircuitBreaker, CIRCUIT_CLOSED, CIRCUIT_OPEN, CIRCUIT_HALF_OPEN
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class CircuitBreakerTests(unittest.TestCase):
+    """
+    Test class for CircuitBreaker methods
+    """
+
+    def test_opens_after_consecutive_failures(self):
+        """
+        Tests if the circuit opens after the threshold of consecutive failures, and a success in between resets the
+        count.
+        :return:
+        """
+        circuit_breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+
+        circuit_breaker.record_failure()
+        circuit_breaker.record_failure()
+        circuit_breaker.record_success()
+        circuit_breaker.record_failure()
+        circuit_breaker.record_failure()
+
+        self.assertEqual(circuit_breaker.get_state(), CIRCUIT_CLOSED)
+        self.assertTrue(circuit_breaker.allow_request())
+
+        circuit_breaker.record_failure()
+
+        self.assertEqual(circuit_breaker.get_state(), CIRCUIT_OPEN)
+        self.assertFalse(circuit_breaker.allow_request())
+
+    def test_half_open_probe(self):
+        """
+        Tests if a single probe is let through once the reset timeout is over, and its outcome closes or opens the
+        circuit again.
+        :return:
+        """
+        circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+        circuit_breaker.record_failure()
+        time.sleep(0.15)
+
+        self.assertTrue(circuit_breaker.allow_request())
+        self.assertEqual(circuit_breaker.get_state(), CIRCUIT_HALF_OPEN)
+        self.assertFalse(circuit_breaker.allow_request())
+
+        circuit_breaker.record_failure()
+
+        self.assertEqual(circuit_breaker.get_state(), CIRCUIT_OPEN)
+        self.assertFalse(circuit_breaker.allow_request())
+
+        time.sleep(0.15)
+
+        self.assertTrue(circuit_breaker.allow_request())
+        circuit_breaker.record_success()
+
+        self.assertEqual(circuit_breaker.get_state(), CIRCUIT_CLOSED)
+        self.assertTrue(circuit_breaker.allow_request())
+
+    def test_cancelled_probe(self):
+        """
+        Tests if a probe that was never sent opens the circuit again, and the next request becomes the probe.
+        :return:
+        """
+        circuit_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+        circuit_breaker.record_failure()
+        time.sleep(0.15)
+
+        self.assertTrue(circuit_breaker.allow_request())
+
+        circuit_breaker.cancel_probe()
+
+        self.assertEqual(circuit_breaker.get_state(), CIRCUIT_OPEN)
+        self.assertTrue(circuit_breaker.allow_request())
+        self.assertEqual(circuit_breaker.get_state(), CIRCUIT_HALF_OPEN)
+
+
+if __name__ == '__main__':
+    unittest.main()
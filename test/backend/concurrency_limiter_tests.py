@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from main.backend.concurrency_limiter import ConcurrencyLimiter, GAUGE_PREFIX
+from main.metrics.metrics_registry import get_metrics_registry
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class ConcurrencyLimiterTests(unittest.TestCase):
+    """
+    Test class for ConcurrencyLimiter methods
+    """
+
+    def test_limit_grows_while_saturated(self):
+        """
+        Tests if the limit grows when all the slots are used and the latency stays flat, and does not grow when they
+        are not.
+        :return:
+        """
+        limiter = ConcurrencyLimiter("grow", initial_limit=2, max_limit=10)
+
+        # Every request takes 10 ms.
+        limiter.acquire(timeout=1)
+        limiter.release(time.monotonic() - 0.01)
+
+        self.assertEqual(limiter.get_limit(), 2)
+
+        for _ in range(4):
+            limiter.acquire(timeout=1)
+            limiter.acquire(timeout=1)
+            limiter.release(time.monotonic() - 0.01)
+            limiter.release(time.monotonic() - 0.01)
+
+        self.assertEqual(limiter.get_limit(), 3)
+
+    def test_limit_cut_on_failure(self):
+        """
+        Tests if the limit is cut when a request fails, once for the requests sent under the same limit.
+        :return:
+        """
+        limiter = ConcurrencyLimiter("failure", initial_limit=10)
+
+        start_times = [limiter.acquire() for _ in range(3)]
+
+        for start_time in start_times:
+            limiter.release(start_time, failed=True)
+
+        self.assertEqual(limiter.get_limit(), 7)
+
+        start_time = limiter.acquire()
+        limiter.release(start_time, failed=True)
+
+        self.assertEqual(limiter.get_limit(), 4)
+
+    def test_limit_cut_on_slow_request(self):
+        """
+        Tests if the limit is cut when the recent latency is much higher than the baseline latency of the service, and
+        not because of a single slow request.
+        :return:
+        """
+        limiter = ConcurrencyLimiter("slow", initial_limit=10)
+
+        for _ in range(10):
+            limiter.acquire(timeout=1)
+            limiter.release(time.monotonic() - 0.01)
+
+        limiter.acquire(timeout=1)
+        limiter.release(time.monotonic() - 0.03)
+
+        self.assertEqual(limiter.get_limit(), 10)
+
+        limiter.acquire(timeout=1)
+        limiter.release(time.monotonic() - 0.1)
+
+        self.assertEqual(limiter.get_limit(), 7)
+
+    def test_acquire_waits_for_a_slot(self):
+        """
+        Tests if acquire blocks at the limit until a slot is released, and times out if none is.
+        :return:
+        """
+        limiter = ConcurrencyLimiter("wait", initial_limit=1)
+        start_time = limiter.acquire()
+
+        with self.assertRaises(TimeoutError):
+            limiter.acquire(timeout=0.05)
+
+        threading.Timer(0.05, limiter.release, args=(start_time,)).start()
+        limiter.release(limiter.acquire(timeout=1))
+
+    def test_limit_request(self):
+        """
+        Tests if the context manager releases the slot, and records the failures selected by is_failure.
+        :return:
+        """
+        limiter = ConcurrencyLimiter("context", initial_limit=10, is_failure=lambda error: isinstance(error,
+                                                                                                      TimeoutError))
+
+        with self.assertRaises(ValueError):
+            with limiter.limit_request():
+                raise ValueError()
+
+        self.assertEqual(limiter.get_limit(), 10)
+
+        with self.assertRaises(TimeoutError):
+            with limiter.limit_request():
+                raise TimeoutError()
+
+        self.assertEqual(limiter.get_limit(), 7)
+        self.assertEqual(limiter.in_flight, 0)
+
+    def test_gauge_published(self):
+        """
+        Tests if the current limit is published as a gauge.
+        :return:
+        """
+        limiter = ConcurrencyLimiter("gauge", initial_limit=5)
+        gauge_name = "{}[gauge]".format(GAUGE_PREFIX)
+
+        self.assertEqual(get_metrics_registry().get_snapshot()['gauge'][gauge_name], 5)
+
+        limiter.release(limiter.acquire(), failed=True)
+
+        self.assertEqual(get_metrics_registry().get_snapshot()['gauge'][gauge_name], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
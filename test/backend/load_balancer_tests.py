@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from main.backend.load_balancer import LoadBalancer, POLICY_LATENCY_WEIGHTED, replace_host
+
+__author__ = "Ivan de Paz Centeno"
+
+
+HOSTS = ["http://gpu1:9095", "http://gpu2:9095"]
+
+
+class LoadBalancerTests(unittest.TestCase):
+    """
+    Test class for LoadBalancer methods
+    """
+
+    def test_least_outstanding(self):
+        """
+        Tests if the requests in flight are spread evenly across the replicas.
+        :return:
+        """
+        load_balancer = LoadBalancer(HOSTS)
+
+        hosts = [load_balancer.acquire() for _ in range(4)]
+
+        self.assertEqual(sorted(hosts), sorted(HOSTS * 2))
+
+        load_balancer.release("http://gpu1:9095")
+
+        self.assertEqual(load_balancer.acquire(), "http://gpu1:9095")
+
+    def test_latency_weighted(self):
+        """
+        Tests if the fastest replica receives the requests until its requests in flight make it slower than the
+        others.
+        :return:
+        """
+        load_balancer = LoadBalancer(HOSTS, policy=POLICY_LATENCY_WEIGHTED)
+
+        latencies = {"http://gpu1:9095": 0.1, "http://gpu2:9095": 0.25}
+
+        for _ in HOSTS:
+            host = load_balancer.acquire()
+            load_balancer.release(host, latencies[host])
+
+        self.assertEqual([load_balancer.acquire() for _ in range(3)],
+                         ["http://gpu1:9095", "http://gpu1:9095", "http://gpu2:9095"])
+
+    def test_failing_replica_is_ejected(self):
+        """
+        Tests if a replica that fails consecutively stops receiving requests until its ejection time is over or it
+        passes a health check.
+        :return:
+        """
+        healthy_hosts = []
+        load_balancer = LoadBalancer(HOSTS, failure_threshold=2, ejection_time=0.2,
+                                     health_check=lambda host: host in healthy_hosts)
+
+        for _ in range(2):
+            [load_balancer.acquire() for _ in HOSTS]
+            load_balancer.release("http://gpu1:9095", failed=True)
+            load_balancer.release("http://gpu2:9095", 0.1)
+
+        self.assertEqual(load_balancer.get_ejected_hosts(), ["http://gpu1:9095"])
+        self.assertEqual(set(load_balancer.acquire() for _ in range(4)), {"http://gpu2:9095"})
+
+        load_balancer.check_health()
+        self.assertEqual(load_balancer.get_ejected_hosts(), ["http://gpu1:9095"])
+
+        healthy_hosts.append("http://gpu1:9095")
+        load_balancer.check_health()
+        self.assertEqual(load_balancer.get_ejected_hosts(), [])
+
+        load_balancer.acquire()
+        load_balancer.release("http://gpu1:9095", failed=True)
+        self.assertEqual(load_balancer.get_ejected_hosts(), ["http://gpu1:9095"])
+
+        time.sleep(0.25)
+        self.assertEqual(load_balancer.get_ejected_hosts(), [])
+
+    def test_route(self):
+        """
+        Tests if the URL routed keeps its path and query, and an error raised while using it counts as a failure of
+        the replica.
+        :return:
+        """
+        load_balancer = LoadBalancer(["http://gpu2:9095"], failure_threshold=1)
+
+        with load_balancer.route("http://gpu1:9095/detection-requests/faces/stream?service=x") as url:
+            self.assertEqual(url, "http://gpu2:9095/detection-requests/faces/stream?service=x")
+
+        with self.assertRaises(ConnectionError):
+            with load_balancer.route("http://gpu1:9095/detection-requests/faces/stream?service=x"):
+                raise ConnectionError()
+
+        self.assertEqual(load_balancer.get_ejected_hosts(), ["http://gpu2:9095"])
+
+        self.assertEqual(replace_host("http://a:1/b?c=d", "https://e:2"), "https://e:2/b?c=d")
+
+    def test_close_stops_health_check(self):
+        """
+        Tests if closing the balancer stops its health check thread.
+        :return:
+        """
+        load_balancer = LoadBalancer(HOSTS, health_check_interval=0.01, health_check=lambda host: True)
+
+        self.assertTrue(load_balancer.health_check_thread.is_alive())
+
+        load_balancer.close()
+
+        self.assertFalse(load_balancer.health_check_thread.is_alive())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import random
+import unittest
+
+import cv2
+import numpy
+import requests
+
+from main.backend.mock_backend import MockBackend, MockService, LatencyDistribution, FACE_DETECTION_PATH, \
+    AGE_ESTIMATION_PATH
+from main.tools.boundingbox import BoundingBox
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class MockBackendTests(unittest.TestCase):
+    """
+    Test class for MockBackend methods
+    """
+
+    def setUp(self):
+        self.mock_backend = MockBackend(max_faces=5)
+        self.mock_backend.start()
+
+        blob = numpy.random.RandomState(0).randint(0, 256, (240, 320, 3)).astype(numpy.uint8)
+        self.jpeg = cv2.imencode(".jpg", blob)[1].tobytes()
+
+    def tearDown(self):
+        self.mock_backend.stop()
+
+    def test_outputs_are_deterministic(self):
+        """
+        Tests if the same image always gets the same response, and the bounding boxes fit inside the image.
+        :return:
+        """
+        url = self.mock_backend.get_url() + FACE_DETECTION_PATH + "/stream?service=mock"
+
+        responses = [requests.put(url, data=self.jpeg) for _ in range(2)]
+
+        self.assertEqual([response.status_code for response in responses], [200, 200])
+        self.assertEqual(responses[0].text, responses[1].text)
+
+        for bounding_box_string in json.loads(responses[0].text)['bounding_boxes']:
+            x, y, width, height = BoundingBox.from_string(bounding_box_string).get_box()
+            self.assertTrue(0 <= x and x + width <= 320 and 0 <= y and y + height <= 240)
+
+    def test_batch_requests(self):
+        """
+        Tests if a batch request gets the same responses as single requests.
+        :return:
+        """
+        url = self.mock_backend.get_url() + AGE_ESTIMATION_PATH
+
+        single_response = json.loads(requests.put(url + "/stream", data=self.jpeg).text)
+        batch_response = json.loads(requests.put(url + "/batch", files=[("images", ("0.jpg", self.jpeg)),
+                                                                        ("images", ("1.jpg", self.jpeg))]).text)
+
+        self.assertEqual(batch_response['results'], [single_response, single_response])
+        self.assertEqual(self.mock_backend.get_requests_count(), {AGE_ESTIMATION_PATH + "/stream": 1,
+                                                                  AGE_ESTIMATION_PATH + "/batch": 1})
+
+    def test_injected_errors(self):
+        """
+        Tests if a service with error rate 1 always fails.
+        :return:
+        """
+        self.mock_backend.age_estimation_service = MockService(error_rate=1)
+        url = self.mock_backend.get_url() + AGE_ESTIMATION_PATH + "/stream"
+
+        self.assertEqual(requests.put(url, data=self.jpeg).status_code, 500)
+        self.assertEqual(requests.put(self.mock_backend.get_url() + "/unknown", data=self.jpeg).status_code, 404)
+
+    def test_latency_distributions(self):
+        """
+        Tests if the latency distributions have the specified mean.
+        :return:
+        """
+        random_generator = random.Random(0)
+
+        for text in ["constant:0.05", "uniform:0.05:0.02", "normal:0.05:0.01", "lognormal:0.05:0.02"]:
+            latency = LatencyDistribution.from_string(text)
+            samples = [latency.sample(random_generator) for _ in range(5000)]
+
+            self.assertAlmostEqual(sum(samples) / len(samples), 0.05, places=2)
+            self.assertTrue(min(samples) >= 0)
+
+        with self.assertRaises(Exception):
+            LatencyDistribution.from_string("exponential:0.05")
+
+
+if __name__ == '__main__':
+    unittest.main()
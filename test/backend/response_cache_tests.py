@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import pickle
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy
+
+from main.backend.response_cache import ResponseCache
+from main.resource.image import Image
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class ResponseCacheTests(unittest.TestCase):
+    """
+    Test class for ResponseCache methods
+    """
+
+    def test_responses_are_addressed_by_image_and_url(self):
+        """
+        Tests if a response is only retrieved for the same image hash and service URL, and hits and misses are counted.
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResponseCache(folder)
+            cache.put("hash1", "http://backend/estimation?service=a", {"Age_range": "(2, 4)"})
+
+            self.assertEqual(cache.get("hash1", "http://backend/estimation?service=a"), {"Age_range": "(2, 4)"})
+            self.assertIsNone(cache.get("hash1", "http://backend/estimation?service=b"))
+            self.assertIsNone(cache.get("hash2", "http://backend/estimation?service=a"))
+            self.assertEqual(cache.get_hits(), 1)
+            self.assertEqual(cache.get_misses(), 2)
+
+            # A cache over the same folder (for example, in a new run) finds the stored response.
+            self.assertIsNotNone(ResponseCache(folder).get("hash1", "http://backend/estimation?service=a"))
+
+    def test_least_recently_used_responses_are_evicted(self):
+        """
+        Tests if eviction removes the least recently used responses until the size fits the maximum.
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResponseCache(folder, max_size=100)
+
+            for index in range(4):
+                cache.put("hash{}".format(index), "url", {"bounding_boxes": ["[0, 0, 10, 10]"]})
+
+            cache.get("hash0", "url")
+            cache.evict()
+
+            self.assertLessEqual(cache.get_size(), 100)
+            self.assertIsNotNone(cache.get("hash0", "url"))
+            self.assertIsNone(cache.get("hash1", "url"))
+
+    def test_images_addressed_by_fast_hash(self):
+        """
+        Tests if the cache addresses the images by their fast hash when configured to.
+        :return:
+        """
+        image = Image(uri="image.jpg", blob_content=numpy.ones((4, 4, 3), dtype=numpy.uint8))
+
+        with tempfile.TemporaryDirectory() as folder:
+            self.assertEqual(ResponseCache(folder).get_image_hash(image), image.md5hash())
+            self.assertEqual(ResponseCache(folder, fast_image_hash=True).get_image_hash(image), image.fast_hash())
+
+    def test_lazy_images_are_not_decoded(self):
+        """
+        Tests if images loaded lazily are addressed by their source file without decoding it, and their responses are
+        found again once decoded, but not once their pixels change.
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            uri = os.path.join(folder, "image.jpg")
+            cv2.imwrite(uri, numpy.ones((4, 4, 3), dtype=numpy.uint8))
+
+            image = Image(uri=uri)
+            image.load_from_uri(lazy=True)
+
+            cache = ResponseCache(folder)
+            self.assertIsNone(cache.get(cache.get_image_hash(image), "url"))
+            cache.put(cache.get_image_hash(image), "url", {"Age_range": "(2, 4)"})
+
+            self.assertFalse(image.is_decoded())
+
+            image.get_blob()
+            self.assertEqual(cache.get(cache.get_image_hash(image), "url"), {"Age_range": "(2, 4)"})
+
+            image.update_blob(numpy.zeros((4, 4, 3), dtype=numpy.uint8))
+            self.assertIsNone(cache.get(cache.get_image_hash(image), "url"))
+
+    def test_cache_can_be_pickled(self):
+        """
+        Tests if the cache can be sent to worker processes along with the filters.
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResponseCache(folder)
+            cache.put("hash1", "url", {"Age_range": "(2, 4)"})
+
+            unpickled_cache = pickle.loads(pickle.dumps(cache))
+
+            self.assertEqual(unpickled_cache.get("hash1", "url"), {"Age_range": "(2, 4)"})
+
+    def test_counters_from_several_threads(self):
+        """
+        Tests if the hits and misses of lookups made by several threads at once are all counted.
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ResponseCache(folder)
+            cache.put("hash1", "url", {"Age_range": "(2, 4)"})
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                list(executor.map(lambda index: cache.get("hash{}".format(index % 2), "url"), range(400)))
+
+            self.assertEqual(cache.get_hits(), 200)
+            self.assertEqual(cache.get_misses(), 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+
+from main.backend.retry_policy import RetryPolicy
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class RetryPolicyTests(unittest.TestCase):
+    """
+    Test class for RetryPolicy methods
+    """
+
+    def setUp(self):
+        self.calls_count = 0
+
+    def _fail_twice(self):
+        self.calls_count += 1
+
+        if self.calls_count <= 2:
+            raise ConnectionError("Backend is restarting.")
+
+        return "response"
+
+    def _fail_always(self):
+        self.calls_count += 1
+        raise ConnectionError("Backend is down.")
+
+    def test_retries_until_success(self):
+        """
+        Tests if a call is retried while it fails, up to the maximum attempts.
+        :return:
+        """
+        self.assertEqual(RetryPolicy(max_attempts=3, base_delay=0.01).call(self._fail_twice), "response")
+        self.assertEqual(self.calls_count, 3)
+
+        self.calls_count = 0
+
+        with self.assertRaises(ConnectionError):
+            RetryPolicy(max_attempts=2, base_delay=0.01).call(self._fail_twice)
+
+        self.assertEqual(self.calls_count, 2)
+
+    def test_errors_not_retryable(self):
+        """
+        Tests if an error that is not retryable is raised right away.
+        :return:
+        """
+        retry_policy = RetryPolicy(max_attempts=3, base_delay=0.01)
+
+        with self.assertRaises(ConnectionError):
+            retry_policy.call(self._fail_twice, is_retryable=lambda error: False)
+
+        self.assertEqual(self.calls_count, 1)
+
+    def test_no_retries_past_deadline(self):
+        """
+        Tests if a failed call is not retried when the wait before the retry would reach the deadline.
+        :return:
+        """
+        retry_policy = RetryPolicy(max_attempts=1000, base_delay=0.01, max_delay=0.01)
+        start_time = time.monotonic()
+
+        with self.assertRaises(ConnectionError):
+            retry_policy.call(self._fail_always, deadline=start_time + 0.1)
+
+        self.assertLess(time.monotonic(), start_time + 0.1)
+        self.assertGreater(self.calls_count, 1)
+        self.assertLess(self.calls_count, 1000)
+
+    def test_delays_are_bounded(self):
+        """
+        Tests if the jittered delays stay below the exponential bound and the maximum delay.
+        :return:
+        """
+        retry_policy = RetryPolicy(base_delay=1, max_delay=3)
+
+        for retry_index in range(5):
+            self.assertTrue(0 <= retry_policy.get_delay(retry_index) <= min(3, 2 ** retry_index))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import unittest
+
+from main.backend.session_pool import SessionPool, get_session_pool
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class SessionPoolTests(unittest.TestCase):
+    """
+    Test class for SessionPool methods
+    """
+
+    def test_sessions_are_shared_by_host(self):
+        """
+        Tests if the URLs of the same host share the session and different hosts do not.
+        :return:
+        """
+        pool = SessionPool()
+
+        session1 = pool.get_session("http://127.0.0.1:9095/detection-requests/faces/stream?service=a")
+        session2 = pool.get_session("http://127.0.0.1:9095/estimation-requests/age/face/stream?service=b")
+        session3 = pool.get_session("http://127.0.0.2:9095/detection-requests/faces/stream?service=a")
+
+        self.assertIs(session1, session2)
+        self.assertIsNot(session1, session3)
+        self.assertEqual(len(pool), 2)
+
+        pool.close()
+        self.assertEqual(len(pool), 0)
+
+    def test_idle_sessions_are_evicted(self):
+        """
+        Tests if the sessions unused for longer than the idle timeout are closed.
+        :return:
+        """
+        pool = SessionPool(idle_timeout=-1)
+
+        session1 = pool.get_session("http://127.0.0.1:9095/")
+        pool.get_session("http://127.0.0.2:9095/")
+
+        self.assertEqual(len(pool), 1)
+        self.assertIsNot(pool.get_session("http://127.0.0.1:9095/"), session1)
+
+    def test_held_sessions_are_not_evicted(self):
+        """
+        Tests if a session held by a thread is not closed while it is idle for longer than the timeout.
+        :return:
+        """
+        pool = SessionPool(idle_timeout=-1)
+
+        with pool.hold_session("http://127.0.0.1:9095/") as session1:
+            pool.get_session("http://127.0.0.2:9095/")
+
+            self.assertEqual(len(pool), 2)
+            self.assertIs(pool.get_session("http://127.0.0.1:9095/"), session1)
+
+        pool.get_session("http://127.0.0.2:9095/")
+        self.assertEqual(len(pool), 1)
+
+    def test_pool_size_is_grown(self):
+        """
+        Tests if growing the pool size of a host resizes its existing session, and a smaller size is ignored.
+        :return:
+        """
+        pool = SessionPool(pool_size=16)
+        session = pool.get_session("http://127.0.0.1:9095/")
+
+        pool.ensure_pool_size("http://127.0.0.1:9095", 32)
+        pool.ensure_pool_size("http://127.0.0.1:9095", 8)
+
+        self.assertEqual(session.get_adapter("http://127.0.0.1:9095/")._pool_maxsize, 32)
+        self.assertEqual(pool.get_session("http://127.0.0.2:9095/").get_adapter("http://127.0.0.2:9095/")._pool_maxsize,
+                         16)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "fork() is required.")
+    def test_forked_process_starts_with_empty_pool(self):
+        """
+        Tests if a forked process does not inherit the sessions of its parent.
+        :return:
+        """
+        get_session_pool().get_session("http://127.0.0.1:9095/")
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+
+        if pid == 0:
+            os.close(read_fd)
+            os.write(write_fd, str(len(get_session_pool())).encode())
+            os._exit(0)
+
+        os.close(write_fd)
+        child_pool_size = int(os.read(read_fd, 16))
+        os.close(read_fd)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(child_pool_size, 0)
+        self.assertGreater(len(get_session_pool()), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import tempfile
+import unittest
+
+import numpy
+
+from main.resource.image import Image
+from main.tools.age_range import AgeRange
+
+try:
+    from main.dataset.generic_image_age_dataset import GenericImageAgeDataset
+
+except ImportError:
+    # The dataset depends on caffe and lmdb.
+    GenericImageAgeDataset = None
+
+__author__ = "Ivan de Paz Centeno"
+
+
+@unittest.skipIf(GenericImageAgeDataset is None, "caffe and lmdb are required.")
+class GenericImageAgeDatasetTests(unittest.TestCase):
+    """
+    Test class for the labels log of GenericImageAgeDataset
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root_folder = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _put_face(self, dataset, age):
+        """
+        Puts a face image labeled with the specified age into the dataset.
+        :return:
+        """
+        image = Image(uri="face.jpg", metadata=[AgeRange(age, age + 1)],
+                      blob_content=numpy.zeros((4, 4, 3), dtype=numpy.uint8))
+        dataset.put_image(image)
+
+    def _load(self):
+        dataset = GenericImageAgeDataset(self.root_folder)
+        dataset.load_dataset()
+
+        return dataset
+
+    def _get_labels(self, dataset):
+        return {key: dataset.get_key_metadata(key).get_range() for key in dataset.get_keys()}
+
+    def test_log_is_replayed_over_metadata_file(self):
+        """
+        Tests if loading a dataset applies the labels log on top of the metadata file.
+        :return:
+        """
+        dataset = GenericImageAgeDataset(self.root_folder)
+        self._put_face(dataset, 2)
+        dataset.save_dataset()
+
+        self._put_face(dataset, 4)
+        dataset.save_labels_log()
+
+        self.assertEqual(self._get_labels(self._load()), {"2-3/0.jpg": [2, 3], "4-5/0.jpg": [4, 5]})
+
+    def test_truncated_log_line_is_ignored(self):
+        """
+        Tests if a truncated last line of the log is ignored when loading, and the labels appended afterwards are not
+        merged into it.
+        :return:
+        """
+        dataset = GenericImageAgeDataset(self.root_folder)
+        self._put_face(dataset, 2)
+        dataset.save_labels_log()
+
+        with open(dataset.get_labels_log_filename(), "a") as file:
+            file.write('["2-3/1.jpg", "(2')
+
+        restarted_dataset = self._load()
+
+        self.assertEqual(self._get_labels(restarted_dataset), {"2-3/0.jpg": [2, 3]})
+
+        self._put_face(restarted_dataset, 2)
+        restarted_dataset.save_labels_log()
+
+        self.assertEqual(self._get_labels(self._load()), {"2-3/0.jpg": [2, 3], "2-3/1.jpg": [2, 3]})
+
+    def test_save_dataset_compacts_log(self):
+        """
+        Tests if saving the dataset writes every label into the metadata file, through a temporary file, and removes
+        the log.
+        :return:
+        """
+        dataset = GenericImageAgeDataset(self.root_folder)
+        self._put_face(dataset, 2)
+        dataset.save_labels_log()
+        self._put_face(dataset, 4)
+
+        dataset.save_dataset()
+
+        self.assertFalse(os.path.exists(dataset.get_labels_log_filename()))
+        self.assertEqual(sorted(os.listdir(self.root_folder)), ["2-3", "4-5", "labels.json"])
+
+        with open(os.path.join(self.root_folder, "labels.json")) as file:
+            self.assertEqual(json.load(file), {"2-3/0.jpg": "(2, 3)", "4-5/0.jpg": "(4, 5)"})
+
+        self.assertEqual(self._get_labels(self._load()), {"2-3/0.jpg": [2, 3], "4-5/0.jpg": [4, 5]})
+
+    def test_is_saved_with_log_only(self):
+        """
+        Tests if a dataset with only a labels log counts as saved.
+        :return:
+        """
+        dataset = GenericImageAgeDataset(self.root_folder)
+
+        self.assertFalse(dataset.is_saved())
+
+        self._put_face(dataset, 2)
+        dataset.save_labels_log()
+
+        self.assertFalse(os.path.exists(os.path.join(self.root_folder, "labels.json")))
+        self.assertTrue(dataset.is_saved())
+        self.assertEqual(self._get_labels(self._load()), {"2-3/0.jpg": [2, 3]})
+
+    def test_import_from_dataset_twice(self):
+        """
+        Tests if importing the same dataset twice does not duplicate its images.
+        :return:
+        """
+        shard_dataset = GenericImageAgeDataset(os.path.join(self.root_folder, "shard"))
+        self._put_face(shard_dataset, 2)
+        self._put_face(shard_dataset, 4)
+        shard_dataset.save_dataset()
+        shard_dataset = GenericImageAgeDataset(shard_dataset.get_root_folder())
+        shard_dataset.load_dataset()
+
+        merged_dataset = GenericImageAgeDataset(os.path.join(self.root_folder, "merged"))
+
+        self.assertEqual(merged_dataset.import_from_dataset(shard_dataset), 2)
+        merged_dataset.save_dataset()
+
+        merged_dataset = GenericImageAgeDataset(merged_dataset.get_root_folder())
+        merged_dataset.load_dataset()
+
+        self.assertEqual(merged_dataset.import_from_dataset(shard_dataset), 0)
+        self.assertEqual(self._get_labels(merged_dataset), {"2-3/0.jpg": [2, 3], "4-5/0.jpg": [4, 5]})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+from main.dataset.processed_journal import ProcessedJournal, OUTCOME_ACCEPTED, OUTCOME_DISCARDED, OUTCOME_FAILED
+from main.tools.age_range import AgeRange
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class ProcessedJournalTests(unittest.TestCase):
+    """
+    Test class for ProcessedJournal methods
+    """
+
+    def test_flushed_records_are_loaded_on_restart(self):
+        """
+        Tests if a new journal over the same folder knows the elements flushed by the previous one, and only them.
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            journal = ProcessedJournal(folder)
+            journal.record("hash1", OUTCOME_ACCEPTED, [AgeRange(2, 3)])
+            journal.record("hash2", OUTCOME_DISCARDED)
+            journal.flush()
+            journal.record("hash3", OUTCOME_FAILED)
+
+            restarted_journal = ProcessedJournal(folder)
+            restarted_journal.load()
+
+            self.assertTrue(restarted_journal.is_processed("hash1"))
+            self.assertEqual(restarted_journal.get_outcome("hash2"), OUTCOME_DISCARDED)
+            self.assertFalse(restarted_journal.is_processed("hash3"))
+            self.assertEqual(len(restarted_journal), 2)
+
+    def test_truncated_line_is_ignored(self):
+        """
+        Tests if a line partially written by a killed run does not prevent loading the journal.
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as folder:
+            journal = ProcessedJournal(folder)
+            journal.record("hash1", OUTCOME_ACCEPTED, [AgeRange(2, 3)])
+            journal.flush()
+
+            with open(os.path.join(folder, "journal.jsonl"), 'a') as file:
+                file.write('{"hash": "hash2", "outc')
+
+            restarted_journal = ProcessedJournal(folder)
+            restarted_journal.load()
+
+            self.assertEqual(restarted_journal.get_outcome("hash1"), OUTCOME_ACCEPTED)
+            self.assertFalse(restarted_journal.is_processed("hash2"))
+
+            restarted_journal.record("hash3", OUTCOME_DISCARDED)
+            restarted_journal.flush()
+            restarted_journal.load()
+
+            self.assertEqual(restarted_journal.get_outcome("hash3"), OUTCOME_DISCARDED)
+
+
+if __name__ == '__main__':
+    unittest.main()
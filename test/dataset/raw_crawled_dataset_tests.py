@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from main.dataset.raw_crawled_dataset import RawCrawledDataset
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class RawCrawledDatasetTests(unittest.TestCase):
+    """
+    Test class for RawCrawledDataset methods
+    """
+
+    def test_shards_partition_the_metadata(self):
+        """
+        Tests if every element belongs to exactly one shard, and the assignment is stable.
+        :return:
+        """
+        dataset = RawCrawledDataset("/tmp/nonexistent_raw_dataset")
+        dataset.metadata_content = {"hash{}".format(index): {"metadata": {}} for index in range(200)}
+
+        shards = [dataset.get_shard_metadata_content(shard_index, 4) for shard_index in range(4)]
+
+        self.assertEqual(sum(len(shard) for shard in shards), 200)
+        self.assertEqual(set().union(*[set(shard) for shard in shards]), set(dataset.metadata_content))
+        self.assertTrue(all(len(shard) > 0 for shard in shards))
+        self.assertEqual(RawCrawledDataset.get_shard_index("hash7", 4), RawCrawledDataset.get_shard_index("hash7", 4))
+        self.assertIn("hash7", shards[RawCrawledDataset.get_shard_index("hash7", 4)])
+
+    def test_shard_index_out_of_range(self):
+        """
+        Tests if an invalid shard index is rejected.
+        :return:
+        """
+        dataset = RawCrawledDataset("/tmp/nonexistent_raw_dataset")
+
+        with self.assertRaises(Exception):
+            dataset.get_shard_metadata_content(4, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
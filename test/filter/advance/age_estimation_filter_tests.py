@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import email
+import json
+import threading
+import time
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from main.backend.circuit_breaker import CircuitOpenError, CIRCUIT_CLOSED
+from main.backend.concurrency_limiter import get_concurrency_limiter, ConcurrencyLimitTimeout
+from main.backend.latency_tracker import get_latency_tracker
+from main.backend.load_balancer import get_load_balancer
+from main.backend.retry_policy import RetryPolicy
+from main.filter.advanced.age_estimation_filter import AgeEstimationFilter
+from main.filter.basic.backend_filter import is_timed_out, BackendError, HEDGE_MIN_SAMPLES
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class JpegStub(object):
+    """
+    Stands for an image already encoded in JPEG. The content is the age that the stub backend answers with.
+    """
+
+    def __init__(self, age):
+        self.age = age
+
+    def encode(self, encoding_policy):
+        return str(self.age).encode()
+
+
+class BatchBackendStub(BaseHTTPRequestHandler):
+    """
+    Stub of an age estimation backend. It answers the age encoded in each image, for single and batch requests.
+    The "slow" service takes SLOW_DELAY seconds to answer, and the "down" service answers with 503 errors to the
+    first down_requests_count requests.
+    """
+
+    SLOW_DELAY = 1
+    batch_sizes = []
+    down_requests_count = 0
+    requests_count = 0
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        BatchBackendStub.requests_count += 1
+
+        if "service=slow" in self.path:
+            time.sleep(self.SLOW_DELAY)
+
+        if "service=down" in self.path and BatchBackendStub.down_requests_count > 0:
+            BatchBackendStub.down_requests_count -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if "/batch" in self.path:
+            message = email.message_from_bytes("Content-Type: {}\r\n\r\n".format(
+                self.headers['Content-Type']).encode() + body)
+            ages = [int(part.get_payload(decode=True)) for part in message.get_payload()]
+            BatchBackendStub.batch_sizes.append(len(ages))
+            response = {"results": [{"Age_range": "({}, {})".format(age, age + 2)} for age in ages]}
+
+        else:
+            age = int(body)
+            response = {"Age_range": "({}, {})".format(age, age + 2)}
+
+        content = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class AgeEstimationFilterTests(unittest.TestCase):
+    """
+    Test class for AgeEstimationFilter methods
+    """
+
+    def setUp(self):
+        BatchBackendStub.batch_sizes = []
+        BatchBackendStub.requests_count = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), BatchBackendStub)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        base_url = "http://127.0.0.1:{}/estimation-requests/age/face".format(self.server.server_address[1])
+        self.api_url = base_url + "/stream?service=test"
+        self.slow_api_url = base_url + "/stream?service=slow"
+        self.down_api_url = base_url + "/stream?service=down&port={}".format(self.server.server_address[1])
+        self.batch_api_url = base_url + "/batch?service=test"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_apply_to_list_splits_in_batches(self):
+        """
+        Tests if a list of images is sent in batches and the results keep the order of the images.
+        :return:
+        """
+        age_filter = AgeEstimationFilter(3, self.api_url, batch_api_url=self.batch_api_url, max_batch_size=4)
+
+        results = age_filter.apply_to_list([JpegStub(age) for age in range(10)])
+
+        self.assertEqual(BatchBackendStub.batch_sizes, [4, 4, 2])
+        self.assertEqual([age_range.get_range() for (_, _, _, age_range) in results],
+                         [[age, age + 2] for age in range(10)])
+        self.assertTrue(all(passed and weight == 3 for (passed, weight, _, _) in results))
+
+    def test_concurrent_apply_to_are_batched(self):
+        """
+        Tests if single images filtered concurrently by several threads are joined into batch requests.
+        :return:
+        """
+        age_filter = AgeEstimationFilter(3, self.api_url, batch_api_url=self.batch_api_url, max_batch_size=8,
+                                         max_batch_wait=0.5)
+        results = {}
+
+        def filter_age(age):
+            results[age] = age_filter.apply_to(JpegStub(age))
+
+        threads = [threading.Thread(target=filter_age, args=(age,)) for age in range(8)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+
+        self.assertEqual(BatchBackendStub.batch_sizes, [8])
+        self.assertEqual({age: age_range.get_range()[0] for age, (_, _, _, age_range) in results.items()},
+                         {age: age for age in range(8)})
+
+    def test_filters_sharing_batch_url_are_batched_apart(self):
+        """
+        Tests if the images of two filters with the same batch URL are not joined into the same batch, so each batch is
+        sent with the timeout, retries and metrics of its own filter.
+        :return:
+        """
+        age_filters = [AgeEstimationFilter(3, self.api_url, batch_api_url=self.batch_api_url, max_batch_size=8,
+                                           max_batch_wait=0.5, timeout=timeout) for timeout in [5, 10]]
+        results = {}
+
+        def filter_age(age):
+            results[age] = age_filters[age % 2].apply_to(JpegStub(age))
+
+        threads = [threading.Thread(target=filter_age, args=(age,)) for age in range(8)]
+        [thread.start() for thread in threads]
+        [thread.join() for thread in threads]
+
+        self.assertEqual(BatchBackendStub.batch_sizes, [4, 4])
+        self.assertEqual({age: age_range.get_range()[0] for age, (_, _, _, age_range) in results.items()},
+                         {age: age for age in range(8)})
+
+    def test_apply_to_without_batch_url(self):
+        """
+        Tests if the filter sends single requests when there is no batch URL.
+        :return:
+        """
+        age_filter = AgeEstimationFilter(3, self.api_url)
+
+        (passed, weight, reason, age_range) = age_filter.apply_to(JpegStub(5))
+
+        self.assertTrue(passed)
+        self.assertEqual(age_range.get_range(), [5, 7])
+        self.assertEqual(BatchBackendStub.batch_sizes, [])
+
+    def test_apply_to_times_out(self):
+        """
+        Tests if a request slower than the deadline fails as timed out, without waiting for the backend.
+        :return:
+        """
+        age_filter = AgeEstimationFilter(3, self.slow_api_url, timeout=0.2)
+
+        start_time = time.monotonic()
+        score = age_filter.apply_to(JpegStub(5))
+
+        self.assertLess(time.monotonic() - start_time, BatchBackendStub.SLOW_DELAY)
+        self.assertFalse(score[0])
+        self.assertTrue(is_timed_out(score))
+        self.assertEqual(age_filter.get_metrics().timeouts, 1)
+
+    def test_slow_request_is_hedged(self):
+        """
+        Tests if a request slower than the latency percentile of its service is duplicated to a replica, and the
+        first answer is used.
+        :return:
+        """
+        for _ in range(HEDGE_MIN_SAMPLES):
+            get_latency_tracker(self.slow_api_url).observe(0.05)
+
+        age_filter = AgeEstimationFilter(3, self.slow_api_url, timeout=5, hedge_percentile=95,
+                                         hedge_api_urls=[self.api_url])
+
+        start_time = time.monotonic()
+        (passed, weight, reason, age_range) = age_filter.apply_to(JpegStub(5))
+
+        self.assertLess(time.monotonic() - start_time, BatchBackendStub.SLOW_DELAY)
+        self.assertTrue(passed)
+        self.assertEqual(age_range.get_range(), [5, 7])
+        self.assertEqual(age_filter.get_metrics().hedged_requests, 1)
+
+    def test_transient_errors_are_retried(self):
+        """
+        Tests if a request answered with a transient error is sent again.
+        :return:
+        """
+        BatchBackendStub.down_requests_count = 2
+        age_filter = AgeEstimationFilter(3, self.down_api_url, retry_policy=RetryPolicy(3, base_delay=0.01))
+
+        (passed, weight, reason, age_range) = age_filter.apply_to(JpegStub(5))
+
+        self.assertTrue(passed)
+        self.assertEqual(BatchBackendStub.requests_count, 3)
+        self.assertEqual(age_filter.get_metrics().retries, 2)
+
+    def test_retries_share_the_deadline(self):
+        """
+        Tests if the retries of an image are bounded by the timeout of the filter, instead of each one waiting for a
+        whole timeout.
+        :return:
+        """
+        BatchBackendStub.down_requests_count = 1000
+        age_filter = AgeEstimationFilter(3, self.down_api_url, timeout=0.3,
+                                         retry_policy=RetryPolicy(1000, base_delay=0.02, max_delay=0.02))
+        age_filter.set_name("retries-share-the-deadline")
+        start_time = time.monotonic()
+
+        try:
+            # The last attempt either fails before the deadline or is cut short by it.
+            self.assertTrue(is_timed_out(age_filter.apply_to(JpegStub(5))))
+
+        except BackendError:
+            pass
+
+        self.assertLess(time.monotonic() - start_time, 0.5)
+        self.assertGreater(BatchBackendStub.requests_count, 1)
+
+    def test_open_circuit_fails_fast(self):
+        """
+        Tests if the requests to a service that keeps failing are rejected without reaching it, until the reset
+        timeout is over.
+        :return:
+        """
+        BatchBackendStub.down_requests_count = 2
+        age_filter = AgeEstimationFilter(3, self.down_api_url, failure_threshold=2, reset_timeout=0.2)
+
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                age_filter.apply_to(JpegStub(5))
+
+        with self.assertRaises(CircuitOpenError):
+            age_filter.apply_to(JpegStub(5))
+
+        self.assertEqual(BatchBackendStub.requests_count, 2)
+
+        time.sleep(0.3)
+
+        self.assertTrue(age_filter.apply_to(JpegStub(5))[0])
+
+    def test_wait_for_concurrency_slot_is_not_a_failure(self):
+        """
+        Tests if a request that times out waiting for room under the concurrency limit is not recorded as a failure by
+        the load balancer nor by the circuit breaker, since it never reached the service.
+        :return:
+        """
+        host = "http://127.0.0.1:{}".format(self.server.server_address[1])
+        api_url = host + "/estimation-requests/age/face/stream?service=queued"
+        age_filter = AgeEstimationFilter(3, api_url, timeout=0.1, failure_threshold=1, replica_hosts=[host],
+                                         max_concurrency=1)
+
+        limiter = get_concurrency_limiter(api_url, initial_limit=1, max_limit=1)
+        start_time = limiter.acquire()
+
+        with self.assertRaises(ConcurrencyLimitTimeout):
+            age_filter._call_backend(age_filter._put, api_url, b"5")
+
+        replica = get_load_balancer(api_url, [host]).replicas[host]
+
+        self.assertEqual(replica.outstanding, 0)
+        self.assertEqual(replica.failures_count, 0)
+        self.assertEqual(BatchBackendStub.requests_count, 0)
+
+        limiter.release(start_time)
+
+        self.assertEqual(age_filter._call_backend(age_filter._put, api_url, b"5"), {"Age_range": "(5, 7)"})
+        self.assertIsNotNone(replica.mean_latency)
+
+    def test_probe_waiting_for_concurrency_slot(self):
+        """
+        Tests if a half-open probe that times out waiting for room under the concurrency limit does not leave the
+        circuit half-open forever: the next request probes the service.
+        :return:
+        """
+        api_url = "http://127.0.0.1:{}/estimation-requests/age/face/stream?service=probe".format(
+            self.server.server_address[1])
+        age_filter = AgeEstimationFilter(3, api_url, timeout=0.1, failure_threshold=1, reset_timeout=0.1,
+                                         max_concurrency=1)
+
+        age_filter._get_circuit_breaker().record_failure()
+        time.sleep(0.15)
+
+        limiter = get_concurrency_limiter(api_url, initial_limit=1, max_limit=1)
+        start_time = limiter.acquire()
+
+        with self.assertRaises(ConcurrencyLimitTimeout):
+            age_filter._call_backend(age_filter._put, api_url, b"5")
+
+        limiter.release(start_time)
+
+        self.assertEqual(age_filter._call_backend(age_filter._put, api_url, b"5"), {"Age_range": "(5, 7)"})
+        self.assertEqual(age_filter._get_circuit_breaker().get_state(), CIRCUIT_CLOSED)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import threading
+import unittest
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import cv2
+import numpy
+
+from main.filter.advanced.face_detection_filter import FaceDetectionFilter
+from main.resource.image import Image, EncodingPolicy
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class DetectionBackendStub(BaseHTTPRequestHandler):
+    """
+    Stub of a face detection backend. It answers a single face in the center of each image, half its size, and keeps
+    the shapes of the images it receives.
+    """
+
+    received_shapes = []
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        blob = cv2.imdecode(numpy.frombuffer(body, dtype=numpy.uint8), cv2.IMREAD_UNCHANGED)
+        DetectionBackendStub.received_shapes.append(blob.shape)
+
+        height, width = blob.shape[:2]
+        response = {"bounding_boxes": ["[{}, {}, {}, {}]".format(width // 4, height // 4, width // 2, height // 2)]}
+
+        content = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FaceDetectionFilterTests(unittest.TestCase):
+    """
+    Test class for FaceDetectionFilter methods
+    """
+
+    def setUp(self):
+        DetectionBackendStub.received_shapes = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), DetectionBackendStub)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        self.api_url = "http://127.0.0.1:{}/detection-requests/faces/stream?service=test".format(
+            self.server.server_address[1])
+        self.image = Image(uri="image.jpg", blob_content=numpy.zeros((300, 400, 3), dtype=numpy.uint8))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_detection_in_image(self):
+        """
+        Tests if the bounding boxes are the ones of the backend when the image is sent as it is.
+        :return:
+        """
+        face_filter = FaceDetectionFilter(1, self.api_url)
+
+        passed, _, _, bounding_boxes = face_filter.apply_to(self.image)
+
+        self.assertTrue(passed)
+        self.assertEqual(DetectionBackendStub.received_shapes, [(300, 400, 3)])
+        self.assertEqual([bounding_box.get_box() for bounding_box in bounding_boxes], [[100, 75, 200, 150]])
+
+    def test_detection_in_proxy(self):
+        """
+        Tests if a downscaled gray proxy of the image is sent, and the bounding boxes found in it are scaled back to
+        the coordinates of the image.
+        :return:
+        """
+        face_filter = FaceDetectionFilter(1, self.api_url, encoding_policy=EncodingPolicy(max_size=100, as_gray=True))
+
+        passed, _, _, bounding_boxes = face_filter.apply_to(self.image)
+
+        self.assertTrue(passed)
+        self.assertEqual(DetectionBackendStub.received_shapes, [(75, 100)])
+        self.assertEqual([bounding_box.get_box() for bounding_box in bounding_boxes], [[100, 72, 200, 148]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+import time
+import unittest
+
+import numpy
+
+from concurrent.futures.process import BrokenProcessPool
+
+from main.filter.executor import ThreadExecutor, ProcessExecutor, InlineExecutor, get_default_executor
+from main.filter.filter import Filter, FILTER_KIND_CPU_BOUND, FILTER_KIND_IO_BOUND, FILTER_KIND_LIGHTWEIGHT
+from main.filter.multifilter import Multifilter, weighted_majority_decision, apply_filter
+from main.metrics.metrics_registry import get_metrics_registry, METRICS_FILTER
+from main.resource.image import Image
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class DelayedFilterStub(Filter):
+    """
+    Filter that answers a fixed outcome after a delay.
+    """
+
+    def __init__(self, weight, passed, delay):
+        super().__init__(weight)
+        self.passed = passed
+        self.delay = delay
+
+    def apply_to(self, resource):
+        time.sleep(self.delay)
+        return self.passed, self.weight, "", resource
+
+
+class KindFilterStub(Filter):
+    """
+    Filter of a given kind that passes every resource.
+    """
+
+    def __init__(self, weight, kind):
+        super().__init__(weight)
+        self.kind = kind
+
+    def apply_to(self, resource):
+        return True, self.weight, "", resource
+
+    def get_kind(self):
+        return self.kind
+
+
+class BlobFilterStub(Filter):
+    """
+    Filter that describes the blob of the image it receives.
+    """
+
+    def apply_to(self, image):
+        blob = image.get_blob()
+        return True, self.weight, "", (int(blob.sum()), blob.shape, blob.flags.writeable, image.md5hash())
+
+
+class ExitFilterStub(Filter):
+    """
+    Filter that kills the process it runs in.
+    """
+
+    def apply_to(self, resource):
+        os._exit(1)
+
+
+class MultifilterTests(unittest.TestCase):
+    """
+    Test class for Multifilter methods
+    """
+
+    def test_consensus_returns_before_stragglers(self):
+        """
+        Tests if the consensus mode returns as soon as the filters that answered carry enough weight, without waiting
+        for the slow ones.
+        :return:
+        """
+        with ThreadExecutor(3) as executor:
+            multifilter = Multifilter([DelayedFilterStub(1, False, 1), DelayedFilterStub(10, True, 0),
+                                       DelayedFilterStub(2, True, 1)], decision_function=weighted_majority_decision,
+                                      executor=executor)
+
+            start_time = time.monotonic()
+            scores = multifilter.apply_to("resource")
+            elapsed_time = time.monotonic() - start_time
+
+        self.assertLess(elapsed_time, 0.5)
+        self.assertEqual(scores, [(True, 10, "", "resource")])
+
+    def test_consensus_waits_when_undecided(self):
+        """
+        Tests if the consensus mode keeps waiting while the pending filters may change the outcome.
+        :return:
+        """
+        with ThreadExecutor(3) as executor:
+            multifilter = Multifilter([DelayedFilterStub(6, False, 0.5), DelayedFilterStub(5, True, 0),
+                                       DelayedFilterStub(1, True, 0)], decision_function=weighted_majority_decision,
+                                      executor=executor)
+
+            scores = multifilter.apply_to("resource")
+
+        self.assertEqual([weight for (_, weight, _, _) in scores], [6, 5, 1])
+
+    def test_default_executors_by_kind(self):
+        """
+        Tests if each filter runs in the default executor of its kind, shared across multifilters.
+        :return:
+        """
+        multifilter = Multifilter([KindFilterStub(1, FILTER_KIND_IO_BOUND), KindFilterStub(2, FILTER_KIND_LIGHTWEIGHT)])
+        other_multifilter = Multifilter([KindFilterStub(3, FILTER_KIND_LIGHTWEIGHT)])
+
+        self.assertIsInstance(multifilter.executors[0], ThreadExecutor)
+        self.assertIsInstance(multifilter.executors[1], InlineExecutor)
+        self.assertIs(multifilter.executors[1], other_multifilter.executors[0])
+        self.assertIs(multifilter.executors[1], get_default_executor(FILTER_KIND_LIGHTWEIGHT))
+        self.assertEqual(multifilter.apply_to_list(["a", "b"]), [(True, 1, "", "a"), (True, 1, "", "b"),
+                                                                  (True, 2, "", "a"), (True, 2, "", "b")])
+
+    def test_process_executor_merges_metrics(self):
+        """
+        Tests if filters run in worker processes, and their metrics are added to the registry of this process.
+        :return:
+        """
+        _filter = KindFilterStub(7, FILTER_KIND_CPU_BOUND)
+        _filter.set_name("process-executor-stub")
+
+        with ProcessExecutor(2) as executor:
+            scores = Multifilter([_filter], executor=executor).apply_to("resource")
+
+        metrics_dict = get_metrics_registry().get_snapshot()[METRICS_FILTER]["process-executor-stub"]
+
+        self.assertEqual(scores, [(True, 7, "", "resource")])
+        self.assertEqual(metrics_dict['calls'], 1)
+
+    def test_process_executor_shares_images(self):
+        """
+        Tests if the images handed to the workers through shared memory reach the filters intact and read-only, and
+        their segments are freed afterwards.
+        :return:
+        """
+        image = Image(uri="shared.jpg", blob_content=numpy.arange(60, dtype=numpy.uint8).reshape((4, 5, 3)))
+        expected_description = (int(image.get_blob().sum()), (4, 5, 3), False, image.md5hash())
+
+        with ProcessExecutor(2, share_images=True) as executor:
+            multifilter = Multifilter([BlobFilterStub(1), BlobFilterStub(2)], executor=executor)
+
+            scores = multifilter.apply_to(image)
+            list_scores = multifilter.apply_to_list([image, image])
+
+        self.assertEqual([description for (_, _, _, description) in scores], [expected_description] * 2)
+        self.assertEqual([description for (_, _, _, description) in list_scores], [expected_description] * 4)
+        self.assertEqual(executor.shared_images, set())
+
+    def test_process_executor_installs_filters(self):
+        """
+        Tests if the filters of a multifilter are installed in the workers once, instead of being sent with each call,
+        and filters not registered are still sent.
+        :return:
+        """
+        installed_filter = KindFilterStub(1, FILTER_KIND_CPU_BOUND)
+        unregistered_filter = KindFilterStub(2, FILTER_KIND_CPU_BOUND)
+
+        with ProcessExecutor(2) as executor:
+            multifilter = Multifilter([installed_filter], executor=executor)
+
+            # Changes made after the installation are not seen by the workers.
+            installed_filter.weight = 10
+
+            scores = multifilter.apply_to("resource")
+            unregistered_score = executor.submit_to_filters(apply_filter, [unregistered_filter], "resource")[0].result()
+
+        self.assertEqual(scores, [(True, 1, "", "resource")])
+        self.assertEqual(unregistered_score, (True, 2, "", "resource"))
+
+    def test_process_executor_restarts_while_submitting(self):
+        """
+        Tests if the calls submitted while new filters restart the workers are run by the new workers, instead of
+        failing in the closed pool.
+        :return:
+        """
+        filter_list = [KindFilterStub(weight, FILTER_KIND_CPU_BOUND) for weight in range(4)]
+        registered = threading.Event()
+        futures = []
+        errors = []
+
+        with ProcessExecutor(2) as executor:
+            executor.register_filters(filter_list[:1])
+
+            def submit_calls():
+                try:
+                    while not registered.is_set():
+                        futures.extend(executor.submit_to_filters(apply_filter, filter_list[:1], "resource"))
+
+                except Exception as ex:
+                    errors.append(ex)
+
+            thread = threading.Thread(target=submit_calls)
+            thread.start()
+
+            for index in range(2, len(filter_list) + 1):
+                executor.register_filters(filter_list[:index])
+
+            registered.set()
+            thread.join()
+
+            results = [future.result() for future in futures]
+
+        self.assertEqual(errors, [])
+        self.assertGreater(len(results), 0)
+        self.assertEqual(set(results), {(True, 0, "", "resource")})
+        self.assertEqual(len(executor.filters), len(filter_list))
+
+    def test_process_executor_worker_dies(self):
+        """
+        Tests if the calls of a worker that dies fail instead of waiting forever, and the next calls start new workers.
+        :return:
+        """
+        with ProcessExecutor(2) as executor:
+            future = executor.submit(apply_filter, ExitFilterStub(1), "resource")
+
+            with self.assertRaises(BrokenProcessPool):
+                future.result(timeout=10)
+
+            score = executor.submit(apply_filter, KindFilterStub(2, FILTER_KIND_CPU_BOUND), "resource").result(10)
+
+        self.assertEqual(score, (True, 2, "", "resource"))
+
+    def test_weighted_majority_decision(self):
+        """
+        Tests the weighted majority decision function.
+        :return:
+        """
+        pending_filters = [DelayedFilterStub(3, True, 0)]
+
+        self.assertFalse(weighted_majority_decision([(True, 2, "", None)], pending_filters))
+        self.assertTrue(weighted_majority_decision([(True, 4, "", None)], pending_filters))
+        self.assertTrue(weighted_majority_decision([(False, 4, "", None)], pending_filters))
+        self.assertFalse(weighted_majority_decision([(False, 3, "", None)], pending_filters))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from main.metrics.metrics_exporter import MetricsExporter
+from main.metrics.metrics_registry import MetricsRegistry, Histogram, METRICS_FILTER, METRICS_STAGE
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    """
+    Test class for MetricsRegistry and MetricsExporter methods
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_histogram_buckets(self):
+        """
+        Tests if values fall in their buckets, and the cumulative counts include the overflow bucket.
+        :return:
+        """
+        histogram = Histogram([0.1, 1])
+
+        for value in [0.05, 0.1, 0.5, 2, 3]:
+            histogram.observe(value)
+
+        self.assertEqual(histogram.counts, [2, 1, 2])
+        self.assertEqual(histogram.get_cumulative_counts(), [(0.1, 2), (1, 3), (float("inf"), 5)])
+        self.assertAlmostEqual(histogram.sum, 5.65)
+
+    def test_pop_and_merge_snapshots(self):
+        """
+        Tests if the snapshots popped from a registry (like the one of a pool worker) are added to another one, and
+        popping resets the metrics.
+        :return:
+        """
+        worker_registry = MetricsRegistry()
+        registry = MetricsRegistry()
+
+        registry.get_metrics(METRICS_FILTER, "age").observe(0.2, passed=1)
+
+        worker_registry.get_metrics(METRICS_FILTER, "age").observe(0.3, calls=3, passed=2)
+        worker_registry.get_metrics(METRICS_FILTER, "age").observe(0.4, failed=True)
+        worker_registry.get_metrics(METRICS_FILTER, "age").add_bytes_uploaded(1000)
+        registry.merge_snapshot(worker_registry.pop_snapshot())
+
+        self.assertEqual(worker_registry.get_snapshot()[METRICS_FILTER], {})
+
+        metrics_dict = registry.get_snapshot()[METRICS_FILTER]["age"]
+        self.assertEqual(metrics_dict['calls'], 5)
+        self.assertEqual(metrics_dict['passed'], 3)
+        self.assertEqual(metrics_dict['pass_rate'], 0.6)
+        self.assertEqual(metrics_dict['errors'], 1)
+        self.assertEqual(metrics_dict['bytes_uploaded'], 1000)
+        self.assertEqual(metrics_dict['latency']['count'], 3)
+
+    def test_export(self):
+        """
+        Tests if the exporter writes the JSON and the Prometheus snapshots.
+        :return:
+        """
+        registry = MetricsRegistry()
+        registry.get_metrics(METRICS_STAGE, "detect").observe(0.02, passed=1)
+        registry.get_metrics(METRICS_FILTER, "Age\"Filter").observe(3, passed=0)
+
+        json_file = os.path.join(self.folder, "metrics.json")
+        prometheus_file = os.path.join(self.folder, "metrics.prom")
+        MetricsExporter(json_file, prometheus_file, registry=registry).export()
+
+        with open(json_file) as file:
+            self.assertEqual(json.load(file)[METRICS_STAGE]["detect"]['calls'], 1)
+
+        with open(prometheus_file) as file:
+            lines = file.read().splitlines()
+
+        self.assertIn("inferencedb_stage_calls_total{stage=\"detect\"} 1", lines)
+        self.assertIn("inferencedb_stage_latency_seconds_bucket{stage=\"detect\",le=\"0.025\"} 1", lines)
+        self.assertIn("inferencedb_filter_latency_seconds_bucket{filter=\"Age\\\"Filter\",le=\"2.5\"} 0", lines)
+        self.assertIn("inferencedb_filter_latency_seconds_bucket{filter=\"Age\\\"Filter\",le=\"+Inf\"} 1", lines)
+        self.assertIn("inferencedb_filter_latency_seconds_count{filter=\"Age\\\"Filter\"} 1", lines)
+
+    def test_export_service_gauges(self):
+        """
+        Tests if the gauges of several services are exported as a single Prometheus metric with a service label.
+        :return:
+        """
+        registry = MetricsRegistry()
+        registry.set_gauge("concurrency_limit[http://127.0.0.1:8080/age]", 4)
+        registry.set_gauge("concurrency_limit[http://127.0.0.1:8081/age]", 8)
+        registry.set_gauge("skipped_faces", 2)
+
+        prometheus_file = os.path.join(self.folder, "metrics.prom")
+        MetricsExporter(prometheus_file=prometheus_file, registry=registry).export()
+
+        with open(prometheus_file) as file:
+            lines = file.read().splitlines()
+
+        self.assertEqual(lines.count("# TYPE inferencedb_concurrency_limit gauge"), 1)
+        self.assertIn("inferencedb_concurrency_limit{service=\"http://127.0.0.1:8080/age\"} 4", lines)
+        self.assertIn("inferencedb_concurrency_limit{service=\"http://127.0.0.1:8081/age\"} 8", lines)
+        self.assertIn("inferencedb_skipped_faces 2", lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
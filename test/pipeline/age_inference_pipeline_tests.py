@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy
+
+from main.dataset.processed_journal import OUTCOME_DISCARDED
+from main.pipeline.age_inference_pipeline import AgeInferencePipeline, ImageTask, FaceTask
+from main.resource.image import Image
+from main.tools.age_range import AgeRange
+from main.tools.boundingbox import BoundingBox
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class FilterStub(object):
+    """
+    Stands for a filter of a multifilter.
+    """
+
+    def __init__(self, name, min_age=0, max_age=99):
+        self.name = name
+        self.min_age = min_age
+        self.max_age = max_age
+
+    def get_name(self):
+        return self.name
+
+
+class MultifilterStub(object):
+    """
+    Stands for a multifilter with a single filter. Answers the same score for every resource and counts the resources
+    it receives.
+    """
+
+    def __init__(self, name, score, min_age=0, max_age=99):
+        self.filter_list = [FilterStub(name, min_age, max_age)]
+        self.score = score
+        self.calls_count = 0
+
+    def apply_to(self, resource):
+        self.calls_count += 1
+        return [self.score]
+
+    def apply_to_list(self, resource_list):
+        self.calls_count += len(resource_list)
+        return [self.score for _ in resource_list]
+
+
+class JournalStub(object):
+    """
+    Stands for a processed journal. Keeps the outcomes recorded.
+    """
+
+    def __init__(self):
+        self.outcomes = {}
+
+    def record(self, image_hash, outcome, age_ranges=None):
+        self.outcomes[image_hash] = outcome
+
+    def get_pending_count(self):
+        return 0
+
+
+class FailingFilterStub(object):
+    """
+    Stands for a filter whose backend is down.
+    """
+
+    def apply_to_measured(self, resource):
+        raise ConnectionError("Backend is down.")
+
+
+class AgeInferencePipelineTests(unittest.TestCase):
+    """
+    Test class for AgeInferencePipeline methods
+    """
+
+    def setUp(self):
+        self.text_multifilter = MultifilterStub("text", (True, 10, "", AgeRange(2, 2)))
+        self.search_keywords_multifilter = MultifilterStub("search-keywords", (False, 4, "", None))
+        self.image_multifilter = MultifilterStub("image", (True, 6, "", AgeRange(3, 5)))
+
+        self.pipeline = self._build_pipeline()
+
+    def _build_pipeline(self, expected_age_range=None):
+        return AgeInferencePipeline(None, self.text_multifilter, self.search_keywords_multifilter,
+                                    self.image_multifilter, None, "", expected_age_range=expected_age_range)
+
+    def test_texts_are_filtered_once_per_image(self):
+        """
+        Tests if the text filters are applied once for an image with several faces, and their scores are shared by
+        every face.
+        :return:
+        """
+        image_task = ImageTask("hash", "uri", "text", "search keywords")
+        image_task.face_images = ["face1", "face2", "face3"]
+
+        face_tasks = self.pipeline._infer(image_task)
+
+        self.assertEqual(len(face_tasks), 3)
+        self.assertEqual(self.text_multifilter.calls_count, 1)
+        self.assertEqual(self.search_keywords_multifilter.calls_count, 1)
+        self.assertEqual(self.image_multifilter.calls_count, 3)
+
+        for face_task in face_tasks:
+            self.assertEqual([weight for (_, weight, _, _) in face_task.face_age_scores], [10, 4, 6])
+
+    def test_image_without_faces_is_not_filtered(self):
+        """
+        Tests if no filter is applied to an image without faces.
+        :return:
+        """
+        image_task = ImageTask("hash", "uri", "text", "search keywords")
+
+        self.assertEqual(self.pipeline._infer(image_task), [])
+        self.assertEqual(self.text_multifilter.calls_count, 0)
+        self.assertEqual(self.image_multifilter.calls_count, 0)
+
+    def test_image_filters_skipped_when_discard_is_certain(self):
+        """
+        Tests if the image filters are not applied when the text filters already place the face outside of the
+        expected age range, or when too many of them pass.
+        :return:
+        """
+        self.text_multifilter.score = (True, 10, "", AgeRange(30, 30))
+        self.image_multifilter.filter_list[0].min_age = 10
+        pipeline = self._build_pipeline(AgeRange(0, 4))
+
+        image_task = ImageTask("hash", "uri", "text", "search keywords")
+        image_task.face_images = ["face1", "face2"]
+
+        self.assertEqual(pipeline._infer(image_task), [])
+        self.assertEqual(self.image_multifilter.calls_count, 0)
+        self.assertEqual(image_task.pending_faces, 0)
+
+        self.text_multifilter.filter_list.append(FilterStub("text2"))
+        self.text_multifilter.score = (True, 10, "", AgeRange(2, 2))
+        self.search_keywords_multifilter.score = (True, 4, "", AgeRange(1, 2))
+        self.search_keywords_multifilter.apply_to = lambda resource: [self.search_keywords_multifilter.score] * 2
+
+        image_task = ImageTask("hash", "uri", "text", "search keywords")
+        image_task.face_images = ["face1"]
+
+        self.assertEqual(pipeline._infer(image_task), [])
+        self.assertEqual(self.image_multifilter.calls_count, 0)
+
+    def test_image_filters_applied_when_outcome_may_change(self):
+        """
+        Tests if the image filters are applied when their scores may place the face inside the expected age range.
+        :return:
+        """
+        self.text_multifilter.score = (True, 10, "", AgeRange(30, 30))
+        pipeline = self._build_pipeline(AgeRange(0, 4))
+
+        image_task = ImageTask("hash", "uri", "text", "search keywords")
+        image_task.face_images = ["face1", "face2"]
+
+        self.assertEqual(len(pipeline._infer(image_task)), 2)
+        self.assertEqual(self.image_multifilter.calls_count, 2)
+
+    def test_failed_images_are_deferred(self):
+        """
+        Tests if the images that fail because of the backend are put aside to be processed again, while there are
+        rounds left.
+        :return:
+        """
+        pipeline = AgeInferencePipeline(FailingFilterStub(), self.text_multifilter, self.search_keywords_multifilter,
+                                        self.image_multifilter, None, "", deferred_rounds=1)
+
+        image_task = ImageTask("hash", "uri", "text", "search keywords")
+        image_task.metadata_item = ("hash", {"metadata": {}})
+        image_task.image = Image("uri")
+
+        self.assertIsNone(pipeline._detect(image_task))
+        self.assertEqual(pipeline.deferred_items, [image_task.metadata_item])
+
+        pipeline.deferred_round = 1
+
+        self.assertIsNone(pipeline._detect(image_task))
+        self.assertEqual(len(pipeline.deferred_items), 1)
+
+        self.image_multifilter.apply_to_list = FailingFilterStub().apply_to_measured
+        image_task.face_images = ["face1"]
+        pipeline.deferred_round = 0
+
+        self.assertEqual(pipeline._infer(image_task), [])
+        self.assertEqual(len(pipeline.deferred_items), 2)
+
+    def test_face_rejected_by_all_filters_is_discarded(self):
+        """
+        Tests if a face that no filter passes is discarded, and its image recorded as discarded.
+        :return:
+        """
+        pipeline = self._build_pipeline()
+        pipeline.journal = JournalStub()
+
+        image_task = ImageTask("hash", "uri", "text", "search keywords")
+        image_task.pending_faces = 1
+        face_task = FaceTask(image_task, "face1")
+        face_task.face_age_scores = [(False, 10, "", None), (False, 4, "", None), (False, 6, "", None)]
+
+        self.assertIsNone(pipeline._aggregate(face_task))
+        self.assertEqual(image_task.pending_faces, 0)
+        self.assertEqual(pipeline.journal.outcomes, {"hash": OUTCOME_DISCARDED})
+
+    def test_image_filters_skipped_when_no_filter_can_pass(self):
+        """
+        Tests if the image filters are skipped when the text filters failed and the image filters can't pass either,
+        and applied when they can.
+        :return:
+        """
+        self.text_multifilter.score = (False, 10, "", None)
+        pipeline = self._build_pipeline()
+
+        self.assertTrue(pipeline._is_discard_certain([(False, 10, "", None), (False, 4, "", None)], []))
+        self.assertFalse(pipeline._is_discard_certain([(False, 10, "", None), (False, 4, "", None)],
+                                                      self.image_multifilter.filter_list))
+
+        image_task = ImageTask("hash", "uri", "text", "search keywords")
+        image_task.face_images = ["face1"]
+
+        self.assertEqual(len(pipeline._infer(image_task)), 1)
+        self.assertEqual(self.image_multifilter.calls_count, 1)
+
+    def test_faces_cropped_from_source(self):
+        """
+        Tests if the faces of a resized image are cropped from its source file at full size when the pipeline crops
+        from the source, and from the resized image otherwise.
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            uri = os.path.join(temp_dir, "image.png")
+            cv2.imwrite(uri, numpy.zeros((300, 400, 3), dtype=numpy.uint8))
+
+            for crop_from_source, face_size in [(False, (60, 29)), (True, (120, 60))]:
+                pipeline = AgeInferencePipeline(None, self.text_multifilter, self.search_keywords_multifilter,
+                                                self.image_multifilter, None, "", max_image_size=(200, 200),
+                                                crop_from_source=crop_from_source)
+
+                image_task = pipeline._decode(ImageTask("hash", uri, "text", "search keywords"))
+                image_task.bounding_boxes = [BoundingBox(50, 50, 50, 25)]
+
+                self.assertEqual(image_task.image.get_size(), (200, 150))
+
+                pipeline._crop(image_task)
+
+                self.assertEqual(image_task.face_images[0].get_size(), face_size)
+
+    def test_faces_cropped_from_reduced_source(self):
+        """
+        Tests if JPEG source files are decoded at the smallest reduced scale that keeps the faces as big as the source
+        face size, and are not loaded again when the faces of the resized image are already that big.
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            uri = os.path.join(temp_dir, "image.jpg")
+            cv2.imwrite(uri, numpy.zeros((600, 800, 3), dtype=numpy.uint8))
+
+            for source_face_size, face_size in [(100, (120, 60)), (40, (60, 29))]:
+                pipeline = AgeInferencePipeline(None, self.text_multifilter, self.search_keywords_multifilter,
+                                                self.image_multifilter, None, "", max_image_size=(200, 200),
+                                                crop_from_source=True, source_face_size=source_face_size)
+
+                image_task = pipeline._decode(ImageTask("hash", uri, "text", "search keywords"))
+                image_task.bounding_boxes = [BoundingBox(50, 50, 50, 25)]
+
+                self.assertEqual(image_task.image.get_size(), (200, 150))
+
+                pipeline._crop(image_task)
+
+                # Decoded at 1/2 (400x300) to reach 100 pixels, and not decoded again to reach 40.
+                self.assertEqual(image_task.face_images[0].get_size(), face_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from main.pipeline.pipeline import Pipeline
+from main.pipeline.stage import Stage
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class PipelineTests(unittest.TestCase):
+    """
+    Test class for Pipeline methods
+    """
+
+    def test_items_go_through_all_stages(self):
+        """
+        Tests if every item is processed by every stage, whatever the number of workers.
+        :return:
+        """
+        results = []
+
+        pipeline = Pipeline([
+            Stage("double", lambda item: item * 2, workers=3),
+            Stage("increment", lambda item: item + 1, workers=2),
+        ], queue_size=2)
+
+        pipeline.run(range(100), on_result=results.append)
+
+        self.assertEqual(sorted(results), [item * 2 + 1 for item in range(100)])
+        self.assertEqual(pipeline.get_processed_count(), {"double": 100, "increment": 100})
+
+    def test_fan_out_and_drop(self):
+        """
+        Tests if stages can split an item into several ones and drop items.
+        :return:
+        """
+        results = []
+
+        pipeline = Pipeline([
+            Stage("split", lambda item: [item] * item, fan_out=True),
+            Stage("drop_odds", lambda item: item if item % 2 == 0 else None, workers=2),
+        ], queue_size=1)
+
+        pipeline.run([1, 2, 3, 4], on_result=results.append)
+
+        self.assertEqual(sorted(results), [2, 2, 4, 4, 4, 4])
+
+    def test_failed_items_are_counted(self):
+        """
+        Tests if an exception in a stage drops the item without stopping the pipeline.
+        :return:
+        """
+        results = []
+
+        def fail_on_three(item):
+            if item == 3:
+                raise Exception("Three is not allowed.")
+            return item
+
+        pipeline = Pipeline([Stage("fail", fail_on_three, workers=2)])
+
+        pipeline.run(range(5), on_result=results.append)
+
+        self.assertEqual(sorted(results), [0, 1, 2, 4])
+        self.assertEqual(pipeline.get_errors_count(), {"fail": 1})
+
+    def test_failed_results_delivery_does_not_hang(self):
+        """
+        Tests if an exception delivering the results of the last stage is counted as an error of the stage, and the
+        run still finishes.
+        :return:
+        """
+        results = []
+
+        def reject_three(item):
+            if item == 3:
+                raise Exception("Three is not allowed.")
+            results.append(item)
+
+        pipeline = Pipeline([Stage("double", lambda item: item * 2, workers=2),
+                             Stage("identity", lambda item: item // 2)])
+
+        pipeline.run(range(5), on_result=reject_three)
+
+        self.assertEqual(sorted(results), [0, 1, 2, 4])
+        self.assertEqual(pipeline.get_errors_count(), {"double": 0, "identity": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
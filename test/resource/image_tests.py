@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import os
+import tempfile
+import unittest
+
+import cv2
+import numpy
+
+from main.resource.image import Image, EncodingPolicy, ENCODING_PNG, get_fit_scale
+from main.tools.boundingbox import BoundingBox
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class ImageTests(unittest.TestCase):
+    """
+    Test class for Image methods
+    """
+
+    def setUp(self):
+        self.blob = numpy.arange(10 * 8 * 3, dtype=numpy.uint8).reshape((10, 8, 3))
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.jpeg_uri = os.path.join(self.temp_dir.name, "image.jpg")
+        cv2.imwrite(self.jpeg_uri, self.blob)
+
+        with open(self.jpeg_uri, "rb") as jpeg_file:
+            self.jpeg_content = jpeg_file.read()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_hashes_are_lazy(self):
+        """
+        Tests if the hashes are computed when requested, and computed again after the blob changes.
+        :return:
+        """
+        image = Image(uri="image.jpg", blob_content=self.blob)
+
+        self.assertIsNone(image.cached_image_hash)
+        self.assertEqual(image.md5hash(), hashlib.md5(self.blob).hexdigest())
+        self.assertEqual(image.fast_hash(), hashlib.blake2b(self.blob, digest_size=16).hexdigest())
+
+        image.update_blob(self.blob[::-1].copy())
+
+        self.assertIsNone(image.cached_image_hash)
+        self.assertIsNone(image.cached_fast_hash)
+        self.assertEqual(image.md5hash(), hashlib.md5(self.blob[::-1].copy()).hexdigest())
+
+    def test_hash_of_cropped_view(self):
+        """
+        Tests if crops are copies of the blob unless a view is requested, and their hash matches the one of their
+        pixels either way.
+        :return:
+        """
+        image = Image(uri="image.jpg", blob_content=self.blob)
+        bounding_box = BoundingBox(2, 1, 4, 5)
+
+        cropped_image = image.crop_image(bounding_box, new_uri="cropped.jpg", copy=False)
+        copied_image = image.crop_image(bounding_box, new_uri="cropped.jpg")
+
+        self.assertTrue(numpy.shares_memory(cropped_image.get_blob(), self.blob))
+        self.assertFalse(numpy.shares_memory(copied_image.get_blob(), self.blob))
+        self.assertEqual(cropped_image.md5hash(), copied_image.md5hash())
+        self.assertEqual(cropped_image.fast_hash(), copied_image.fast_hash())
+
+    def test_encodings_are_memoized(self):
+        """
+        Tests if each encoding is computed once per blob version, and shared by the callers.
+        :return:
+        """
+        image = Image(uri="image.jpg", blob_content=self.blob)
+
+        jpeg = image.get_jpeg()
+
+        self.assertIsInstance(jpeg, bytes)
+        self.assertIs(image.get_jpeg(), jpeg)
+        self.assertIs(image.encode(EncodingPolicy()), jpeg)
+        self.assertIsNot(image.encode(EncodingPolicy(quality=50)), jpeg)
+
+        image.update_blob(self.blob[::-1].copy())
+
+        self.assertIsNot(image.get_jpeg(), jpeg)
+
+    def test_encoding_policy(self):
+        """
+        Tests if the images are encoded in the format of the policy, downscaled to its maximum size.
+        :return:
+        """
+        image = Image(uri="image.jpg", blob_content=self.blob)
+
+        encoded_image = image.encode(EncodingPolicy(ENCODING_PNG, max_size=4))
+        decoded_blob = cv2.imdecode(numpy.frombuffer(encoded_image, dtype=numpy.uint8), cv2.IMREAD_COLOR)
+
+        self.assertTrue(encoded_image.startswith(b"\x89PNG"))
+        self.assertEqual(decoded_blob.shape, (4, 3, 3))
+        self.assertEqual(EncodingPolicy(max_size=4).get_scale(image.get_size()), 0.4)
+        self.assertEqual(EncodingPolicy(max_size=20).get_scale(image.get_size()), 1)
+
+    def test_lazy_load_sends_source(self):
+        """
+        Tests if an image loaded lazily is not decoded to be encoded in the format of its file, and the content of the
+        file is used instead.
+        :return:
+        """
+        image = Image(uri=self.jpeg_uri)
+        image.load_from_uri(lazy=True)
+
+        self.assertTrue(image.is_loaded())
+        self.assertEqual(image.get_size(), (8, 10))
+        self.assertIs(image.get_jpeg(), image.source_content)
+        self.assertEqual(image.get_jpeg(), self.jpeg_content)
+        self.assertFalse(image.is_decoded())
+
+        self.assertNotEqual(image.encode(EncodingPolicy(ENCODING_PNG)), self.jpeg_content)
+        self.assertNotEqual(image.encode(EncodingPolicy(max_size=4)), self.jpeg_content)
+
+    def test_hashes_do_not_depend_on_loading(self):
+        """
+        Tests if an image has the same hashes whether it is loaded lazily or not.
+        :return:
+        """
+        image = Image(uri=self.jpeg_uri)
+        image.load_from_uri()
+
+        lazy_image = Image(uri=self.jpeg_uri)
+        lazy_image.load_from_uri(lazy=True)
+
+        self.assertEqual(lazy_image.md5hash(), image.md5hash())
+        self.assertEqual(lazy_image.fast_hash(), image.fast_hash())
+        self.assertEqual(image.md5hash(), hashlib.md5(image.get_blob()).hexdigest())
+
+    def test_lazy_load_decodes_on_demand(self):
+        """
+        Tests if the pixels of an image loaded lazily are decoded when needed, and the source file is dropped once they
+        change.
+        :return:
+        """
+        image = Image(uri=self.jpeg_uri)
+        image.load_from_uri(lazy=True)
+        md5hash = image.md5hash()
+
+        cropped_image = image.crop_image(BoundingBox(2, 1, 4, 5), new_uri="cropped.jpg")
+
+        self.assertTrue(image.is_decoded())
+        self.assertEqual(cropped_image.get_size(), (4, 5))
+        self.assertEqual(image.md5hash(), md5hash)
+        self.assertEqual(image.get_jpeg(), self.jpeg_content)
+
+        image.resize_to((4, 5))
+
+        self.assertIsNone(image.source_content)
+        self.assertEqual(image.get_size(), (4, 5))
+        self.assertNotEqual(image.get_jpeg(), self.jpeg_content)
+
+    def test_lazy_load_of_broken_file(self):
+        """
+        Tests if a file that can't be decoded leaves the image not loaded once its pixels are needed.
+        :return:
+        """
+        with open(self.jpeg_uri, "wb") as jpeg_file:
+            jpeg_file.write(self.jpeg_content[:len(self.jpeg_content) // 2])
+
+        image = Image(uri=self.jpeg_uri)
+        image.load_from_uri(lazy=True)
+
+        self.assertTrue(image.is_loaded())
+
+        image.get_blob()
+
+        self.assertFalse(image.is_loaded())
+        self.assertEqual(image.get_jpeg(), 0)
+
+        missing_image = Image(uri=os.path.join(self.temp_dir.name, "missing.jpg"))
+        missing_image.load_from_uri(lazy=True)
+
+        self.assertFalse(missing_image.is_loaded())
+
+    def test_load_with_max_size(self):
+        """
+        Tests if images bigger than the maximum size are decoded at the reduced scale closest to it and resized to fit
+        it, and smaller ones are kept as they are.
+        :return:
+        """
+        big_uri = os.path.join(self.temp_dir.name, "big.jpg")
+        cv2.imwrite(big_uri, numpy.full((400, 640, 3), 128, dtype=numpy.uint8))
+
+        image = Image(uri=big_uri)
+        image.load_from_uri(max_size=(100, 100))
+
+        self.assertEqual(image.get_size(), (100, 62))
+        self.assertTrue(image.is_decoded())
+
+        image = Image(uri=big_uri)
+        image.load_from_uri(lazy=True, max_size=(640, 400))
+
+        self.assertFalse(image.is_decoded())
+        self.assertEqual(image.get_size(), (640, 400))
+
+        image = Image(uri=big_uri)
+        image.load_from_uri(as_gray=True, max_size=(320, 320))
+
+        self.assertTrue(image.is_gray())
+        self.assertEqual(image.get_size(), (320, 200))
+
+        self.assertEqual(get_fit_scale((640, 400), (100, 100)), 100 / 640)
+        self.assertEqual(get_fit_scale((640, 400), (1000, 1000)), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
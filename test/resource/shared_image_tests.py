@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import pickle
+import tempfile
+import unittest
+
+import cv2
+import numpy
+
+from main.resource.image import Image
+from main.resource.shared_image import SharedImage
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class SharedImageTests(unittest.TestCase):
+    """
+    Test class for SharedImage methods
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.jpeg_uri = os.path.join(self.temp_dir.name, "image.jpg")
+        cv2.imwrite(self.jpeg_uri, numpy.arange(10 * 8 * 3, dtype=numpy.uint8).reshape((10, 8, 3)))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_attached_image_keeps_source_and_hashes(self):
+        """
+        Tests if the image attached from a handle has the hashes computed by the process that shared it, and sends
+        the same source file content.
+        :return:
+        """
+        image = Image(uri=self.jpeg_uri)
+        image.load_from_uri(lazy=True)
+        md5hash = image.md5hash()
+
+        handle = SharedImage(image)
+
+        try:
+            worker_handle = pickle.loads(pickle.dumps(handle))
+            attached_image = worker_handle.attach()
+
+            self.assertEqual(attached_image.cached_image_hash, md5hash)
+            self.assertEqual(attached_image.md5hash(), md5hash)
+            self.assertEqual(attached_image.get_jpeg(), image.get_jpeg())
+            self.assertIs(image.get_jpeg(), image.source_content)
+
+            del attached_image
+            worker_handle.detach()
+
+        finally:
+            handle.release()
+
+    def test_lazy_image_is_shared_undecoded(self):
+        """
+        Tests if an image not decoded yet is shared as its source file, without decoding it nor pickling the file, and
+        the worker decodes it only when its pixels are needed.
+        :return:
+        """
+        image = Image(uri=self.jpeg_uri)
+        image.load_from_uri(lazy=True)
+
+        handle = SharedImage(image)
+
+        try:
+            pickled_handle = pickle.dumps(handle)
+
+            self.assertFalse(image.is_decoded())
+            self.assertNotIn(image.source_content, pickled_handle)
+
+            worker_handle = pickle.loads(pickled_handle)
+            attached_image = worker_handle.attach()
+
+            self.assertFalse(attached_image.is_decoded())
+            self.assertEqual(attached_image.get_size(), image.get_size())
+            self.assertEqual(attached_image.get_jpeg(), image.source_content)
+            self.assertEqual(attached_image.md5hash(), image.md5hash())
+
+            del attached_image
+            worker_handle.detach()
+
+        finally:
+            handle.release()
+
+
+if __name__ == '__main__':
+    unittest.main()
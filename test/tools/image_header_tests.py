@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+import unittest
+
+import cv2
+import numpy
+
+from main.tools.image_header import read_image_header, HEADER_FORMAT_JPEG, HEADER_FORMAT_PNG
+
+__author__ = "Ivan de Paz Centeno"
+
+
+class ImageHeaderTests(unittest.TestCase):
+    """
+    Test class for read_image_header
+    """
+
+    def setUp(self):
+        self.blob = numpy.zeros((10, 20, 3), dtype=numpy.uint8)
+
+    def test_read_size(self):
+        """
+        Tests if the format and the size of JPEG and PNG images are read from their headers.
+        :return:
+        """
+        jpeg_header = read_image_header(cv2.imencode(".jpg", self.blob)[1].tobytes())
+        png_header = read_image_header(cv2.imencode(".png", self.blob)[1].tobytes())
+
+        self.assertEqual(jpeg_header.image_format, HEADER_FORMAT_JPEG)
+        self.assertEqual(jpeg_header.size, (20, 10))
+        self.assertFalse(jpeg_header.is_oriented())
+        self.assertEqual(png_header.image_format, HEADER_FORMAT_PNG)
+        self.assertEqual(png_header.size, (20, 10))
+
+    def test_read_exif_orientation(self):
+        """
+        Tests if the EXIF orientation of a JPEG is read, and the decoded size is transposed when it is rotated 90
+        degrees, like OpenCV does.
+        :return:
+        """
+        jpeg_content = cv2.imencode(".jpg", self.blob)[1].tobytes()
+        tiff_content = b"MM\x00\x2a" + struct.pack(">IH", 8, 1) + struct.pack(">HHIHH", 0x0112, 3, 1, 6, 0) + \
+            b"\x00" * 4
+        exif_segment = b"\xff\xe1" + struct.pack(">H", 8 + len(tiff_content)) + b"Exif\x00\x00" + tiff_content
+        oriented_content = jpeg_content[:2] + exif_segment + jpeg_content[2:]
+
+        header = read_image_header(oriented_content)
+        decoded_blob = cv2.imdecode(numpy.frombuffer(oriented_content, dtype=numpy.uint8), cv2.IMREAD_COLOR)
+
+        self.assertEqual(header.orientation, 6)
+        self.assertTrue(header.is_oriented())
+        self.assertEqual(header.get_decoded_size(), decoded_blob.shape[1::-1])
+
+    def test_read_unknown_content(self):
+        """
+        Tests if contents that are not JPEG or PNG images have no header.
+        :return:
+        """
+        self.assertIsNone(read_image_header(b""))
+        self.assertIsNone(read_image_header(b"GIF89a"))
+        self.assertIsNone(read_image_header(b"\xff\xd8\xff\xe0"))
+
+
+if __name__ == '__main__':
+    unittest.main()